@@ -0,0 +1,80 @@
+"""add binary name search index
+
+A trigram index for substring and fuzzy searches on binary names. On
+PostgreSQL it needs the pg_trgm extension (from postgresql-contrib), and
+creating it requires superuser privileges. It is skipped with a warning if
+the extension is not available, searches still work without it. SQLite gets
+an FTS5 table with the trigram tokenizer.
+
+Revision ID: 2b7d5e8f4a13
+Revises: f1a4c9e3b862
+Create Date: 2026-10-18 16:48:12.633057
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2b7d5e8f4a13'
+down_revision = 'f1a4c9e3b862'
+branch_labels = None
+depends_on = None
+
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+logger = logging.getLogger('alembic')
+
+
+def upgrade():
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        available = connection.execute(sa.text(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )).scalar()
+        if not available:
+            logger.warning('pg_trgm is not available, skipping the name index')
+            return
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX ix_binaries_name_trgm ON binaries "
+            "USING gin (name gin_trgm_ops)"
+        )
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE binaries_name_fts USING fts5("
+            "name, content='binaries', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER binaries_name_fts_insert "
+            "AFTER INSERT ON binaries BEGIN "
+            "INSERT INTO binaries_name_fts(rowid, name) VALUES (new.id, new.name); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER binaries_name_fts_delete "
+            "AFTER DELETE ON binaries BEGIN "
+            "INSERT INTO binaries_name_fts(binaries_name_fts, rowid, name) "
+            "VALUES ('delete', old.id, old.name); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER binaries_name_fts_update "
+            "AFTER UPDATE OF name ON binaries BEGIN "
+            "INSERT INTO binaries_name_fts(binaries_name_fts, rowid, name) "
+            "VALUES ('delete', old.id, old.name); "
+            "INSERT INTO binaries_name_fts(rowid, name) VALUES (new.id, new.name); "
+            "END"
+        )
+        op.execute("INSERT INTO binaries_name_fts(binaries_name_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_binaries_name_trgm")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS binaries_name_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS binaries_name_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS binaries_name_fts_insert")
+        op.execute("DROP TABLE IF EXISTS binaries_name_fts")
@@ -0,0 +1,24 @@
+"""add binary fingerprint
+
+Revision ID: 3a5e2c7f1b90
+Revises:
+Create Date: 2026-10-18 10:12:41.316524
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a5e2c7f1b90'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('binaries', sa.Column('fingerprint', sa.String(length=256), nullable=True))
+
+
+def downgrade():
+    op.drop_column('binaries', 'fingerprint')
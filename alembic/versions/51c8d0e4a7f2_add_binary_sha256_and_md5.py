@@ -0,0 +1,26 @@
+"""add binary sha256 and md5
+
+Revision ID: 51c8d0e4a7f2
+Revises: 3a5e2c7f1b90
+Create Date: 2026-10-18 11:03:27.894211
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '51c8d0e4a7f2'
+down_revision = '3a5e2c7f1b90'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('binaries', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('binaries', sa.Column('md5', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('binaries', 'md5')
+    op.drop_column('binaries', 'sha256')
@@ -0,0 +1,57 @@
+"""add binary package names and version keys
+
+Existing binaries get their package name and version key from their names,
+binaries that do not follow the Debian or RPM naming conventions are left
+without them.
+
+Revision ID: 7c3e9a1f5d20
+Revises: 2b7d5e8f4a13
+Create Date: 2026-10-18 17:32:05.418276
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a1f5d20'
+down_revision = '2b7d5e8f4a13'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from chacra import versions
+
+
+def upgrade():
+    op.add_column('binaries', sa.Column('package_name', sa.String(length=256), nullable=True))
+    op.add_column('binaries', sa.Column('version_key', sa.String(length=512), nullable=True))
+
+    binaries = sa.table(
+        'binaries',
+        sa.column('id', sa.Integer),
+        sa.column('name', sa.String),
+        sa.column('package_name', sa.String),
+        sa.column('version_key', sa.String),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([binaries.c.id, binaries.c.name])).fetchall()
+    for binary_id, name in rows:
+        package_name, version_key = versions.package_version(name)
+        if package_name is None:
+            continue
+        connection.execute(
+            binaries.update().where(binaries.c.id == binary_id).values(
+                package_name=package_name, version_key=version_key
+            )
+        )
+
+    op.create_index(
+        'ix_binaries_latest', 'binaries',
+        ['project_id', 'ref', 'distro', 'distro_version', 'arch',
+         'package_name', 'version_key']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_binaries_latest', table_name='binaries')
+    op.drop_column('binaries', 'version_key')
+    op.drop_column('binaries', 'package_name')
@@ -0,0 +1,24 @@
+"""add repo building_since
+
+Revision ID: 9d1f3b6c2a4e
+Revises: 51c8d0e4a7f2
+Create Date: 2026-10-18 13:41:52.318804
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9d1f3b6c2a4e'
+down_revision = '51c8d0e4a7f2'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('repos', sa.Column('building_since', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('repos', 'building_since')
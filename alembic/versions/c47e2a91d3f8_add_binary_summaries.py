@@ -0,0 +1,51 @@
+"""add binary summaries
+
+Revision ID: c47e2a91d3f8
+Revises: 9d1f3b6c2a4e
+Create Date: 2026-10-18 14:22:09.517342
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c47e2a91d3f8'
+down_revision = '9d1f3b6c2a4e'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'binary_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('ref', sa.String(length=256), nullable=True),
+        sa.Column('distro', sa.String(length=256), nullable=False),
+        sa.Column('distro_version', sa.String(length=256), nullable=False),
+        sa.Column('arch', sa.String(length=256), nullable=False),
+        sa.Column('binary_count', sa.Integer(), nullable=False),
+        sa.Column('total_size', sa.BigInteger(), nullable=False),
+        sa.Column('last_modified', sa.DateTime(), nullable=True),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'project_id', 'ref', 'distro', 'distro_version', 'arch',
+            name='uq_binary_summaries_tree'
+        ),
+    )
+    # summarize the binaries that already exist
+    op.execute(
+        "INSERT INTO binary_summaries "
+        "(project_id, ref, distro, distro_version, arch, "
+        "binary_count, total_size, last_modified) "
+        "SELECT project_id, ref, distro, distro_version, arch, "
+        "count(id), coalesce(sum(size), 0), max(modified) "
+        "FROM binaries WHERE project_id IS NOT NULL "
+        "GROUP BY project_id, ref, distro, distro_version, arch"
+    )
+
+
+def downgrade():
+    op.drop_table('binary_summaries')
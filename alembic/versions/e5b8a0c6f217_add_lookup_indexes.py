@@ -0,0 +1,112 @@
+"""add lookup indexes for binaries and repos
+
+The unique indexes enforce that a binary name exists only once per project,
+ref, distro, version and arch, and that there is a single repo per project,
+ref, distro and version.
+
+Duplicated repos are merged into the oldest one, which is flagged to be
+rebuilt. Duplicated binaries cannot be merged automatically (they may point
+to different files), so the upgrade stops listing them if there are any.
+
+Revision ID: e5b8a0c6f217
+Revises: c47e2a91d3f8
+Create Date: 2026-10-18 14:58:44.106731
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8a0c6f217'
+down_revision = 'c47e2a91d3f8'
+branch_labels = None
+depends_on = None
+
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+logger = logging.getLogger('alembic')
+
+binary_keys = ['project_id', 'ref', 'distro', 'distro_version', 'arch', 'name']
+
+repo_keys = ['project_id', 'ref', 'distro', 'distro_version']
+
+
+def merge_duplicated_repos(connection):
+    rows = connection.execute(sa.text(
+        "SELECT id, %s FROM repos ORDER BY id" % ', '.join(repo_keys)
+    )).fetchall()
+    repos = {}
+    for row in rows:
+        repos.setdefault(tuple(row[1:]), []).append(row[0])
+    for key, ids in sorted(repos.items()):
+        if len(ids) == 1:
+            continue
+        kept, duplicates = ids[0], ids[1:]
+        logger.warning(
+            'merging repos %s into repo %s for %s',
+            ', '.join(str(i) for i in duplicates), kept, key
+        )
+        params = dict(kept=kept, duplicates=tuple(duplicates))
+        connection.execute(sa.text(
+            "UPDATE binaries SET repo_id = :kept WHERE repo_id IN :duplicates"
+        ).bindparams(sa.bindparam('duplicates', expanding=True)), **params)
+        connection.execute(sa.text(
+            "DELETE FROM repos WHERE id IN :duplicates"
+        ).bindparams(sa.bindparam('duplicates', expanding=True)), **params)
+        connection.execute(sa.text(
+            "UPDATE repos SET needs_update = :flag WHERE id = :kept"
+        ), kept=kept, flag=True)
+
+
+def check_duplicated_binaries(connection):
+    columns = ', '.join(binary_keys)
+    duplicates = connection.execute(sa.text(
+        "SELECT %s, COUNT(*) FROM binaries GROUP BY %s HAVING COUNT(*) > 1 "
+        "ORDER BY %s" % (columns, columns, columns)
+    )).fetchall()
+    if duplicates:
+        raise RuntimeError(
+            'binaries must be unique by (%s), remove the duplicates before '
+            'upgrading:\n%s' % (
+                ', '.join(binary_keys),
+                '\n'.join(
+                    '  %s (%d rows)' % (tuple(row[:-1]), row[-1])
+                    for row in duplicates
+                )
+            )
+        )
+
+
+def upgrade():
+    connection = op.get_bind()
+    check_duplicated_binaries(connection)
+    merge_duplicated_repos(connection)
+    op.create_index(
+        'ix_binaries_tree_name', 'binaries',
+        binary_keys,
+        unique=True
+    )
+    op.create_index(
+        'ix_repos_tree', 'repos',
+        repo_keys,
+        unique=True
+    )
+    # a partial index only pays off where it can leave out the repos that
+    # do not need an update, anywhere else it would duplicate the primary key
+    if connection.dialect.name == 'postgresql':
+        op.create_index(
+            'ix_repos_needs_update', 'repos', ['id'],
+            postgresql_where=sa.text('needs_update')
+        )
+    op.create_index(
+        'ix_repos_building_since', 'repos', ['building_since'],
+        postgresql_where=sa.text('building_since IS NOT NULL')
+    )
+
+
+def downgrade():
+    op.drop_index('ix_repos_building_since', table_name='repos')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_repos_needs_update', table_name='repos')
+    op.drop_index('ix_repos_tree', table_name='repos')
+    op.drop_index('ix_binaries_tree_name', table_name='binaries')
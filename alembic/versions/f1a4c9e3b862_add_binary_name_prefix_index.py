@@ -0,0 +1,34 @@
+"""add binary name prefix index
+
+PostgreSQL can only use an index for prefix searches (LIKE 'ceph-%') on
+a non-C locale if it is built with varchar_pattern_ops. Other databases do
+not need it.
+
+Revision ID: f1a4c9e3b862
+Revises: e5b8a0c6f217
+Create Date: 2026-10-18 16:05:31.872210
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f1a4c9e3b862'
+down_revision = 'e5b8a0c6f217'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_index(
+        'ix_binaries_name_pattern', 'binaries', ['name'],
+        postgresql_ops={'name': 'varchar_pattern_ops'}
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_binaries_name_pattern', table_name='binaries')
@@ -1,10 +1,17 @@
 import pecan
 from celery import Celery
 import celery
-from datetime import timedelta
+from datetime import datetime, timedelta
+from sqlalchemy import or_
 from chacra import models
+from chacra.models.repos import acquire_build_lease, release_build_lease
 from chacra import util
+from chacra import rebuilds
+# writes the /repos/ listings for the web server when repos are built
+from chacra import snapshots  # noqa
 import os
+import time
+import functools
 import logging
 import subprocess
 logger = logging.getLogger(__name__)
@@ -24,7 +31,10 @@ pecan.configuration.set_config(get_pecan_config(), overwrite=True)
 # to configure Celery for multiple tasks running in a single service.
 # TODO: Investigate if this could be `chacra.async.rpm` and
 # `chacra.async.debian` or if it doesn't matter
-app = Celery('chacra.async', broker='amqp://guest@localhost//')
+app = Celery(
+    'chacra.async',
+    broker=getattr(pecan.conf, 'broker_url', 'amqp://guest@localhost//')
+)
 
 models.init_model()
 
@@ -44,39 +54,68 @@ class SQLATask(celery.Task):
         models.clear()
 
 
-@app.task(base=SQLATask)
+def with_build_lease(build):
+    """
+    Only one worker at a time can build a given repo. The decorated task only
+    runs if it can take the build lease of the repo, which also means the repo
+    still exists and needs an update, so duplicate requests are dropped
+    cheaply. Anything that flags the repo while it builds gets exactly one
+    follow-up build once the lease is released, and failed builds are retried
+    with a backoff.
+    """
+    @functools.wraps(build)
+    def wrapper(repo_id):
+        timeout = getattr(pecan.conf, 'build_lease_timeout', 3600)
+        if not acquire_build_lease(repo_id, timeout=timeout):
+            logger.info(
+                'repo %s is up to date or already being built, skipping',
+                repo_id
+            )
+            return
+        repo = models.Repo.get(repo_id)
+        repo_type = repo.type
+        try:
+            build(repo)
+        except Exception:
+            models.rollback()
+            release_build_lease(repo_id, failed=True)
+            rebuilds.retry(repo_id, repo_type)
+            raise
+        rebuilds.succeeded(repo_id)
+        if release_build_lease(repo_id):
+            logger.info('repo %s changed while building, rebuilding', repo_id)
+            rebuilds.publish(repo_id, repo_type, force=True)
+    return wrapper
+
+
+@app.task(base=SQLATask, name='async.poll_repos')
 def poll_repos():
     """
-    Poll the repository objects that need to be updated and call the tasks
-    that can create (or update) repositories with that information
-
+    Rebuilds are published when repos get flagged, this is only a safety net
+    for requests that could not be published (e.g. the broker was down) so
+    that no repository is left behind, including the ones whose build lease
+    expired because the worker building them went away.
     """
     logger.info('polling repos....')
-    for r in models.Repo.query.filter_by(needs_update=True).all():
-        if r.needs_update:
-            logger.info("repo %s needs to be updated/created", r)
-            if r.type == 'rpm':
-                create_rpm_repo.apply_async(
-                    (r.id,),
-                    countdown=pecan.conf.quiet_time)
-            elif r.type == 'deb':
-                create_deb_repo.apply_async(
-                    (r.id,),
-                    countdown=pecan.conf.quiet_time)
-            else:
-                logger.warning('got a repository with an unkown type: %s', r)
+    timeout = getattr(pecan.conf, 'build_lease_timeout', 3600)
+    expired = datetime.utcnow() - timedelta(seconds=timeout)
+    repos = models.Repo.query.filter(or_(
+        models.Repo.needs_update == True,  # noqa
+        models.Repo.building_since < expired,
+    ))
+    for r in repos.all():
+        logger.info("repo %s needs to be updated/created", r)
+        rebuilds.publish(r.id, r.type)
 
     logger.info('completed repo polling')
 
 
-@app.task(base=SQLATask)
-def create_deb_repo(repo_id):
+@app.task(base=SQLATask, name='async.create_deb_repo')
+@with_build_lease
+def create_deb_repo(repo):
     """
     Go create or update repositories with specific IDs.
     """
-    # get the root path for storing repos
-    # TODO: Is it possible we can get an ID that doesn't exist anymore?
-    repo = models.Repo.get(repo_id)
     logger.info("processing repository: %s", repo)
 
     # Determine paths for this repository
@@ -122,42 +161,81 @@ def create_deb_repo(repo_id):
     util.makedirs(paths['absolute'])
 
     all_binaries = extra_binaries + [b for b in repo.binaries]
-
-    for binary in all_binaries:
-        # XXX This is really not a good alternative but we are not going to be
-        # using .changes for now although we can store it.
-        if binary.extension == 'changes':
-            continue
+    # XXX This is really not a good alternative but we are not going to be
+    # using .changes for now although we can store it.
+    all_binaries = [
+        b for b in all_binaries
+        if b.extension in util.reprepro_include_flags and b.extension != 'changes'
+    ]
+
+    # Only what changed since the last build needs to go through reprepro.
+    # The record is ignored if the reprepro database is gone (e.g. the repo
+    # was recreated) because then nothing is really included.
+    included_path = os.path.join(paths['cache'], 'included.json')
+    if os.path.isdir(os.path.join(paths['absolute'], 'db')):
+        included = util.load_included(included_path)
+    else:
+        included = {}
+    removals, to_include = util.diff_included(included, all_binaries)
+    logger.info(
+        '%d binaries in repository, %d to include, %d packages to remove',
+        len(all_binaries), len(to_include), len(removals)
+    )
+
+    failed_removals = set()
+    for command, command_removals in util.reprepro_remove_commands(paths['absolute'], removals):
+        logger.info('running command: %s', ' '.join(command))
         try:
-            command = util.reprepro_command(paths['absolute'], binary)
-        except KeyError:  # probably a tar.gz or similar file that should not be added directly
-            continue
+            subprocess.check_call(command)
+        except subprocess.CalledProcessError:
+            logger.exception('failed to remove packages')
+            failed_removals.update(command_removals)
+
+    # forget about everything that was removed (or changed) and then record
+    # every binary that gets included successfully
+    included = util.remaining_included(
+        included, all_binaries, to_include, failed_removals
+    )
+
+    # .debs are included in bulk, a single reprepro call per distro version,
+    # since every call has to open and lock the reprepro database
+    for command, binaries in util.reprepro_commands(paths['absolute'], to_include):
+        logger.info('running command: %s', ' '.join(command))
         try:
-            logger.info('running command: %s', ' '.join(command))
-        except TypeError:
-            logger.exception('was not able to add binary: %s', binary)
-            continue
+            subprocess.check_call(command)
+        except subprocess.CalledProcessError:
+            if len(binaries) == 1:
+                logger.exception('failed to add binary %s', binaries[0].name)
+                continue
+            # include them one by one so that a single bad binary does not
+            # keep the rest of the batch out of the repository
+            logger.exception('failed to add %d binaries, retrying individually', len(binaries))
+            for binary in binaries:
+                try:
+                    subprocess.check_call(util.reprepro_command(paths['absolute'], binary))
+                except subprocess.CalledProcessError:
+                    logger.exception('failed to add binary %s', binary.name)
+                else:
+                    included[util.included_key(binary)] = util.included_record(binary)
         else:
-            try:
-                subprocess.check_call(command)
-            except subprocess.CalledProcessError:
-                logger.exception('failed to add binary %s', binary.name)
+            for binary in binaries:
+                included[util.included_key(binary)] = util.included_record(binary)
+
+    util.save_included(included_path, included)
 
-    # Finally, set the repo path in the object and mark needs_update as False
+    # Finally, set the repo path in the object. needs_update was already
+    # cleared when the build lease was taken
     repo.path = paths['absolute']
-    repo.needs_update = False
     models.commit()
 
 
-@app.task(base=SQLATask)
-def create_rpm_repo(repo_id):
+@app.task(base=SQLATask, name='async.create_rpm_repo')
+@with_build_lease
+def create_rpm_repo(repo):
     """
     Go create or update repositories with specific IDs.
     """
     directories = ['SRPMS', 'noarch', 'x86_64']
-    # get the root path for storing repos
-    # TODO: Is it possible we can get an ID that doesn't exist anymore?
-    repo = models.Repo.get(repo_id)
     logger.info("processing repository: %s", repo)
 
     # Determine paths for this repository
@@ -183,32 +261,54 @@ def create_rpm_repo(repo_id):
             )
 
     all_binaries = extra_binaries + [b for b in repo.binaries]
+    sources = dict((d, {}) for d in directories)
     for binary in all_binaries:
-        source = binary.path
+        if not binary.path:
+            logger.warning('%s has no path, will not be added', binary)
+            continue
         arch_directory = util.infer_arch_directory(binary.name)
-        destination_dir = os.path.join(paths['absolute'], arch_directory)
-        destination = os.path.join(destination_dir, binary.name)
-        try:
-            if not os.path.exists(destination):
-                os.symlink(source, destination)
-        except OSError:
-            logger.exception('could not symlink')
-
-    for d in repo_dirs:
-        subprocess.check_call(['createrepo', d])
-
-    # Finally, set the repo path in the object and mark needs_update as False
+        sources[arch_directory][binary.name] = binary.path
+
+    commands = []
+    for directory, d in zip(directories, repo_dirs):
+        changed = util.link_rpms(d, sources[directory])
+        # only the directories that had binaries added, removed, or modified
+        # need their metadata updated
+        if not changed and not util.repodata_is_stale(d, sources[directory]):
+            logger.info('%s has not changed, skipping createrepo', d)
+            continue
+        cache_dir = os.path.join(paths['cache'], directory)
+        util.makedirs(cache_dir)
+        commands.append(util.createrepo_command(d, cache_dir))
+
+    # every arch directory is an independent repository, so their metadata
+    # can be generated at the same time
+    workers = getattr(pecan.conf, 'createrepo_workers', len(directories))
+    start = time.time()
+    results = util.run_commands(commands, workers=workers)
+    failed = [(command, status) for command, status, _ in results if status != 0]
+    logger.info(
+        'createrepo ran for %d directories in %.2f seconds, %d failed',
+        len(results), time.time() - start, len(failed)
+    )
+    if failed:
+        command, status = failed[0]
+        raise subprocess.CalledProcessError(status, command)
+
+    # Finally, set the repo path in the object. needs_update was already
+    # cleared when the build lease was taken
     repo.path = paths['absolute']
-    repo.needs_update = False
     models.commit()
 
 
-app.conf.update(
-    CELERYBEAT_SCHEDULE={
-        'poll-repos': {
-            'task': 'async.poll_repos',
-            'schedule': timedelta(
-                seconds=pecan.conf.polling_cycle),
+# polling is optional now that rebuilds are published as repos get flagged
+if getattr(pecan.conf, 'polling_cycle', None):
+    app.conf.update(
+        CELERYBEAT_SCHEDULE={
+            'poll-repos': {
+                'task': 'async.poll_repos',
+                'schedule': timedelta(
+                    seconds=pecan.conf.polling_cycle),
+            },
         },
-    },
-)
+    )
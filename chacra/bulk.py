@@ -0,0 +1,265 @@
+"""
+Register many binaries of a project at once, for files that already exist on
+disk (e.g. when backfilling old releases).
+
+Creating binaries one by one means a repo lookup, a synchronous checksum and
+a flush of every binary, along with the listeners that run for each one.
+Here repos are resolved once per (ref, distro, distro_version), files are
+hashed concurrently, and binaries are written with bulk inserts and updates
+in the current transaction. Bulk operations skip the model listeners, so
+what they would have done is done here for the whole batch instead:
+timestamps, checksums and fingerprints, package versions, the binary
+summaries, flagging repos (and requesting their rebuilds) and dropping
+cached responses.
+"""
+import os
+import datetime
+import logging
+from chacra import cache, checksums, models, rebuilds, versions
+from chacra.models.binaries import file_fingerprint
+from chacra.models.summaries import refresh_summary, tree_keys
+
+logger = logging.getLogger(__name__)
+
+required_keys = ('name', 'ref', 'distro', 'distro_version', 'arch')
+
+# checksums are always computed from the files, never taken from clients
+optional_keys = ('path', 'built_by', 'size')
+
+# how many names to look up at once when finding existing binaries
+lookup_size = 500
+
+extension_map = {
+    'rpm': 'rpm',
+    'deb': 'deb',
+    'dsc': 'deb',
+    'changes': 'deb'
+}
+
+
+def validate_size(position, size):
+    """
+    Sizes are integers, or strings of digits which are converted to them
+    """
+    if isinstance(size, basestring) and size.isdigit():
+        return int(size)
+    if isinstance(size, (int, long)) and not isinstance(size, bool) and size >= 0:
+        return size
+    raise ValueError('binary %d has an invalid size: %r' % (position, size))
+
+
+def validate(descriptors):
+    """
+    Make sure every descriptor is a dictionary with all the ``required_keys``
+    and a ``path``, nothing besides ``optional_keys``, and that every value is a string
+    (except for ``size``, an integer). Raises ``ValueError`` otherwise.
+    When the same binary appears more than once the last one is used.
+    """
+    if not isinstance(descriptors, list):
+        raise ValueError('expected a list of binaries')
+    unique = {}
+    for position, descriptor in enumerate(descriptors):
+        if not isinstance(descriptor, dict):
+            raise ValueError('binary %d is not an object' % position)
+        # binaries without a file could never be published
+        missing = [k for k in required_keys + ('path',) if not descriptor.get(k)]
+        if missing:
+            raise ValueError(
+                'binary %d is missing required keys: %s' % (position, ', '.join(missing))
+            )
+        unknown = set(descriptor) - set(required_keys + optional_keys)
+        if unknown:
+            raise ValueError(
+                'binary %d has invalid keys: %s' % (position, ', '.join(sorted(unknown)))
+            )
+        descriptor = dict(descriptor)
+        if 'size' in descriptor:
+            descriptor['size'] = validate_size(position, descriptor['size'])
+        # anything else goes to string columns, and PostgreSQL will not
+        # compare those to numbers
+        invalid = [
+            k for k, v in descriptor.items()
+            if k != 'size' and not isinstance(v, basestring)
+        ]
+        if invalid:
+            raise ValueError(
+                'binary %d has non-string values for: %s' % (position, ', '.join(sorted(invalid)))
+            )
+        unique[binary_key(descriptor)] = descriptor
+    return unique
+
+
+def binary_key(binary):
+    if isinstance(binary, dict):
+        return tuple(binary[k] for k in required_keys)
+    return tuple(getattr(binary, k) for k in required_keys)
+
+
+def get_repos(project, groups):
+    """
+    The repo for every (ref, distro, distro_version) in ``groups``, creating
+    the ones that do not exist yet. ``groups`` maps those to the name of one
+    of their binaries, to tell the type of new repos.
+    """
+    Repo = models.Repo
+    refs = set(ref for ref, _, _ in groups)
+    existing = project.repos.filter(Repo.ref.in_(refs)).all()
+    repos = dict(((r.ref, r.distro, r.distro_version), r) for r in existing)
+    for key, name in groups.items():
+        if key not in repos:
+            repo = Repo(project, *key)
+            repo.type = extension_map.get(name.split('.')[-1], 'deb')
+            repos[key] = repo
+        repos[key].needs_update = True
+    models.flush()
+    return dict((key, repos[key]) for key in groups)
+
+
+def get_binaries(project, names):
+    """
+    Map the key (see ``binary_key``) of every existing binary of ``project``
+    named like any of ``names`` to the binary
+    """
+    names = sorted(set(names))
+    found = {}
+    for start in range(0, len(names), lookup_size):
+        chunk = names[start:start + lookup_size]
+        binaries = models.Binary.query.filter(
+            models.Binary.project_id == project.id,
+            models.Binary.name.in_(chunk),
+        )
+        for binary in binaries:
+            found[binary_key(binary)] = binary
+    return found
+
+
+def file_state(path):
+    """
+    The size and fingerprint of the file at ``path``, or ``(None, None)`` if
+    there is no such file
+    """
+    if not path:
+        return None, None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None, None
+    return size, file_fingerprint(path)
+
+
+def register_binaries(project, descriptors, hash_files=checksums.checksum_files):
+    """
+    Create the binaries in ``descriptors`` (a list of dictionaries with the
+    same keys as binaries) for ``project``, or update the ones that already
+    exist if anything about them or their files changed.
+
+    Files that need checksums are hashed with ``hash_files``, which gets
+    a list of paths and returns a dictionary mapping them to their digests,
+    like ``checksums.checksum_files``.
+
+    Nothing is committed. Returns how many binaries were created, updated and
+    left unchanged. Raises ``ValueError`` for invalid descriptors, or if any
+    of their files does not exist.
+    """
+    descriptors = validate(descriptors)
+    if not descriptors:
+        return dict(created=0, updated=0, unchanged=0)
+    states = dict(
+        (key, file_state(d['path'])) for key, d in descriptors.items()
+    )
+    not_found = sorted(
+        descriptors[key]['path'] for key, (size, _) in states.items() if size is None
+    )
+    if not_found:
+        raise ValueError('could not find %d files: %s' % (
+            len(not_found), ', '.join(not_found[:10])
+        ))
+    session = models.Session()
+    now = datetime.datetime.utcnow()
+    existing = get_binaries(project, [d['name'] for d in descriptors.values()])
+
+    created, updated, unchanged = [], [], 0
+    # what was created or updated, which needs its repo flagged
+    touched = []
+    to_hash = set()
+    for key, descriptor in descriptors.items():
+        values = dict(descriptor)
+        size, fingerprint = states[key]
+        values.setdefault('size', size)
+        values['fingerprint'] = fingerprint
+        binary = existing.get(key)
+        if binary is None:
+            to_hash.add(values['path'])
+            created.append(values)
+            touched.append(descriptor)
+            continue
+
+        changes = dict(
+            (k, v) for k, v in values.items()
+            if k not in required_keys and getattr(binary, k) != v
+        )
+        file_changed = (
+            binary.path != values['path'] or binary.fingerprint != fingerprint
+        )
+        if file_changed or not (binary.checksum and binary.sha256 and binary.md5):
+            to_hash.add(values['path'])
+        if not changes and values['path'] not in to_hash:
+            unchanged += 1
+            continue
+        changes['id'] = binary.id
+        changes['path'] = values['path']
+        updated.append(changes)
+        touched.append(descriptor)
+
+    digests = hash_files(sorted(to_hash)) if to_hash else {}
+    for values in created + updated:
+        found = digests.get(values['path'])
+        if found:
+            values['checksum'] = found.get('sha512')
+            values['sha256'] = found.get('sha256')
+            values['md5'] = found.get('md5')
+
+    groups = dict(
+        ((d['ref'], d['distro'], d['distro_version']), d['name']) for d in touched
+    )
+    repos = get_repos(project, groups)
+
+    for values in created:
+        repo = repos[(values['ref'], values['distro'], values['distro_version'])]
+        package_name, version_key = versions.package_version(values['name'])
+        values.update(
+            project_id=project.id,
+            repo_id=repo.id,
+            created=now,
+            modified=now,
+            package_name=package_name,
+            version_key=version_key,
+        )
+    for values in updated:
+        values['modified'] = now
+
+    if created:
+        session.bulk_insert_mappings(models.Binary, created)
+    if updated:
+        session.bulk_update_mappings(models.Binary, updated)
+        # anything loaded before the update is stale now
+        for binary in existing.values():
+            session.expire(binary)
+
+    # the listeners that bulk operations skipped
+    connection = session.connection()
+    summary_keys = set(
+        tuple(project.id if k == 'project_id' else d[k] for k in tree_keys)
+        for d in touched
+    )
+    for key in sorted(summary_keys):
+        refresh_summary(connection, dict(zip(tree_keys, key)))
+    for repo in repos.values():
+        rebuilds.request(repo, session)
+    cache.request_invalidation(project, project_id=project.id, session=session)
+
+    logger.info(
+        'registered binaries for %s: %d created, %d updated, %d unchanged',
+        project.name, len(created), len(updated), unchanged
+    )
+    return dict(created=len(created), updated=len(updated), unchanged=unchanged)
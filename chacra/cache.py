@@ -0,0 +1,419 @@
+"""
+Rendered JSON for the discovery listings (``/binaries/`` and ``/repos/``) is
+cached so that identical requests do not go to the database until something
+changes.
+
+Where entries are stored depends on ``cache_backend``:
+
+* ``memory``: in every worker, evicting the least recently used entries.
+  Workers do not see each other's changes until entries expire.
+* ``sqlite``: in a SQLite file (``cache_file``) shared by every worker on
+  the host, evicting the oldest entries.
+* the dotted path to any other class implementing the same methods.
+
+Both are bounded by number of entries and by their total size, and entries
+expire after ``cache_ttl`` seconds.
+
+Instead of finding and dropping entries when something changes, every
+project has a version counter, and one more counter covers the listings of
+every project. Counters are part of the keys, and the model listeners bump
+them (once the change is committed) for the projects whose binaries, repos
+or the projects themselves changed. With a shared backend, every worker
+stops using the old entries at the same time, and old entries go away as
+they are evicted or expire.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+from sqlalchemy.orm import object_session
+from pecan import conf
+
+logger = logging.getLogger(__name__)
+
+Entry = namedtuple('Entry', 'expires value size')
+
+# version counter for listings of every project
+all_projects = 'all'
+
+_cache = None
+
+
+class MemoryBackend(object):
+    """
+    A LRU cache in the memory of the current process
+    """
+
+    def __init__(self, ttl=60, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def get(self, key):
+        """
+        Return the value stored for ``key``, or None if there is nothing (or
+        it expired)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.time():
+                self._remove(key)
+                return None
+            # mark it as the most recently used
+            self._entries[key] = self._entries.pop(key)
+            return entry.value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = Entry(time.time() + self.ttl, value, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def versions(self, names):
+        return [self._versions.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._size = 0
+
+    def stats(self):
+        return dict(
+            backend='memory',
+            entries=len(self._entries),
+            bytes=self._size,
+            evictions=self.evictions,
+        )
+
+
+class SQLiteBackend(object):
+    """
+    A cache in a SQLite file, shared by every process that uses the same
+    ``path``. Values must be JSON serializable.
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+        "size INTEGER NOT NULL, expires REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)",
+        "CREATE TABLE IF NOT EXISTS versions ("
+        "name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    ]
+
+    def __init__(self, path, ttl=60, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @property
+    def connection(self):
+        # connections cannot be shared with processes forked after they were
+        # opened, like gunicorn workers
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                connection.execute(statement)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT value, expires FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self.connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+                connection.execute(
+                    'INSERT OR REPLACE INTO entries (key, value, size, expires) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(value), size, now + self.ttl)
+                )
+                self._evict(connection)
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+    def _evict(self, connection):
+        count, total = connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        oldest = connection.execute(
+            'SELECT key, size FROM entries ORDER BY expires'
+        ).fetchall()
+        evicted = []
+        for key, size in oldest:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+        connection.executemany('DELETE FROM entries WHERE key = ?', evicted)
+        self.evictions += len(evicted)
+
+    def versions(self, names):
+        names = [str(name) for name in names]
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT name, version FROM versions WHERE name IN (%s)' %
+                ', '.join('?' for name in names), names
+            ).fetchall()
+        versions = dict(rows)
+        return [versions.get(name, 0) for name in names]
+
+    def bump(self, names):
+        names = [(str(name),) for name in names]
+        with self._lock:
+            connection = self.connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    'INSERT OR IGNORE INTO versions (name, version) VALUES (?, 0)',
+                    names
+                )
+                connection.executemany(
+                    'UPDATE versions SET version = version + 1 WHERE name = ?',
+                    names
+                )
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.execute('DELETE FROM versions')
+
+    def stats(self):
+        with self._lock:
+            count, total = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+            ).fetchone()
+        return dict(
+            backend='sqlite',
+            entries=count,
+            bytes=total,
+            evictions=self.evictions,
+        )
+
+
+backends = {
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+class ResponseCache(object):
+    """
+    Response bodies (and the headers that go with them) stored in
+    ``backend``, along with counters of how this process used them. Backend
+    errors are logged and treated as misses, the cache is never required to
+    answer a request.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def key(self, key, project_id=None):
+        """
+        The key to store the response for ``key`` at, which changes with the
+        version of the project it belongs to (or with the version of every
+        project for listings that are not specific to one)
+        """
+        name = all_projects if project_id is None else project_id
+        try:
+            version, = self.backend.versions([name])
+        except Exception:
+            logger.exception('could not read the version of %s', name)
+            self.errors += 1
+            return None
+        return '%s@%s:%s' % (key, name, version)
+
+    def get(self, key):
+        """
+        Return the ``(body, headers)`` stored at ``key`` (as returned by
+        ``ResponseCache.key``), or None
+        """
+        if key is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            logger.exception('could not read %s from the cache', key)
+            self.errors += 1
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        body, headers = value
+        # values that went through JSON come back as unicode, but bodies and
+        # headers are bytes
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        return body, [(str(k), str(v)) for k, v in headers]
+
+    def set(self, key, body, headers=None):
+        if key is None:
+            return
+        try:
+            self.backend.set(key, [body, headers or []], len(body))
+        except Exception:
+            logger.exception('could not write %s to the cache', key)
+            self.errors += 1
+
+    def invalidate(self, project_ids):
+        """
+        Move on to new versions of the given projects, along with the
+        listings of every project which include them
+        """
+        names = set(project_id for project_id in project_ids if project_id is not None)
+        names.add(all_projects)
+        try:
+            self.backend.bump(sorted(names))
+        except Exception:
+            logger.exception('could not invalidate projects: %s', names)
+            self.errors += 1
+            return
+        self.invalidations += len(names)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        stats = dict(
+            hits=self.hits,
+            misses=self.misses,
+            invalidations=self.invalidations,
+            errors=self.errors,
+            ttl=self.backend.ttl,
+            max_entries=self.backend.max_entries,
+            max_bytes=self.backend.max_bytes,
+        )
+        try:
+            stats.update(self.backend.stats())
+        except Exception:
+            logger.exception('could not read the cache stats')
+        return stats
+
+
+def enabled():
+    """
+    Responses are only cached when ``cache_ttl`` is configured
+    """
+    return bool(getattr(conf, 'cache_ttl', None))
+
+
+def load_backend(name):
+    if name in backends:
+        return backends[name]
+    module_name, _, class_name = name.rpartition('.')
+    module = __import__(module_name, fromlist=[class_name])
+    return getattr(module, class_name)
+
+
+def get_cache():
+    """
+    The cache for this process, created on first use. Returns None if
+    caching is disabled.
+    """
+    global _cache
+    if not enabled():
+        return None
+    if _cache is None:
+        backend_name = getattr(conf, 'cache_backend', None) or 'memory'
+        options = dict(
+            ttl=conf.cache_ttl,
+            max_entries=getattr(conf, 'cache_max_entries', 1000),
+            max_bytes=getattr(conf, 'cache_max_bytes', 64 * 1024 * 1024),
+        )
+        # shared backends need to know where to find the shared storage
+        if backend_name != 'memory' and getattr(conf, 'cache_file', None):
+            options['path'] = conf.cache_file
+        _cache = ResponseCache(load_backend(backend_name)(**options))
+    return _cache
+
+
+def request_invalidation(target, project_id=None, session=None):
+    """
+    Record that the project of ``target`` (a model object) changed. Versions
+    are only bumped once the transaction is committed, so that a request
+    served in between cannot cache data that is about to change again.
+    """
+    session = session or object_session(target)
+    if session is None:
+        return
+    if project_id is None:
+        project_id = getattr(target, 'project_id', None)
+    session.info.setdefault('chacra.cache', set()).add(project_id)
+
+
+def invalidate_pending(session):
+    """
+    Bump the versions of every project changed in the transaction that was
+    just committed
+    """
+    pending = session.info.pop('chacra.cache', None)
+    cache = get_cache()
+    if pending and cache is not None:
+        cache.invalidate(pending)
+
+
+def discard_pending(session):
+    session.info.pop('chacra.cache', None)
@@ -0,0 +1,110 @@
+"""
+Checksum helpers for binaries. Repository metadata for DEB and RPM packages
+may need different digests for the same file, so all of them are computed in
+a single pass over the data, using large reads.
+
+hashlib releases the GIL when hashing large chunks, so with a thread pool
+every algorithm is updated from its own thread, in the background: hashing
+a chunk overlaps with reading (or writing) the next one.
+"""
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+# sha512 is the 'checksum' that chacra has always reported for binaries
+ALGORITHMS = ('sha512', 'sha256', 'md5')
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+_pool = None
+
+
+def get_pool():
+    """
+    A thread pool shared by the process to update several digests at once.
+    It is created on first use so that it does not get created before
+    a server forks its workers.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool(len(ALGORITHMS))
+    return _pool
+
+
+class Checksums(object):
+    """
+    Compute the digests for every algorithm in ``algorithms`` over the same
+    stream of data. If a ``pool`` is given, each digest is updated in its own
+    thread and ``update`` returns right away, so that the caller can get the
+    next chunk while the previous one is hashed.
+    """
+
+    def __init__(self, algorithms=ALGORITHMS, pool=None):
+        self.hashes = [(name, hashlib.new(name)) for name in algorithms]
+        self.pool = pool
+        # the updates for the last chunk, while they run in the pool
+        self._pending = None
+
+    def _wait(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.get()
+
+    def update(self, chunk):
+        if self.pool and len(self.hashes) > 1:
+            # chunks have to go into every digest in order, so the previous
+            # one must be done before this one starts
+            self._wait()
+            self._pending = self.pool.map_async(
+                lambda h: h[1].update(chunk), self.hashes
+            )
+        else:
+            for name, h in self.hashes:
+                h.update(chunk)
+
+    def hexdigests(self):
+        self._wait()
+        return dict((name, h.hexdigest()) for name, h in self.hashes)
+
+
+def file_checksums(path, algorithms=ALGORITHMS, chunk_size=CHUNK_SIZE, pool=None):
+    """
+    Read ``path`` once, in ``chunk_size`` pieces, and return a dictionary with
+    the hex digest for every algorithm requested. The digests are updated
+    from the shared thread pool unless ``pool`` is ``False``.
+    """
+    if pool is None:
+        pool = get_pool()
+    checksums = Checksums(algorithms, pool=pool)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksums.update(chunk)
+    return checksums.hexdigests()
+
+
+def checksum_files(paths, algorithms=ALGORITHMS, workers=4):
+    """
+    Compute the checksums for many files concurrently. Returns a dictionary
+    mapping each path to its digests. Paths that cannot be read map to None
+    so that a single missing file does not abort the whole batch.
+    """
+    def checksum(path):
+        try:
+            # every file is hashed serially by its worker, the parallelism
+            # comes from hashing several files at the same time
+            return path, file_checksums(path, algorithms, pool=False)
+        except (IOError, OSError):
+            logger.exception('could not compute checksums for %s', path)
+            return path, None
+
+    paths = list(paths)
+    if not paths:
+        return {}
+    pool = ThreadPool(max(1, min(workers, len(paths))))
+    try:
+        return dict(pool.map(checksum, paths))
+    finally:
+        pool.close()
+        pool.join()
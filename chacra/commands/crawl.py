@@ -0,0 +1,306 @@
+"""
+Register binaries that already exist on disk, by walking directories once
+and matching every file against a set of rules. A rule maps the files it
+matches to a project, ref, distro, distro version and arch, like::
+
+    {"project": "ceph", "ref": "hammer", "distro": "centos", "version": "7",
+     "arch": "x86_64", "root": "rpm-hammer/el7", "has": "x86_64",
+     "startswith": "ceph", "endswith": ".rpm"}
+
+Every filter is optional:
+
+* ``root``: the file has to be under this directory, relative to
+  a directory being crawled (or absolute).
+* ``has``: the path of the file, relative to a directory being crawled,
+  has to contain this.
+* ``startswith`` and ``endswith``: for the name of the file.
+
+A file is registered once for every rule it matches.
+"""
+import os
+import json
+import logging
+from multiprocessing import Pool
+
+from pecan.commands.base import BaseCommand
+
+from chacra import bulk, checksums, models
+from chacra.commands.populate import out
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover
+    # the backport, for Python 2
+    from scandir import scandir
+
+logger = logging.getLogger(__name__)
+
+rule_keys = ('project', 'ref', 'distro', 'version', 'arch')
+
+filter_keys = ('root', 'has', 'startswith', 'endswith')
+
+
+class Rule(object):
+
+    def __init__(self, project, ref, distro, version, arch,
+                 root=None, has=None, startswith=None, endswith=None):
+        self.project = project
+        self.ref = ref
+        self.distro = distro
+        self.version = version
+        self.arch = arch
+        self.root = root
+        self.has = has
+        self.startswith = startswith
+        self.endswith = endswith
+
+    def __repr__(self):
+        return '<Rule %s/%s/%s/%s/%s>' % (
+            self.project, self.ref, self.distro, self.version, self.arch
+        )
+
+    def matches(self, top, path):
+        """
+        Tell if ``path``, found while crawling ``top``, is one of the files
+        this rule is for
+        """
+        name = os.path.basename(path)
+        if self.root:
+            root = os.path.join(top, self.root).rstrip(os.sep) + os.sep
+            if not path.startswith(root):
+                return False
+        if self.has and self.has not in os.path.relpath(path, top):
+            return False
+        if self.startswith and not name.startswith(self.startswith):
+            return False
+        if self.endswith and not name.endswith(self.endswith):
+            return False
+        return True
+
+    def descriptor(self, path):
+        """
+        The binary for ``path``, as expected by ``bulk.register_binaries``
+        """
+        return dict(
+            name=os.path.basename(path),
+            ref=self.ref,
+            distro=self.distro,
+            distro_version=self.version,
+            arch=self.arch,
+            path=path,
+        )
+
+
+def load_rules(path):
+    """
+    Read the JSON list of rules in ``path``. Raises ``ValueError`` if any of
+    them is invalid.
+    """
+    with open(path) as f:
+        items = json.load(f)
+    if not isinstance(items, list):
+        raise ValueError('expected a list of rules in %s' % path)
+    rules = []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError('rule %d is not an object' % position)
+        missing = [k for k in rule_keys if not item.get(k)]
+        if missing:
+            raise ValueError(
+                'rule %d is missing required keys: %s' % (position, ', '.join(missing))
+            )
+        unknown = set(item) - set(rule_keys + filter_keys)
+        if unknown:
+            raise ValueError(
+                'rule %d has invalid keys: %s' % (position, ', '.join(sorted(unknown)))
+            )
+        rules.append(Rule(**dict((str(k), v) for k, v in item.items())))
+    return rules
+
+
+def walk(top):
+    """
+    Every file under ``top``. Symlinks to directories are not followed.
+    """
+    directories = [top]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = sorted(scandir(directory), key=lambda e: e.name)
+        except OSError:
+            logger.warning('could not read %s', directory)
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                yield entry.path
+        directories.extend(reversed(subdirectories))
+
+
+def crawl_roots(paths):
+    """
+    The absolute version of ``paths``, without the ones that are inside some
+    other path, which would be crawled twice
+    """
+    roots = sorted(set(
+        os.path.abspath(os.path.expanduser(path)) for path in paths
+    ))
+    crawled = []
+    for root in roots:
+        if not any(is_inside(root, c) for c in crawled):
+            crawled.append(root)
+    return crawled
+
+
+def is_inside(path, directory):
+    return path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def find_binaries(paths, rules):
+    """
+    Walk ``paths`` once and return the binaries matching ``rules``, grouped
+    by project name. Paths inside other paths are not walked again, but
+    rules are still matched against every path a file is under, so that
+    a ``root`` or ``has`` relative to any of them works.
+    """
+    tops = sorted(set(
+        os.path.abspath(os.path.expanduser(path)) for path in paths
+    ))
+    found = {}
+    for root in crawl_roots(tops):
+        nested = [t for t in tops if t == root or is_inside(t, root)]
+        for path in walk(root):
+            matched = set()
+            for top in nested:
+                if top != root and not is_inside(path, top):
+                    continue
+                for position, rule in enumerate(rules):
+                    if position not in matched and rule.matches(top, path):
+                        matched.add(position)
+                        found.setdefault(rule.project, []).append(rule.descriptor(path))
+    return found
+
+
+def checksum(path):
+    # a module level function, so that it can be sent to the process pool
+    try:
+        return path, checksums.file_checksums(path, pool=False)
+    except (IOError, OSError):
+        logger.exception('could not compute checksums for %s', path)
+        return path, None
+
+
+def pool_hasher(pool):
+    """
+    A ``hash_files`` for ``bulk.register_binaries`` that hashes files in the
+    processes of ``pool``
+    """
+    def hash_files(paths):
+        return dict(pool.map(checksum, paths, chunksize=1))
+    return hash_files
+
+
+def crawl(paths, rules, hash_files=checksums.checksum_files, batch_size=1000):
+    """
+    Register every binary under ``paths`` that matches any of ``rules``,
+    creating the projects that do not exist yet. Binaries are registered
+    (and committed) ``batch_size`` at a time. Returns how many binaries
+    were created, updated and left unchanged.
+    """
+    totals = dict(created=0, updated=0, unchanged=0)
+    found = find_binaries(paths, rules)
+    for name in sorted(found):
+        project = models.get_or_create(models.Project, name=name)
+        descriptors = found[name]
+        for start in range(0, len(descriptors), batch_size):
+            result = bulk.register_binaries(
+                project, descriptors[start:start + batch_size],
+                hash_files=hash_files,
+            )
+            models.commit()
+            for key in totals:
+                totals[key] += result[key]
+    return totals
+
+
+class CrawlCommand(BaseCommand):
+    """
+    Register binaries found on disk, walking every directory once.
+    """
+
+    arguments = BaseCommand.arguments + (
+        {
+            'name': 'paths',
+            'help': 'directories to crawl',
+            'nargs': '+',
+        },
+        {
+            'name': '--rules',
+            'help': 'a JSON file with a list of rules to match files with',
+        },
+        {
+            'name': '--project',
+            'help': 'project for the files matching the filters below',
+        },
+        {'name': '--ref', 'help': 'ref for the matching files'},
+        {'name': '--distro', 'help': 'distro for the matching files'},
+        {'name': '--version', 'help': 'distro version for the matching files'},
+        {'name': '--arch', 'help': 'arch for the matching files'},
+        {'name': '--has', 'help': 'only paths that contain this'},
+        {'name': '--startswith', 'help': 'only file names that start with this'},
+        {'name': '--endswith', 'help': 'only file names that end with this'},
+        {
+            'name': '--batch-size',
+            'help': 'binaries to register per transaction (default: 1000)',
+            'type': int,
+            'default': 1000,
+        },
+        {
+            'name': '--workers',
+            'help': 'processes to compute checksums with (default: one per CPU)',
+            'type': int,
+            'default': None,
+        },
+    )
+
+    def get_rules(self, args):
+        rules = load_rules(args.rules) if args.rules else []
+        if args.project:
+            options = dict((k, getattr(args, k)) for k in rule_keys + filter_keys[1:])
+            missing = [k for k in rule_keys if not options[k]]
+            if missing:
+                raise ValueError('missing required options: %s' % ', '.join(
+                    '--%s' % k for k in missing))
+            rules.append(Rule(**options))
+        if not rules:
+            raise ValueError('either --rules or --project (and friends) are required')
+        return rules
+
+    def run(self, args):
+        super(CrawlCommand, self).run(args)
+        try:
+            rules = self.get_rules(args)
+        except (IOError, ValueError) as exc:
+            out("ERROR: %s" % exc)
+            raise SystemExit(1)
+        out("LOADING ENVIRONMENT")
+        self.load_app()
+        # fork the workers before any connection to the database is opened
+        pool = Pool(args.workers)
+        try:
+            models.start()
+            out("CRAWLING %s" % ', '.join(args.paths))
+            totals = crawl(
+                args.paths, rules, hash_files=pool_hasher(pool),
+                batch_size=args.batch_size,
+            )
+        except:
+            models.rollback()
+            out("ROLLING BACK... ")
+            raise
+        finally:
+            pool.close()
+            pool.join()
+        out("CREATED: %(created)s UPDATED: %(updated)s UNCHANGED: %(unchanged)s" % totals)
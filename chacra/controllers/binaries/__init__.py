@@ -7,7 +7,7 @@ from webob.static import FileIter
 from chacra.models import Binary, Project
 from chacra.controllers import error
 from chacra.auth import basic_auth
-from chacra.util import repo_paths
+from chacra import util
 
 logger = logging.getLogger(__name__)
 
@@ -123,9 +123,12 @@ class BinaryController(object):
             error('/errors/invalid/', 'no file object found in "file" param in POST request')
         file_obj = contents.file
         # this looks odd, path is not changing, but we need to 'ping' the object by
-        # re-saving the attribute so that the listener can update the checksum and modified
-        # timestamps
-        self.binary.path = self.save_file(file_obj)
+        # re-saving the attribute so that the listener can update the modified
+        # timestamp. The checksums were already computed while saving the file.
+        path, size, checksums = self.save_file(file_obj)
+        self.binary.path = path
+        self.binary.size = size
+        self.binary.set_checksums(checksums)
         return dict()
 
     @secure(basic_auth)
@@ -168,7 +171,7 @@ class BinaryController(object):
     def save_file(self, file_obj):
         # TODO: we should just use self.binary.path for this
         dir_path = self.create_directory()
-        if self.binary_name in os.listdir(dir_path):
+        if os.path.exists(os.path.join(dir_path, self.binary_name)):
             # resource exists so we will update it
             response.status = 200
         else:
@@ -178,10 +181,7 @@ class BinaryController(object):
             response.status = 201
 
         destination = os.path.join(dir_path, self.binary_name)
-        with open(destination, 'wb') as f:
-            try:
-                f.write(file_obj.getvalue())
-            except AttributeError:
-                f.write(file_obj.read())
-        # return the full path to the saved object:
-        return destination
+        size, checksums = util.save_file(file_obj, destination)
+        # return the full path to the saved object, along with the size and
+        # checksums computed while writing it:
+        return destination, size, checksums
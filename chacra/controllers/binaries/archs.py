@@ -4,9 +4,14 @@ import pecan
 from pecan import response
 from pecan.secure import secure
 from pecan import expose, abort, request
+from sqlalchemy import func
 from chacra.models import Binary
 from chacra import models
+from chacra import util
 from chacra.controllers import error
+from chacra.controllers.util import (
+    check_modified, parse_fields, paginate, stream
+)
 from chacra.controllers.binaries import BinaryController
 from chacra.auth import basic_auth
 
@@ -26,26 +31,131 @@ class ArchController(object):
 
     @expose(generic=True, template='json')
     def index(self):
-        if self.arch not in self.project.archs:
-            abort(404)
-
-        binaries = self.project.binaries.filter_by(
+        binaries = Binary.query.filter_by(
+            project=self.project,
             distro=self.distro,
             distro_version=self.distro_version,
             ref=self.ref,
-            arch=self.arch).all()
+            arch=self.arch)
 
-        if not binaries:
+        # streams have no pages to tell an empty arch apart from one that
+        # does not exist, so check that there is at least one binary first
+        stream_format = request.GET.get('stream')
+        if stream_format and not models.Session.query(binaries.exists()).scalar():
+            abort(404)
+
+        fields = request.GET.get('fields')
+        if fields:
+            try:
+                fields = parse_fields(fields, Binary.json_fields)
+            except ValueError as exc:
+                error('/errors/invalid/', str(exc))
+            binaries = self.project_fields(binaries, fields)
+
+        try:
+            if stream_format:
+                return self.stream(binaries, stream_format, fields)
+            check_modified(*self.validators())
+            rows = paginate(binaries, Binary, request.GET)
+        except ValueError as exc:
+            error('/errors/invalid/', str(exc))
+
+        # an empty page past the first one is fine, but an arch with no
+        # binaries at all does not exist
+        if not rows and not request.GET.get('cursor'):
             abort(404)
 
-        resp = {}
-        for b in self.project.binaries.filter_by(
-                distro=self.distro,
-                distro_version=self.distro_version,
-                ref=self.ref,
-                arch=self.arch).all():
-            resp[b.name] = b
-        return resp
+        if fields:
+            return self.fields_response(rows, fields)
+        return dict((b.name, b) for b in rows)
+
+    @expose('json')
+    def latest(self, name=None, n=1):
+        """
+        The newest ``n`` binaries of every package in the arch, by version
+        rather than by upload time. ``?name=`` limits it to a single package.
+        Binaries that do not follow the Debian or RPM naming conventions
+        have no version and are left out.
+        """
+        try:
+            n = int(n)
+        except ValueError:
+            error('/errors/invalid/', 'n must be an integer, not: %s' % n)
+        if n < 1:
+            error('/errors/invalid/', 'n must be greater than 0')
+        check_modified(*self.validators())
+
+        rank = func.row_number().over(
+            partition_by=Binary.package_name,
+            order_by=(Binary.version_key.desc(), Binary.id.desc())
+        ).label('rank')
+        ranked = models.Session.query(Binary.id, rank).filter(
+            Binary.project == self.project,
+            Binary.distro == self.distro,
+            Binary.distro_version == self.distro_version,
+            Binary.ref == self.ref,
+            Binary.arch == self.arch,
+            Binary.package_name.isnot(None),
+        )
+        if name:
+            ranked = ranked.filter(Binary.package_name == name)
+        ranked = ranked.subquery()
+
+        binaries = Binary.query.join(
+            ranked, Binary.id == ranked.c.id
+        ).filter(ranked.c.rank <= n)
+        return dict((b.name, b) for b in binaries)
+
+    def validators(self):
+        return models.BinarySummary.validators(
+            project_id=self.project.id,
+            ref=self.ref,
+            distro=self.distro,
+            distro_version=self.distro_version,
+            arch=self.arch)
+
+    def project_fields(self, binaries, fields):
+        """
+        Only load the columns needed for the requested ``fields`` (plus the
+        ones needed to paginate) instead of whole Binary objects
+        """
+        columns = ['id', 'name', 'modified']
+        columns += [f for f in fields if f != 'last_changed']
+        if 'last_changed' in fields:
+            columns.append('created')
+        columns = sorted(set(columns), key=columns.index)
+        return binaries.with_entities(*[getattr(Binary, c) for c in columns])
+
+    def fields_response(self, rows, fields):
+        """
+        Map binary names to dictionaries with just the requested ``fields``
+        """
+        return dict(
+            (row.name, self.select_fields(row, fields)) for row in rows
+        )
+
+    def select_fields(self, row, fields):
+        values = row._asdict()
+        if 'last_changed' in fields:
+            values['last_changed'] = Binary.format_last_changed(
+                values['created'], values['modified']
+            )
+        return dict((f, values[f]) for f in fields)
+
+    def stream(self, binaries, stream_format, fields=None):
+        """
+        Send every binary in the arch as it is read from the database, in
+        the same shape as the regular (non-paginated) listing
+        """
+        serialize = None
+        if fields:
+            serialize = lambda row: self.select_fields(row, fields)
+        return stream(
+            binaries.order_by(Binary.id),
+            stream_format,
+            key=lambda row: row.name,
+            serialize=serialize,
+        )
 
     def get_binary(self, name):
         return Binary.filter_by(
@@ -69,7 +179,7 @@ class ArchController(object):
                 if request.POST.get('force', False) is False:
                     error('/errors/invalid', "resource already exists")
 
-        full_path = self.save_file(file_obj)
+        full_path, size, checksums = self.save_file(file_obj)
 
         if self.binary is None:
             path = full_path
@@ -81,10 +191,12 @@ class ArchController(object):
             Binary(
                 self.binary_name, self.project, arch=arch,
                 distro=distro, distro_version=distro_version,
-                ref=ref, path=path, size=os.path.getsize(path)
+                ref=ref, path=path, size=size, checksums=checksums
             )
         else:
             self.binary.path = full_path
+            self.binary.size = size
+            self.binary.set_checksums(checksums)
         return dict()
 
     def create_directory(self):
@@ -98,7 +210,7 @@ class ArchController(object):
 
     def save_file(self, file_obj):
         dir_path = self.create_directory()
-        if self.binary_name in os.listdir(dir_path):
+        if os.path.exists(os.path.join(dir_path, self.binary_name)):
             # resource exists so we will update it
             response.status = 200
         else:
@@ -106,13 +218,10 @@ class ArchController(object):
             response.status = 201
 
         destination = os.path.join(dir_path, self.binary_name)
-        with open(destination, 'wb') as f:
-            try:
-                f.write(file_obj.getvalue())
-            except AttributeError:
-                f.write(file_obj.read())
-        # return the full path to the saved object:
-        return destination
+        size, checksums = util.save_file(file_obj, destination)
+        # return the full path to the saved object, along with the size and
+        # checksums computed while writing it:
+        return destination, size, checksums
 
     @expose()
     def _lookup(self, name, *remainder):
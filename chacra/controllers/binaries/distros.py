@@ -1,6 +1,7 @@
 from pecan import expose, abort, request
 from chacra import models
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.controllers.binaries.archs import ArchController
 
 
@@ -14,22 +15,25 @@ class DistroVersionController(object):
         request.context['distro_version'] = self.distro_version
 
     @expose('json', generic=True)
+    @cached
     def index(self):
+        check_modified(*models.BinarySummary.validators(
+            project_id=self.project.id,
+            ref=self.ref,
+            distro=self.distro_name,
+            distro_version=self.distro_version))
         if self.distro_version not in self.project.distro_versions:
             abort(404)
 
         resp = {}
-        for arch in self.project.archs:
-            binaries = [
-                b.name for b in models.Binary.filter_by(
-                    project=self.project,
-                    distro_version=self.distro_version,
-                    distro=self.distro_name,
-                    ref=self.ref,
-                    arch=arch).all()]
-            if binaries:
-                resp[arch] = list(set(binaries))
-        return resp
+        binaries = self.project.binaries.filter_by(
+            distro_version=self.distro_version,
+            distro=self.distro_name,
+            ref=self.ref)
+        query = binaries.with_entities(models.Binary.arch, models.Binary.name)
+        for arch, name in query:
+            resp.setdefault(arch, set()).add(name)
+        return dict((arch, list(names)) for arch, names in resp.items())
 
     @index.when(method='POST', template='json')
     def index_post(self):
@@ -48,19 +52,25 @@ class DistroController(object):
         request.context['distro'] = distro_name
 
     @expose('json', generic=True)
+    @cached
     def index(self):
+        check_modified(*models.BinarySummary.validators(
+            project_id=self.project.id, ref=self.ref, distro=self.distro_name))
         # TODO: Improve this duplication here (and spread to other controllers)
         if self.distro_name not in self.project.distros:
             abort(404)
         if self.ref not in self.project.refs:
             abort(404)
         resp = {}
-
-        for version in self.project.distro_versions:
-            archs = [b.arch for b in models.Binary.filter_by(project=self.project, distro_version=version, distro=self.distro_name, ref=self.ref).all()]
-            if archs:
-                resp[version] = list(set(archs))
-        return resp
+        summaries = self.project.summaries.filter_by(
+            distro=self.distro_name,
+            ref=self.ref)
+        query = summaries.with_entities(
+            models.BinarySummary.distro_version,
+            models.BinarySummary.arch)
+        for version, arch in query:
+            resp.setdefault(version, set()).add(arch)
+        return dict((version, list(archs)) for version, archs in resp.items())
 
     @index.when(method='POST', template='json')
     def index_post(self):
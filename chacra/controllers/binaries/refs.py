@@ -1,6 +1,7 @@
 from pecan import expose, abort, request
 from chacra import models
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.controllers.binaries.distros import DistroController
 
 
@@ -12,27 +13,24 @@ class RefController(object):
         request.context['ref'] = self.ref_name
 
     @expose('json', generic=True)
+    @cached
     def index(self):
+        check_modified(*models.BinarySummary.validators(
+            project_id=self.project.id, ref=self.ref_name))
         if self.ref_name not in self.project.refs:
             abort(404)
         resp = {}
-        binaries = models.Binary.filter_by(
-            project=self.project,
-            ref=self.ref_name).all()
-
-        distros = set([b.distro for b in binaries])
-
-        for distro in distros:
-            resp[distro] = list(
-                set(
-                    [b.distro_version for b in binaries if b.distro == distro ]
-                )
-            )
+        summaries = self.project.summaries.filter_by(ref=self.ref_name)
+        query = summaries.with_entities(
+            models.BinarySummary.distro,
+            models.BinarySummary.distro_version)
+        for distro, distro_version in query:
+            resp.setdefault(distro, set()).add(distro_version)
 
         if not resp:
             abort(404)
 
-        return resp
+        return dict((distro, list(versions)) for distro, versions in resp.items())
 
     @index.when(method='POST', template='json')
     def index_post(self):
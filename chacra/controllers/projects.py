@@ -1,7 +1,11 @@
+import json
 from pecan import expose, abort, request
-from chacra.models import Project
-from chacra import models
+from pecan.secure import secure
+from chacra.models import Project, BinarySummary
+from chacra import models, bulk
+from chacra.auth import basic_auth
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.controllers.binaries.refs import RefController
 
 
@@ -18,11 +22,43 @@ class ProjectController(object):
         request.context['project_id'] = self.project.id
 
     @expose('json')
+    @cached
     def index(self):
         if request.method == 'POST':
             error('/errors/not_allowed', 'POST requests to this url are not allowed')
+        check_modified(*BinarySummary.validators(project_id=self.project.id))
         return self.project
 
+    @secure(basic_auth)
+    @expose('json')
+    def bulk(self):
+        """
+        Register many binaries of the project at once, from a JSON list (or
+        newline delimited JSON) of objects like::
+
+            {"name": "ceph-1.0-0.el7.x86_64.rpm", "ref": "master",
+             "distro": "centos", "distro_version": "7", "arch": "x86_64",
+             "path": "/opt/binaries/ceph/.../ceph-1.0-0.el7.x86_64.rpm"}
+
+        Binaries that already exist are updated if anything changed.
+        """
+        if request.method != 'POST':
+            error('/errors/not_allowed', 'only POST requests are accepted for this url')
+        try:
+            if request.content_type == 'application/x-ndjson':
+                descriptors = [
+                    json.loads(line) for line in request.body.splitlines()
+                    if line.strip()
+                ]
+            else:
+                descriptors = json.loads(request.body)
+        except ValueError:
+            error('/errors/invalid/', 'could not decode JSON body')
+        try:
+            return bulk.register_binaries(self.project, descriptors)
+        except ValueError as exc:
+            error('/errors/invalid/', str(exc))
+
     @expose()
     def _lookup(self, name, *remainder):
         return RefController(name), remainder
@@ -31,7 +67,10 @@ class ProjectController(object):
 class ProjectsController(object):
 
     @expose('json')
+    @cached
     def index(self):
+        # projects without binaries are listed too
+        check_modified(*BinarySummary.validators() + (Project.query.count(),))
         resp = {}
         for project in Project.query.all():
             resp[project.name] = project.refs
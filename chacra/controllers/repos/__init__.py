@@ -7,8 +7,9 @@ from pecan.ext.notario import validate
 
 from chacra.models import Project
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.auth import basic_auth
-from chacra import schemas
+from chacra import schemas, rebuilds
 
 
 logger = logging.getLogger(__name__)
@@ -29,9 +30,12 @@ class RepoController(object):
         ).first()
 
     @expose('json', generic=True)
+    @cached
     def index(self):
         if self.repo is None:
             abort(404)
+        # needs_update can change without touching the modified time
+        check_modified(self.repo.modified, self.repo.needs_update)
         return self.repo
 
     @secure(basic_auth)
@@ -52,8 +56,9 @@ class RepoController(object):
                 '/errors/not_allowed',
                 'only POST request are accepted for this url'
             )
-        # Just mark the repo so that celery picks it up
+        # mark the repo and ask celery to rebuild it once this is committed
         self.repo.needs_update = True
+        rebuilds.request(self.repo)
         return self.repo
 
     @secure(basic_auth)
@@ -70,6 +75,7 @@ class RepoController(object):
         logger.info('removing repository path: %s', self.repo.path)
         shutil.rmtree(self.repo.path)
 
-        # mark the repo so that celery picks it up
+        # mark the repo and ask celery to rebuild it once this is committed
         self.repo.needs_update = True
+        rebuilds.request(self.repo)
         return self.repo
@@ -1,7 +1,9 @@
 from pecan import expose, abort, request
-from chacra.models import Project, Binary
+from chacra.models import Project, Binary, Repo
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.controllers.repos import RepoController
+from chacra import snapshots
 
 
 class DistroController(object):
@@ -12,17 +14,16 @@ class DistroController(object):
         request.context['distro'] = distro_name
 
     @expose('json', generic=True)
+    @cached
     def index(self):
+        check_modified(*Repo.validators(
+            project_id=self.project.id, distro=self.distro_name))
         # TODO: Improve this duplication here (and spread to other controllers)
         if self.distro_name not in self.project.repo_distros:
             abort(404)
         if self.ref not in self.project.repo_refs:
             abort(404)
-        resp = []
-
-        for repo in self.project.built_repos.filter_by(distro=self.distro_name).all():
-            resp.append(repo.distro_version)
-        return resp
+        return snapshots.distro_listing(self.project, self.distro_name)
 
     @index.when(method='POST', template='json')
     def index_post(self):
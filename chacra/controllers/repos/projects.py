@@ -3,7 +3,9 @@ from chacra.models import Project
 from chacra.models.repos import Repo
 from chacra import models
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.controllers.repos.refs import RefController
+from chacra import snapshots
 
 
 class ProjectController(object):
@@ -20,17 +22,13 @@ class ProjectController(object):
         request.context['project_id'] = self.project.id
 
     @expose('json')
+    @cached
     def index(self):
         if request.method == 'POST':
             error('/errors/not_allowed',
                   'POST requests to this url are not allowed')
-        resp = {}
-        for ref in self.project.repo_refs:
-            resp[ref] = list(set(
-                [r.distro for r in
-                    self.project.built_repos.filter_by(ref=ref).all()]
-            ))
-        return resp
+        check_modified(*Repo.validators(project_id=self.project.id))
+        return snapshots.project_listing(self.project)
 
     @expose()
     def _lookup(self, name, *remainder):
@@ -40,12 +38,10 @@ class ProjectController(object):
 class ProjectsController(object):
 
     @expose('json')
+    @cached
     def index(self):
-        resp = {}
-        projects = Project.query.join(Repo).filter(Repo.path != None)
-        for project in projects.all():
-            resp[project.name] = project.repo_refs
-        return resp
+        check_modified(*Repo.validators())
+        return snapshots.projects_listing()
 
     @expose()
     def _lookup(self, project_name, *remainder):
@@ -1,7 +1,9 @@
 from pecan import expose, abort, request
-from chacra.models import Project, Binary
+from chacra.models import Project, Binary, Repo
 from chacra.controllers import error
+from chacra.controllers.util import cached, check_modified
 from chacra.controllers.repos.distros import DistroController
+from chacra import snapshots
 
 
 class RefController(object):
@@ -12,16 +14,12 @@ class RefController(object):
         request.context['ref'] = self.ref_name
 
     @expose('json', generic=True)
+    @cached
     def index(self):
+        check_modified(*Repo.validators(project_id=self.project.id))
         if self.ref_name not in self.project.repo_refs:
             abort(404)
-        resp = {}
-        for distro in self.project.repo_distros:
-            resp[distro] = list(set(
-                [b.distro_version for b in
-                    self.project.built_repos.filter_by(distro=distro).all()]
-            ))
-        return resp
+        return snapshots.ref_listing(self.project)
 
     @index.when(method='POST', template='json')
     def index_post(self):
@@ -3,6 +3,7 @@ from chacra.models import Project, Repo
 from chacra.controllers.projects import ProjectsController
 from chacra.controllers.errors import ErrorsController
 from chacra.controllers.search import SearchController
+from chacra.controllers.stats import StatsController
 from chacra.controllers.repos.projects import (
     ProjectsController as RepoProjectsController,
 )
@@ -29,4 +30,5 @@ class RootController(object):
     binaries = ProjectsController()
     errors = ErrorsController()
     search = SearchController()
+    stats = StatsController()
     repos = RepoProjectsController()
@@ -1,12 +1,26 @@
 from pecan import expose
-from chacra.models import Binary
+from sqlalchemy import DateTime, Integer
+from chacra.models import Binary, Project, Session, name_index
 from chacra.controllers import error
+from chacra.controllers.util import (
+    paginate, pagination_params, parse_datetime, stream
+)
 
 
 class SearchController(object):
+    """
+    Search binaries with query params like ``?distro=ubuntu``. Params can
+    have an operator appended to them with a dash, like ``?size-gt=1024``,
+    ``?distro-in=centos,rhel`` or ``?name-startswith=ceph-deploy``. Every
+    param is combined into a single query.
+
+    Substring (``?name-contains=radosgw``) and fuzzy (``?name-similar=rados``)
+    name searches use the name index when the database has one.
+    """
 
     def __init__(self):
         self.filters = {
+                'project': Project.name,
                 'distro': Binary.distro,
                 'distro_version': Binary.distro_version,
                 'arch': Binary.arch,
@@ -14,27 +28,95 @@ class SearchController(object):
                 'built_by': Binary.built_by,
                 'size': Binary.size,
                 'name': Binary.name,
-                'name-like': Binary.name.like,
+                'created': Binary.created,
+                'modified': Binary.modified,
+        }
+        self.operators = {
+                'gt': lambda column, value: column > value,
+                'gte': lambda column, value: column >= value,
+                'lt': lambda column, value: column < value,
+                'lte': lambda column, value: column <= value,
+                'in': lambda column, value: column.in_(value),
+                # matches the start of the value, so that indexes can be used
+                'startswith': lambda column, value: column.startswith(
+                    value, autoescape=True),
+                # the value is a LIKE pattern, e.g. 'ceph-%.deb'
+                'like': lambda column, value: column.like(value),
+                'contains': lambda column, value: column.contains(
+                    value, autoescape=True),
+        }
+        # operators that only make sense for strings
+        self.text_operators = ['startswith', 'like', 'contains', 'similar']
+        # name searches that use the name index, if there is one
+        self.name_operators = {
+                'contains': name_index.contains,
+                'similar': name_index.similar,
         }
 
     @expose('json')
     def index(self, **kw):
+        params = dict((k, kw.pop(k)) for k in pagination_params if k in kw)
+        stream_format = kw.pop('stream', None)
         query = self.apply_filters(kw)
         if not query:
             return {}
-        return query.all()
+        try:
+            if stream_format:
+                # everything that matches, meant for bulk exports
+                return stream(query.order_by(Binary.id), stream_format)
+            return paginate(query, Binary, params)
+        except ValueError as exc:
+            return error('/errors/invalid/', str(exc))
 
     def apply_filters(self, filters):
-        # TODO: allow operators
-        query = None
+        conditions = []
         for k, v in filters.items():
-            if k not in self.filters:
+            key, _, operator = k.partition('-')
+            if key not in self.filters:
+                return error('/errors/not_allowed', 'invalid query params: %s' % k)
+            if operator and operator not in self.text_operators + list(self.operators):
                 return error('/errors/not_allowed', 'invalid query params: %s' % k)
-            if k in self.filters:
-                query = self.filter_binary(self.filters[k], v, query)
-        return query
-
-    def filter_binary(self, key, value, query=None):
-        if query:
-            return query.filter(key == value)
-        return Binary.query.filter(key == value)
+            try:
+                conditions.append(self.filter_condition(key, operator, v))
+            except ValueError as exc:
+                return error('/errors/invalid/', str(exc))
+        if not conditions:
+            return None
+        query = Binary.query
+        if 'project' in [k.partition('-')[0] for k in filters]:
+            query = query.join(Binary.project)
+        return query.filter(*conditions)
+
+    def filter_condition(self, key, operator, value):
+        """
+        Build the SQL condition for a single query param, converting the
+        value to the type of its column. Raises ``ValueError`` if the value
+        cannot be converted or the operator does not apply to the column.
+        """
+        column = self.filters[key]
+        column_type = column.property.columns[0].type
+        if operator in self.text_operators:
+            if key == 'name' and operator in self.name_operators:
+                return self.name_operators[operator](Session(), value)
+            if isinstance(column_type, (Integer, DateTime)) or operator not in self.operators:
+                raise ValueError('%s does not support %s' % (key, operator))
+            return self.operators[operator](column, value)
+
+        if isinstance(column_type, Integer):
+            convert = int
+        elif isinstance(column_type, DateTime):
+            convert = parse_datetime
+        else:
+            convert = lambda v: v
+
+        try:
+            if operator == 'in':
+                value = [convert(v) for v in value.split(',')]
+            else:
+                value = convert(value)
+        except ValueError:
+            raise ValueError('invalid value for %s: %s' % (key, value))
+
+        if not operator:
+            return column == value
+        return self.operators[operator](column, value)
@@ -0,0 +1,18 @@
+import os
+from pecan import expose
+from chacra import cache
+
+
+class StatsController(object):
+    """
+    Counters of the worker that serves the request, every worker has its
+    own
+    """
+
+    @expose('json')
+    def index(self):
+        response_cache = cache.get_cache()
+        return dict(
+            pid=os.getpid(),
+            cache=response_cache.stats() if response_cache else None,
+        )
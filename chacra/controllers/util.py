@@ -1,4 +1,283 @@
+import json
+import base64
+import hashlib
+from functools import wraps
 from datetime import datetime, timedelta
+from pecan import abort, conf, request, response
+from pecan.jsonify import encode
+from sqlalchemy import DateTime, and_, or_
+from sqlalchemy.orm import Session
+from webob import Response
+from webob.datetime_utils import parse_date, serialize_date
+from chacra import cache
+
+
+# query parameters used for pagination, anything else is left for the
+# controllers to handle
+pagination_params = ('limit', 'cursor', 'order', 'count')
+
+# how results can be ordered to page through them, prefixing them with '-'
+# sorts in descending order
+pagination_orders = ('id', 'name', 'size', 'created', 'modified')
+
+
+def parse_datetime(value):
+    """
+    Parse dates (``2015-10-01``) and ISO 8601 timestamps, with or without
+    microseconds, raising ``ValueError`` for anything else
+    """
+    for date_format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError('invalid date: %s' % value)
+
+
+def encode_cursor(order, row):
+    """
+    Produce an opaque cursor that points right after ``row`` in results
+    ordered by ``order``
+    """
+    value = getattr(row, order.lstrip('-'))
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    data = json.dumps([order, value, row.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data)
+
+
+def decode_cursor(order, cursor, column):
+    """
+    Return the (value, id) a cursor points to, raising ``ValueError`` if it
+    is not valid or it was produced for a different ordering
+    """
+    try:
+        cursor_order, value, id_ = json.loads(
+            base64.urlsafe_b64decode(str(cursor))
+        )
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor')
+    if cursor_order != order:
+        raise ValueError('cursor is not valid for order: %s' % order)
+    try:
+        if isinstance(column.type, DateTime):
+            value = parse_datetime(value)
+        return value, int(id_)
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor')
+
+
+def paginate(query, model, params):
+    """
+    Return a single page of results from ``query``, ordered by the ``order``
+    param (``id`` by default, ``-modified`` for the most recent first),
+    starting after ``cursor`` and with at most ``limit`` items (never more
+    than ``conf.page_size``).
+
+    Sets the ``X-Next-Cursor`` header when there are more results, and
+    ``X-Total-Count`` with the total number of results when the ``count``
+    param is set since counting can be expensive. Raises ``ValueError`` for
+    invalid params.
+
+    The rows of ``query`` must have ``id`` and the ordering attributes, either
+    as model objects or as columns.
+    """
+    page_size = getattr(conf, 'page_size', 1000)
+    limit = params.get('limit') or page_size
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be greater than zero')
+    limit = min(limit, page_size)
+
+    order = params.get('order') or 'id'
+    if order.lstrip('-') not in pagination_orders:
+        raise ValueError('invalid order: %s' % order)
+    descending = order.startswith('-')
+
+    if params.get('count') not in (None, '', '0', 'false', 'no'):
+        response.headers['X-Total-Count'] = str(query.order_by(None).count())
+
+    name = order.lstrip('-')
+    column = getattr(model, name)
+    after = (lambda a, b: a < b) if descending else (lambda a, b: a > b)
+    if params.get('cursor'):
+        value, id_ = decode_cursor(order, params['cursor'], column)
+        if name == 'id':
+            query = query.filter(after(model.id, id_))
+        else:
+            query = query.filter(or_(
+                after(column, value),
+                and_(column == value, after(model.id, id_)),
+            ))
+    if name == 'id':
+        ordering = [model.id]
+    else:
+        ordering = [column, model.id]
+    if descending:
+        ordering = [c.desc() for c in ordering]
+    query = query.order_by(*ordering)
+
+    # fetch one more than needed to know if there is a next page
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor(order, rows[-1])
+    return rows
+
+
+def parse_fields(value, allowed):
+    """
+    Split the comma separated value of a ``?fields=`` query parameter into
+    a list of field names, preserving their order. Raises ``ValueError`` if
+    any of them is not in ``allowed``.
+    """
+    fields = []
+    for field in value.split(','):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in allowed:
+            raise ValueError('invalid field: %s' % field)
+        fields.append(field)
+    return fields
+
+
+# formats that can be requested with ``?stream=`` and their content types
+stream_formats = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def stream(query, format, key=None, serialize=None, batch_size=500):
+    """
+    Build a response that sends the results of ``query`` as they are read
+    from the database, so that memory use does not grow with the number of
+    results. Controllers should return it as is.
+
+    With the ``json`` format results are sent as a list, or as an object if
+    ``key`` is given, mapping ``key(row)`` to every row. With ``ndjson`` every
+    row (or every ``{key(row): row}`` object) goes on its own line. Rows are
+    passed through ``serialize`` (if given) before being encoded.
+
+    The request's session is closed before the response is sent, so results
+    are read with a session of their own.
+    """
+    if format not in stream_formats:
+        raise ValueError('invalid stream format: %s' % format)
+    serialize = serialize or (lambda row: row)
+    engine = query.session.get_bind()
+    if format == 'ndjson':
+        start, end = '', ''
+    elif key is None:
+        start, end = '[', ']'
+    else:
+        start, end = '{', '}'
+
+    def encode_row(row):
+        if key is None:
+            return encode(serialize(row))
+        if format == 'json':
+            return '%s:%s' % (encode(key(row)), encode(serialize(row)))
+        return encode({key(row): serialize(row)})
+
+    def generate():
+        session = Session(bind=engine)
+        try:
+            rows = query.with_session(session).yield_per(batch_size)
+            chunk = [start]
+            for count, row in enumerate(rows):
+                if format == 'json' and count:
+                    chunk.append(',')
+                chunk.append(encode_row(row))
+                if format == 'ndjson':
+                    chunk.append('\n')
+                if len(chunk) >= batch_size:
+                    yield ''.join(chunk)
+                    chunk = []
+            chunk.append(end)
+            yield ''.join(chunk)
+        finally:
+            session.close()
+
+    return Response(
+        app_iter=generate(),
+        content_type=stream_formats[format],
+        charset='utf-8',
+    )
+
+
+def check_modified(last_modified, *validators):
+    """
+    Set the ``ETag`` and ``Last-Modified`` headers of a response from cheap
+    validators of what it is built from: the newest modification time (a
+    naive UTC datetime, or None) plus anything else that changes along with
+    it, like counts of rows.
+
+    If the client already has this version, as told by ``If-None-Match`` or
+    (when there is no ETag to compare) ``If-Modified-Since``, respond with
+    a 304 right away so that the controller does not need to build it.
+    """
+    etag = hashlib.sha1(repr((last_modified,) + validators)).hexdigest()
+    headers = [('ETag', '"%s"' % etag)]
+    if last_modified is not None:
+        headers.append(('Last-Modified', serialize_date(last_modified)))
+    send_validators(headers)
+
+
+def send_validators(headers):
+    """
+    Set the ``ETag`` and ``Last-Modified`` ``headers`` (a list of name and
+    value pairs) on the response, or abort with a 304 if they match the
+    conditional headers of the request
+    """
+    values = dict(headers)
+    if 'If-None-Match' in request.headers:
+        not_modified = values.get('ETag', '').strip('"') in request.if_none_match
+    elif request.if_modified_since and 'Last-Modified' in values:
+        not_modified = parse_date(values['Last-Modified']) <= request.if_modified_since
+    else:
+        not_modified = False
+
+    if not_modified:
+        abort(304, headers=headers)
+    for name, value in headers:
+        response.headers[name] = value
+
+
+def cached(method):
+    """
+    Serve the JSON rendered by a controller method from the response cache
+    (see ``chacra.cache``), if it is enabled. Only GET requests are cached,
+    keyed by their path and query string along with the version of the
+    project they belong to, so that changes to it invalidate them.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kw):
+        response_cache = cache.get_cache()
+        if response_cache is None or request.method != 'GET':
+            return method(self, *args, **kw)
+        # the version is read before the data, so that a change committed in
+        # between cannot leave a stale body in the current version
+        key = response_cache.key(request.path_qs, request.context.get('project_id'))
+        found = response_cache.get(key)
+        if found is None:
+            body = encode(method(self, *args, **kw))
+            headers = [
+                (name, response.headers[name])
+                for name in ('ETag', 'Last-Modified') if name in response.headers
+            ]
+            response_cache.set(key, body, headers)
+        else:
+            body, headers = found
+            send_validators(headers)
+        response.content_type = 'application/json'
+        response.body = body
+        return response
+    return wrapper
 
 
 def last_seen(timestamp):
@@ -3,6 +3,7 @@ from sqlalchemy import create_engine, MetaData, event
 from sqlalchemy.orm import scoped_session, sessionmaker, object_session, mapper
 from sqlalchemy.ext.declarative import declarative_base
 from pecan import conf
+from chacra import cache
 
 
 class _EntityBase(object):
@@ -57,6 +58,26 @@ def update_timestamp(mapper, connection, target):
     target.modified = datetime.datetime.utcnow()
 
 
+def invalidate_cache(mapper, connection, target):
+    """
+    Drop the cached responses that include ``target`` once the change is
+    committed
+    """
+    cache.request_invalidation(target)
+
+
+def invalidate_pending(session):
+    cache.invalidate_pending(session)
+
+
+def discard_invalidations(session):
+    cache.discard_pending(session)
+
+
+event.listen(Session, 'after_commit', invalidate_pending)
+event.listen(Session, 'after_rollback', discard_invalidations)
+
+
 # Utilities:
 
 def get_or_create(model, **kwargs):
@@ -124,3 +145,5 @@ def flush():
 from projects import Project  # noqa
 from binaries import Binary  # noqa
 from repos import Repo  # noqa
+from summaries import BinarySummary  # noqa
+import name_index  # noqa
@@ -1,17 +1,35 @@
-import hashlib
+import os
 import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm.attributes import get_history, set_committed_value
 from sqlalchemy.event import listen
 from sqlalchemy.orm.exc import DetachedInstanceError
-from chacra.models import Base, update_timestamp
+from chacra.models import Base, invalidate_cache, update_timestamp
 from chacra.models.repos import Repo
 from chacra.controllers import util
+from chacra import cache, checksums, rebuilds, versions
 
 
 class Binary(Base):
 
     __tablename__ = 'binaries'
+    __table_args__ = (
+        # uploads and downloads look up a single binary by all of these at
+        # once, and arch listings use its (project ... arch) prefix. A name
+        # can only exist once in a given arch
+        Index(
+            'ix_binaries_tree_name',
+            'project_id', 'ref', 'distro', 'distro_version', 'arch', 'name',
+            unique=True
+        ),
+        # newest versions of every package in an arch
+        Index(
+            'ix_binaries_latest',
+            'project_id', 'ref', 'distro', 'distro_version', 'arch',
+            'package_name', 'version_key'
+        ),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(256), nullable=False, index=True)
     path = Column(String(256))
@@ -25,6 +43,15 @@ class Binary(Base):
     signed = Column(Boolean(), default=False)
     size = Column(Integer, default=0)
     checksum = Column(String(256))
+    sha256 = Column(String(64))
+    md5 = Column(String(32))
+    # size, modification time and inode of the file at the time the checksum
+    # was computed, used to tell if the file changed
+    fingerprint = Column(String(256))
+    # package name and a key that sorts like its version, both taken from
+    # the binary name (see chacra.versions)
+    package_name = Column(String(256))
+    version_key = Column(String(512))
 
     project_id = Column(Integer, ForeignKey('projects.id'))
     project = relationship('Project', backref=backref('binaries', lazy='dynamic'))
@@ -42,7 +69,31 @@ class Binary(Base):
         'size',
     ]
 
-    def __init__(self, name, project, repo=None, **kw):
+    # set by ``set_checksums`` to tell the listeners that the digests match
+    # the file, so that it is not read again
+    _checksums_computed = False
+
+    # every key in the JSON representation, all of them are columns except
+    # for 'last_changed'
+    json_fields = [
+        'name',
+        'created',
+        'modified',
+        'signed',
+        'size',
+        'path',
+        'last_changed',
+        'built_by',
+        'distro',
+        'distro_version',
+        'checksum',
+        'sha256',
+        'md5',
+        'arch',
+        'ref',
+    ]
+
+    def __init__(self, name, project, repo=None, checksums=None, **kw):
         self.name = name
         self.project = project
         now = datetime.datetime.utcnow()
@@ -51,10 +102,24 @@ class Binary(Base):
         for key in self.allowed_keys:
             if key in kw.keys():
                 setattr(self, key, kw[key])
+        if checksums:
+            self.set_checksums(checksums)
         self.repo = repo or self._get_or_create_repo()
         # ensure that the repo.type is set
         self._set_repo_type()
 
+    def set_checksums(self, checksums):
+        """
+        Set the digests from a dictionary that maps algorithm names to
+        hex digests, like the ones produced by ``chacra.checksums``. They
+        must have been computed from the file at ``path`` (e.g. while saving
+        an upload), they are trusted as is.
+        """
+        self.checksum = checksums.get('sha512')
+        self.sha256 = checksums.get('sha256')
+        self.md5 = checksums.get('md5')
+        self._checksums_computed = True
+
     @property
     def extension(self):
         return self.name.split('.')[-1]
@@ -103,10 +168,14 @@ class Binary(Base):
 
     @property
     def last_changed(self):
-        if self.modified > self.created:
-            last = self.modified
+        return self.format_last_changed(self.created, self.modified)
+
+    @staticmethod
+    def format_last_changed(created, modified):
+        if modified > created:
+            last = modified
         else:
-            last = self.created
+            last = created
         return util.last_seen(last)
 
     def __json__(self):
@@ -122,6 +191,8 @@ class Binary(Base):
             distro=self.distro,
             distro_version=self.distro_version,
             checksum=self.checksum,
+            sha256=self.sha256,
+            md5=self.md5,
             arch=self.arch,
             ref=self.ref,
         )
@@ -130,7 +201,23 @@ class Binary(Base):
 # Listeners
 
 
+def file_fingerprint(path):
+    """
+    Produce a cheap signature of the file at ``path`` from its size,
+    modification time and inode. If any of these change, the contents of the
+    file are assumed to have changed too. Returns None if the file cannot be
+    stat'ed.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return '%d-%d-%d' % (stat.st_size, int(stat.st_mtime * 1000000), stat.st_ino)
+
+
 def generate_checksum(mapper, connection, target):
+    # digests given with ``set_checksums`` are only trusted for this flush
+    computed, target._checksums_computed = target._checksums_computed, False
     try:
         target.path
     except AttributeError:
@@ -143,24 +230,66 @@ def generate_checksum(mapper, connection, target):
     # paths and files, this should be required.
     if not target.path:
         return
-    chsum = hashlib.sha512()
-    with open(target.path) as f:
-        for chunk in iter(lambda: f.read(4096), ""):
-            chsum.update(chunk)
-        target.checksum = chsum.hexdigest()
+
+    fingerprint = file_fingerprint(target.path)
+
+    # uploads compute the checksums while streaming the file to disk, so there
+    # is no need to read it all over again. Only JSON POSTs that point to an
+    # existing path need the checksums computed here.
+    if computed:
+        target.fingerprint = fingerprint
+        return
+
+    # metadata-only updates (or re-posting the same path) leave the file
+    # untouched, there is no need to read it again. Digests set any other
+    # way (like in JSON) are never trusted.
+    has_checksums = target.checksum and target.sha256 and target.md5
+    digests_changed = any(
+        get_history(target, key).added for key in ('checksum', 'sha256', 'md5')
+    )
+    if has_checksums and fingerprint == target.fingerprint and not digests_changed:
+        return
+
+    digests = checksums.file_checksums(target.path)
+    target.checksum = digests.get('sha512')
+    target.sha256 = digests.get('sha256')
+    target.md5 = digests.get('md5')
+    target.fingerprint = fingerprint
+
+
+def set_package_version(mapper, connection, target):
+    if target.package_name is None or get_history(target, 'name').added:
+        target.package_name, target.version_key = versions.package_version(target.name)
 
 
 def update_repo(mapper, connection, target):
-    try:
-        target.repo.needs_update = True
-    except AttributeError:
-        pass
+    repo = target.repo
+    if repo is None:
+        return
+    if repo.id is None:
+        repo.needs_update = True
+        return
+    # the repo has already been flushed (or was not modified at all) by the
+    # time this runs, so setting the attribute would be discarded: persist the
+    # flag directly and record the repo for a rebuild once this is committed
+    repos = Repo.__table__
+    connection.execute(
+        repos.update().where(repos.c.id == repo.id).values(needs_update=True)
+    )
+    set_committed_value(repo, 'needs_update', True)
+    rebuilds.request(repo)
+    cache.request_invalidation(repo)
 
 # listen for checksum changes
 listen(Binary, 'before_insert', generate_checksum)
 listen(Binary, 'before_update', generate_checksum)
 
 
+# listen for name changes to keep the package version in sync
+listen(Binary, 'before_insert', set_package_version)
+listen(Binary, 'before_update', set_package_version)
+
+
 # listen for timestamp modifications
 listen(Binary, 'before_insert', update_timestamp)
 listen(Binary, 'before_update', update_timestamp)
@@ -170,3 +299,8 @@ listen(Binary, 'before_update', update_timestamp)
 listen(Binary, 'before_insert', update_repo)
 listen(Binary, 'before_update', update_repo)
 
+
+# listen for any changes to drop cached responses
+listen(Binary, 'before_insert', invalidate_cache)
+listen(Binary, 'before_update', invalidate_cache)
+listen(Binary, 'after_delete', invalidate_cache)
@@ -0,0 +1,175 @@
+"""
+Optional index for substring and fuzzy searches on binary names, which
+otherwise need to scan the whole binaries table.
+
+On PostgreSQL this is a trigram (pg_trgm) GIN index on ``binaries.name``,
+which ``LIKE '%radosgw%'`` can use as is. On SQLite it is an FTS5 table with
+the trigram tokenizer, kept in sync with triggers. When neither is available
+(the extension is not installed, or SQLite is too old) searches fall back to
+plain ``LIKE`` queries.
+"""
+import logging
+from sqlalchemy import column, select, table, text
+from sqlalchemy.event import listen
+from sqlalchemy.exc import DBAPIError
+from chacra.models.binaries import Binary
+
+logger = logging.getLogger(__name__)
+
+sqlite_ddl = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS binaries_name_fts USING fts5("
+    "name, content='binaries', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS binaries_name_fts_insert "
+    "AFTER INSERT ON binaries BEGIN "
+    "INSERT INTO binaries_name_fts(rowid, name) VALUES (new.id, new.name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS binaries_name_fts_delete "
+    "AFTER DELETE ON binaries BEGIN "
+    "INSERT INTO binaries_name_fts(binaries_name_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS binaries_name_fts_update "
+    "AFTER UPDATE OF name ON binaries BEGIN "
+    "INSERT INTO binaries_name_fts(binaries_name_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); "
+    "INSERT INTO binaries_name_fts(rowid, name) VALUES (new.id, new.name); "
+    "END",
+    # index any binaries that already exist
+    "INSERT INTO binaries_name_fts(binaries_name_fts) VALUES ('rebuild')",
+]
+
+postgresql_ddl = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ix_binaries_name_trgm ON binaries "
+    "USING gin (name gin_trgm_ops)",
+]
+
+# trigram indexes cannot help with anything shorter than a trigram
+min_length = 3
+
+# engine url -> whether the index is available
+_available = {}
+
+
+def create(connection):
+    """
+    Create the index for the database behind ``connection``. Failures are
+    logged and ignored since the index is optional.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = sqlite_ddl
+    elif dialect == 'postgresql':
+        available = connection.execute(text(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )).scalar()
+        if not available:
+            logger.warning('pg_trgm is not available, names will not be indexed')
+            return False
+        statements = postgresql_ddl
+    else:
+        return False
+
+    # keep a failure from aborting the rest of the transaction on PostgreSQL
+    transaction = connection.begin_nested() if dialect == 'postgresql' else None
+    try:
+        for statement in statements:
+            connection.execute(text(statement))
+    except DBAPIError:
+        if transaction is not None:
+            transaction.rollback()
+        logger.exception('could not create the name index')
+        return False
+    if transaction is not None:
+        transaction.commit()
+    _available.pop(str(connection.engine.url), None)
+    return True
+
+
+def drop(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS binaries_name_fts"))
+    _available.pop(str(connection.engine.url), None)
+
+
+def is_available(connection):
+    """
+    Tell if the index exists in the database behind ``connection``, the
+    answer is cached for every database
+    """
+    key = str(connection.engine.url)
+    if key not in _available:
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            query = (
+                "SELECT 1 FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'binaries_name_fts'"
+            )
+        elif dialect == 'postgresql':
+            query = (
+                "SELECT 1 FROM pg_indexes "
+                "WHERE indexname = 'ix_binaries_name_trgm'"
+            )
+        else:
+            query = None
+        found = query and connection.execute(text(query)).scalar()
+        _available[key] = bool(found)
+    return _available[key]
+
+
+def contains(session, value):
+    """
+    A condition matching binaries with ``value`` anywhere in their name,
+    using the index if it is available
+    """
+    condition = Binary.name.contains(value, autoescape=True)
+    connection = session.connection()
+    if connection.dialect.name != 'sqlite' or len(value) < min_length:
+        # PostgreSQL uses the trigram index for LIKE on its own
+        return condition
+    if not is_available(connection):
+        return condition
+    # a quoted FTS5 string matches the exact sequence of characters
+    match = '"%s"' % value.replace('"', '""')
+    matches = select([column('rowid')]).select_from(
+        table('binaries_name_fts')
+    ).where(text('binaries_name_fts MATCH :match').bindparams(match=match))
+    return Binary.id.in_(matches)
+
+
+def similar(session, value):
+    """
+    A condition matching binaries with names similar to ``value``, which
+    needs the trigram index on PostgreSQL. Raises ``ValueError`` otherwise.
+    """
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql' and is_available(connection):
+        return similarity_condition(connection.dialect, value)
+    raise ValueError('similarity searches are not supported by this database')
+
+
+def similarity_condition(dialect, value):
+    """
+    The pg_trgm ``name % value`` condition, which (unlike ``similarity()``)
+    can use the trigram index. The operator is written as is into the SQL,
+    so it has to be escaped for drivers that use ``%`` for their parameters,
+    like psycopg2.
+    """
+    operator = '%%' if dialect.paramstyle in ('format', 'pyformat') else '%'
+    return Binary.name.op(operator)(value)
+
+
+# Listeners
+
+
+def create_index(target, connection, **kw):
+    create(connection)
+
+
+def drop_index(target, connection, **kw):
+    drop(connection)
+
+
+# create the index along with the binaries table
+listen(Binary.__table__, 'after_create', create_index)
+listen(Binary.__table__, 'before_drop', drop_index)
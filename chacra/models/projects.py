@@ -1,7 +1,10 @@
 from sqlalchemy import Column, Integer, String
+from sqlalchemy.event import listen
 from sqlalchemy.orm.exc import DetachedInstanceError
 from chacra.models import Base
+from chacra import cache
 from chacra.models.repos import Repo
+from chacra.models.summaries import BinarySummary
 
 
 class Project(Base):
@@ -13,21 +16,29 @@ class Project(Base):
     def __init__(self, name):
         self.name = name
 
+    def _distinct(self, query, column):
+        """
+        Only the unique values of ``column`` are needed, so let the database
+        produce them instead of loading every row as an object. Values from
+        binaries come from their summaries, which are much fewer rows.
+        """
+        return [row[0] for row in query.with_entities(column).distinct()]
+
     @property
     def archs(self):
-        return list(set([b.arch for b in self.binaries.all()]))
+        return self._distinct(self.summaries, BinarySummary.arch)
 
     @property
     def distro_versions(self):
-        return list(set([b.distro_version for b in self.binaries.all()]))
+        return self._distinct(self.summaries, BinarySummary.distro_version)
 
     @property
     def distros(self):
-        return list(set([b.distro for b in self.binaries.all()]))
+        return self._distinct(self.summaries, BinarySummary.distro)
 
     @property
     def refs(self):
-        return list(set([b.ref for b in self.binaries.all()]))
+        return self._distinct(self.summaries, BinarySummary.ref)
 
     @property
     def built_repos(self):
@@ -35,15 +46,15 @@ class Project(Base):
 
     @property
     def repo_refs(self):
-        return list(set([r.ref for r in self.built_repos.all()]))
+        return self._distinct(self.built_repos, Repo.ref)
 
     @property
     def repo_distros(self):
-        return list(set([r.distro for r in self.built_repos.all()]))
+        return self._distinct(self.built_repos, Repo.distro)
 
     @property
     def repo_distro_versions(self):
-        return list(set([r.distro_version for r in self.built_repos.all()]))
+        return self._distinct(self.built_repos, Repo.distro_version)
 
     def __repr__(self):
         try:
@@ -53,10 +64,20 @@ class Project(Base):
 
     def __json__(self):
         json_ = {}
-        for ref in self.refs:
-            json_[ref] = list(
-                set(
-                    [b.distro for b in self.binaries.filter_by(ref=ref).all()]
-                )
-            )
+        query = self.summaries.with_entities(
+            BinarySummary.ref, BinarySummary.distro).distinct()
+        for ref, distro in query:
+            json_.setdefault(ref, []).append(distro)
         return json_
+
+
+# Listeners
+
+
+def invalidate_cache(mapper, connection, target):
+    cache.request_invalidation(target, project_id=target.id)
+
+
+# listen for projects being added or removed to drop cached responses
+listen(Project, 'after_insert', invalidate_cache)
+listen(Project, 'after_delete', invalidate_cache)
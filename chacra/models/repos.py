@@ -1,14 +1,32 @@
 import datetime
 from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime
+from sqlalchemy import DDL, Index, and_, func, or_, select, text
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.event import listen
+from sqlalchemy.orm.attributes import get_history
 from sqlalchemy.orm.exc import DetachedInstanceError
-from chacra.models import Base, update_timestamp
+from chacra.models import Base, Session, invalidate_cache, update_timestamp
+from chacra import cache, rebuilds
 
 
 class Repo(Base):
 
     __tablename__ = 'repos'
+    __table_args__ = (
+        # there is a single repo for every project, ref, distro and version
+        Index(
+            'ix_repos_tree',
+            'project_id', 'ref', 'distro', 'distro_version',
+            unique=True
+        ),
+        # only the few repos that need an update (or are being built) are of
+        # interest when polling, no need to index the rest. See below for the
+        # repos that need an update
+        Index(
+            'ix_repos_building_since', 'building_since',
+            postgresql_where=text('building_since IS NOT NULL'),
+        ),
+    )
     id = Column(Integer, primary_key=True)
     path = Column(String(256))
     ref = Column(String(256), index=True)
@@ -19,6 +37,9 @@ class Repo(Base):
     needs_update = Column(Boolean(), default=True)
     type = Column(String(12))
     size = Column(Integer, default=0)
+    # when the build currently running for this repo started, NULL when no
+    # build is running. Only one worker at a time can hold this lease
+    building_since = Column(DateTime)
 
     project_id = Column(Integer, ForeignKey('projects.id'))
     project = relationship('Project', backref=backref('repos', lazy='dynamic'))
@@ -41,6 +62,16 @@ class Repo(Base):
         except DetachedInstanceError:
             return '<Repo detached>'
 
+    @classmethod
+    def validators(cls, **filters):
+        """
+        The newest modification time and the number of built repos matching
+        ``filters``, enough to tell if a listing of them changed
+        """
+        return tuple(cls.query.filter(cls.path != None).filter_by(
+            **filters
+        ).with_entities(func.max(cls.modified), func.count(cls.id)).one())
+
     def __json__(self):
         return dict(
             path=self.path,
@@ -54,6 +85,117 @@ class Repo(Base):
         )
 
 
+# a partial index only pays off where it can leave out the repos that do not
+# need an update, anywhere else it would duplicate the primary key
+listen(
+    Repo.__table__, 'after_create',
+    DDL(
+        'CREATE INDEX ix_repos_needs_update ON repos (id) WHERE needs_update'
+    ).execute_if(dialect='postgresql')
+)
+
+
 # listen for timestamp modifications
 listen(Repo, 'before_insert', update_timestamp)
 listen(Repo, 'before_update', update_timestamp)
+
+
+# listen for any changes to drop cached responses
+listen(Repo, 'before_insert', invalidate_cache)
+listen(Repo, 'before_update', invalidate_cache)
+listen(Repo, 'after_delete', invalidate_cache)
+
+
+def invalidate_repo(repo_id):
+    """
+    Raw updates to repos do not go through the listeners, so the cached
+    responses for the project of the repo have to be dropped explicitly
+    (once the change is committed)
+    """
+    repos = Repo.__table__
+    project_id = Session.execute(
+        select([repos.c.project_id]).where(repos.c.id == repo_id)
+    ).scalar()
+    if project_id is not None:
+        cache.request_invalidation(None, project_id=project_id, session=Session())
+
+
+def acquire_build_lease(repo_id, timeout=3600):
+    """
+    Atomically take the build lease for a repo, clearing ``needs_update`` at
+    the same time so that anything flagging the repo while it builds is
+    noticed when the lease is released.
+
+    The lease is only taken if the repo needs an update and no other build is
+    running. Leases older than ``timeout`` seconds are assumed to belong to
+    a worker that died and can be taken over.
+
+    Returns True if the lease was acquired. The change is committed right
+    away so that other workers see it.
+    """
+    now = datetime.datetime.utcnow()
+    expired = now - datetime.timedelta(seconds=timeout)
+    repos = Repo.__table__
+    result = Session.execute(
+        repos.update().where(and_(
+            repos.c.id == repo_id,
+            or_(
+                and_(repos.c.building_since.is_(None), repos.c.needs_update),
+                repos.c.building_since < expired,
+            ),
+        )).values(building_since=now, needs_update=False)
+    )
+    acquired = result.rowcount == 1
+    if acquired:
+        invalidate_repo(repo_id)
+    Session.commit()
+    return acquired
+
+
+def release_build_lease(repo_id, failed=False):
+    """
+    Release the build lease of a repo. A failed build flags the repo again so
+    that it gets picked up later on.
+
+    Returns True if the repo was flagged while it was building and needs
+    a follow-up build.
+    """
+    repos = Repo.__table__
+    values = dict(building_since=None)
+    if failed:
+        values['needs_update'] = True
+    Session.execute(
+        repos.update().where(repos.c.id == repo_id).values(**values)
+    )
+    invalidate_repo(repo_id)
+    needs_update = Session.execute(
+        select([repos.c.needs_update]).where(repos.c.id == repo_id)
+    ).scalar()
+    Session.commit()
+    return bool(needs_update) and not failed
+
+
+def request_rebuilds(session, flush_context):
+    """
+    Any repo that was just flagged as needing an update gets a rebuild
+    requested, which is published when the transaction is committed
+    """
+    for obj in session.new.union(session.dirty):
+        if not isinstance(obj, Repo) or not obj.needs_update:
+            continue
+        if get_history(obj, 'needs_update').added:
+            rebuilds.request(obj, session)
+
+
+def publish_rebuilds(session):
+    rebuilds.publish_pending(session)
+
+
+def discard_rebuilds(session):
+    rebuilds.discard_pending(session)
+
+
+# listen for repos that need to be rebuilt
+listen(Session, 'after_flush', request_rebuilds)
+listen(Session, 'after_commit', publish_rebuilds)
+listen(Session, 'after_rollback', discard_rebuilds)
@@ -0,0 +1,149 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, BigInteger
+from sqlalchemy import UniqueConstraint, and_, func, select
+from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.event import listen
+from chacra.models import Base
+from chacra.models.binaries import Binary
+
+
+class BinarySummary(Base):
+    """
+    One row for every (project, ref, distro, distro_version, arch) that has
+    binaries, so that the /binaries/ tree can be navigated without going
+    through the binaries themselves. Rows are maintained by the Binary
+    listeners below and should never be modified directly.
+    """
+
+    __tablename__ = 'binary_summaries'
+    __table_args__ = (
+        UniqueConstraint(
+            'project_id', 'ref', 'distro', 'distro_version', 'arch',
+            name='uq_binary_summaries_tree'
+        ),
+    )
+    id = Column(Integer, primary_key=True)
+    ref = Column(String(256))
+    distro = Column(String(256), nullable=False)
+    distro_version = Column(String(256), nullable=False)
+    arch = Column(String(256), nullable=False)
+    binary_count = Column(Integer, nullable=False, default=0)
+    total_size = Column(BigInteger, nullable=False, default=0)
+    last_modified = Column(DateTime)
+
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    project = relationship('Project', backref=backref('summaries', lazy='dynamic'))
+
+    def __repr__(self):
+        return '<BinarySummary %s/%s/%s/%s>' % (
+            self.ref, self.distro, self.distro_version, self.arch
+        )
+
+    @classmethod
+    def validators(cls, **filters):
+        """
+        The newest modification time, the number of binaries and the number
+        of summaries matching ``filters``. Adding, changing or removing any
+        of those binaries changes at least one of them, so they tell if
+        a listing changed without having to build it.
+        """
+        return tuple(cls.query.filter_by(**filters).with_entities(
+            func.max(cls.last_modified),
+            func.coalesce(func.sum(cls.binary_count), 0),
+            func.count(cls.id),
+        ).one())
+
+    def __json__(self):
+        return dict(
+            ref=self.ref,
+            distro=self.distro,
+            distro_version=self.distro_version,
+            arch=self.arch,
+            binary_count=self.binary_count,
+            total_size=self.total_size,
+            last_modified=self.last_modified,
+        )
+
+
+# Listeners
+
+tree_keys = ('project_id', 'ref', 'distro', 'distro_version', 'arch')
+
+
+def refresh_summary(connection, key):
+    """
+    Recompute the summary row for ``key``, a dictionary with a value for every
+    one of ``tree_keys``, from the binaries that match it.
+
+    The project row is locked first so that concurrent transactions adding
+    binaries to the same project do not miss each other's changes.
+    """
+    if key['project_id'] is None:
+        return
+    projects = Base.metadata.tables['projects']
+    binaries = Binary.__table__
+    summaries = BinarySummary.__table__
+
+    connection.execute(
+        select([projects.c.id]).where(
+            projects.c.id == key['project_id']).with_for_update()
+    )
+
+    count, size, modified = connection.execute(
+        select([
+            func.count(binaries.c.id),
+            func.coalesce(func.sum(binaries.c.size), 0),
+            func.max(binaries.c.modified),
+        ]).where(and_(*[binaries.c[k] == v for k, v in key.items()]))
+    ).first()
+
+    matches = and_(*[summaries.c[k] == v for k, v in key.items()])
+    if not count:
+        connection.execute(summaries.delete().where(matches))
+        return
+    values = dict(binary_count=count, total_size=size, last_modified=modified)
+    result = connection.execute(summaries.update().where(matches).values(**values))
+    if result.rowcount == 0:
+        values.update(key)
+        connection.execute(summaries.insert().values(**values))
+
+
+def current_key(target):
+    return dict((k, getattr(target, k)) for k in tree_keys)
+
+
+def previous_key(target):
+    """
+    The key the binary had before this flush, for binaries that were moved
+    to some other ref, distro, version or arch
+    """
+    key = {}
+    for k in tree_keys:
+        history = get_history(target, k)
+        if history.deleted:
+            key[k] = history.deleted[0]
+        else:
+            key[k] = getattr(target, k)
+    return key
+
+
+def binary_added(mapper, connection, target):
+    refresh_summary(connection, current_key(target))
+
+
+def binary_changed(mapper, connection, target):
+    key = current_key(target)
+    refresh_summary(connection, key)
+    old_key = previous_key(target)
+    if old_key != key:
+        refresh_summary(connection, old_key)
+
+
+def binary_removed(mapper, connection, target):
+    refresh_summary(connection, previous_key(target))
+
+
+# keep the summaries up to date with any change to binaries
+listen(Binary, 'after_insert', binary_added)
+listen(Binary, 'after_update', binary_changed)
+listen(Binary, 'after_delete', binary_removed)
@@ -0,0 +1,153 @@
+"""
+Repositories that need to be created or updated are published to the Celery
+workers as soon as the transaction that flagged them is committed, instead of
+waiting for a periodic task to find them in the database.
+
+Requests are debounced per repository: once a rebuild is queued (to run after
+``quiet_time`` seconds) further requests for the same repository within that
+window are dropped, since the queued task will pick up every change when it
+runs.
+
+Failed builds are retried with a backoff: ``retry_delay`` seconds after the
+first failure, doubling after every consecutive failure of the same
+repository up to ``max_retry_delay``.
+"""
+import time
+import logging
+from sqlalchemy.orm import object_session
+from pecan import conf
+
+logger = logging.getLogger(__name__)
+
+# the Celery workers are started with ``celery -A async``, which is what
+# determines the names of the tasks
+task_names = {
+    'rpm': 'async.create_rpm_repo',
+    'deb': 'async.create_deb_repo',
+}
+
+_app = None
+
+# repo id -> last time a rebuild was published for it
+_published = {}
+
+# repo id -> how many builds in a row failed for it
+_failures = {}
+
+# the longest time (in seconds) to wait before retrying a failed build
+max_retry_delay = 3600
+
+
+def enabled():
+    """
+    Rebuilds are only published when a broker is configured
+    """
+    return bool(getattr(conf, 'broker_url', None))
+
+
+def get_app():
+    """
+    A Celery application used only to send tasks. It is created on first use
+    so that the web application does not need to connect to the broker unless
+    it is actually publishing something.
+    """
+    global _app
+    if _app is None:
+        from celery import Celery
+        _app = Celery('chacra.async', broker=conf.broker_url)
+    return _app
+
+
+def publish(repo_id, repo_type, force=False, countdown=None):
+    """
+    Ask the workers to rebuild a repository, unless a rebuild for it was
+    already published within ``quiet_time`` seconds and ``force`` is not set.
+    The task runs after ``countdown`` seconds, ``quiet_time`` by default.
+
+    Returns True if the request was sent.
+    """
+    if not enabled():
+        return False
+    task_name = task_names.get(repo_type)
+    if task_name is None:
+        logger.warning('got a repository with an unkown type: %s', repo_type)
+        return False
+
+    quiet_time = getattr(conf, 'quiet_time', 0)
+    now = time.time()
+    last_published = _published.get(repo_id)
+    recent = last_published is not None and now - last_published < quiet_time
+    if recent and not force:
+        logger.debug('rebuild for repo %s already queued', repo_id)
+        return False
+
+    if countdown is None:
+        countdown = quiet_time
+    try:
+        get_app().send_task(
+            task_name,
+            args=(repo_id,),
+            countdown=countdown,
+            retry=False,
+        )
+    except Exception:
+        # this is not fatal, the periodic poll will eventually pick it up
+        logger.exception('could not publish a rebuild for repo %s', repo_id)
+        return False
+    _published[repo_id] = now
+    logger.info('published rebuild for repo %s', repo_id)
+    return True
+
+
+def retry(repo_id, repo_type):
+    """
+    Publish a rebuild for a repository whose build just failed, so that it
+    does not depend on polling to be built again. Every consecutive failure
+    doubles the time to wait before the next attempt. Setting ``retry_delay``
+    to None disables retries.
+
+    Returns True if the request was sent.
+    """
+    delay = getattr(conf, 'retry_delay', 60)
+    if delay is None:
+        return False
+    failures = _failures.get(repo_id, 0)
+    _failures[repo_id] = failures + 1
+    countdown = min(delay * 2 ** failures, max_retry_delay)
+    logger.info('retrying the build of repo %s in %s seconds', repo_id, countdown)
+    return publish(repo_id, repo_type, force=True, countdown=countdown)
+
+
+def succeeded(repo_id):
+    """
+    The build of a repository went fine, so the next failure starts the
+    backoff over
+    """
+    _failures.pop(repo_id, None)
+
+
+def request(repo, session=None):
+    """
+    Record that ``repo`` needs to be rebuilt. Nothing is published until the
+    current transaction is committed, so that workers never see a repository
+    in a state that could still be rolled back.
+    """
+    session = session or object_session(repo)
+    if session is None or repo.id is None:
+        return
+    pending = session.info.setdefault('chacra.rebuilds', {})
+    pending[repo.id] = repo.type
+
+
+def publish_pending(session):
+    """
+    Publish every rebuild requested during the transaction that was just
+    committed.
+    """
+    pending = session.info.pop('chacra.rebuilds', {})
+    for repo_id, repo_type in sorted(pending.items()):
+        publish(repo_id, repo_type)
+
+
+def discard_pending(session):
+    session.info.pop('chacra.rebuilds', None)
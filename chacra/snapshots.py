@@ -0,0 +1,254 @@
+"""
+The ``/repos/`` discovery listings, and pre-rendered copies of them written
+to ``<repos_root>/.json`` so that the web server can serve them without going
+through the application.
+
+Files are laid out like the URLs they answer for, e.g. the listing for
+``/repos/ceph/master/`` goes to ``<repos_root>/.json/repos/ceph/master/index.json``.
+Only listings are written: the details of a single repository (like
+``needs_update``) change all the time.
+
+Snapshots are rewritten once a transaction that built, moved or removed
+repositories (or removed projects) is committed, by the web application or
+by the workers, and the directories of anything that no longer exists are
+removed so that the web server falls back to the application for them.
+"""
+import os
+import fcntl
+import shutil
+import logging
+from contextlib import contextmanager
+from sqlalchemy import orm
+from sqlalchemy.event import listen
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+from pecan import conf
+from pecan.jsonify import encode
+from chacra import models, util
+
+logger = logging.getLogger(__name__)
+
+
+# Listings, the same ones the /repos/ controllers return
+
+
+def projects_listing(session=None):
+    """
+    Every project with built repositories, with their refs
+    """
+    query = session.query(models.Project) if session else models.Project.query
+    projects = query.join(models.Repo).filter(
+        models.Repo.path != None  # noqa
+    )
+    return dict((project.name, project.repo_refs) for project in projects)
+
+
+def project_listing(project):
+    """
+    Every ref of ``project`` with the distros it has repositories for
+    """
+    resp = {}
+    for ref in project.repo_refs:
+        resp[ref] = list(set(
+            [r.distro for r in project.built_repos.filter_by(ref=ref).all()]
+        ))
+    return resp
+
+
+def ref_listing(project):
+    resp = {}
+    for distro in project.repo_distros:
+        resp[distro] = list(set(
+            [r.distro_version for r in
+                project.built_repos.filter_by(distro=distro).all()]
+        ))
+    return resp
+
+
+def distro_listing(project, distro):
+    return [
+        repo.distro_version for repo in
+        project.built_repos.filter_by(distro=distro).all()
+    ]
+
+
+# Snapshots
+
+
+def enabled():
+    return bool(getattr(conf, 'repos_root', None))
+
+
+def snapshots_root():
+    return os.path.join(conf.repos_root, '.json')
+
+
+def snapshot_path(*parts):
+    return os.path.join(snapshots_root(), 'repos', *(parts + ('index.json',)))
+
+
+def snapshot_dir(*parts):
+    return os.path.dirname(snapshot_path(*parts))
+
+
+@contextmanager
+def snapshots_lock():
+    """
+    Only one process at a time can write snapshots, so that the last one to
+    write them is also the last one that read the database
+    """
+    util.makedirs(snapshots_root())
+    with open(os.path.join(snapshots_root(), '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write_snapshot(listing, *parts):
+    util.write_atomically(snapshot_path(*parts), encode(listing))
+
+
+def prune(directory, names):
+    """
+    Remove the snapshots in ``directory`` for anything not in ``names``
+    """
+    # refs like 'wip/feature' are nested directories
+    keep = set(name.split('/')[0] for name in names)
+    try:
+        entries = os.listdir(directory)
+    except OSError:
+        return
+    for entry in entries:
+        path = os.path.join(directory, entry)
+        if entry not in keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def write_projects_snapshot(session=None):
+    listing = projects_listing(session)
+    write_snapshot(listing)
+    prune(snapshot_dir(), listing)
+
+
+def write_listings(project):
+    """
+    Write every listing of ``project``, which must be called with the
+    snapshots lock held. The ref and distro listings of a project include
+    every ref, so they are all written.
+    """
+    refs = project.repo_refs
+    if not refs:
+        # nothing to list, let the application answer for it
+        shutil.rmtree(snapshot_dir(project.name), ignore_errors=True)
+        return
+    write_snapshot(project_listing(project), project.name)
+    distros = project.repo_distros
+    ref_snapshot = ref_listing(project)
+    distro_snapshots = dict(
+        (distro, distro_listing(project, distro)) for distro in distros
+    )
+    for ref in refs:
+        write_snapshot(ref_snapshot, project.name, ref)
+        for distro in distros:
+            write_snapshot(distro_snapshots[distro], project.name, ref, distro)
+        prune(snapshot_dir(project.name, ref), distros)
+    prune(snapshot_dir(project.name), refs)
+
+
+def write_project_snapshots(project):
+    """
+    Write the listings of every project and the ones of ``project``
+    """
+    with snapshots_lock():
+        write_projects_snapshot(object_session(project))
+        write_listings(project)
+
+
+def update_snapshots(session, project_ids):
+    """
+    Rewrite the snapshots of the projects with ``project_ids`` (which may no
+    longer exist) reading them with ``session``. Failures are only logged,
+    snapshots are never required since the application can answer the same
+    requests.
+    """
+    try:
+        with snapshots_lock():
+            write_projects_snapshot(session)
+            for project_id in sorted(project_ids):
+                project = session.query(models.Project).get(project_id)
+                if project is not None:
+                    write_listings(project)
+    except Exception:
+        logger.exception('could not write snapshots for projects: %s', project_ids)
+
+
+# Listeners
+
+
+def request_update(target, project_id=None):
+    """
+    Record that the listings of the project of ``target`` changed, they are
+    rewritten once the transaction is committed
+    """
+    session = object_session(target)
+    if session is None:
+        return
+    if project_id is None:
+        project_id = target.project_id
+    session.info.setdefault('chacra.snapshots', set()).add(project_id)
+
+
+def repo_added(mapper, connection, target):
+    if target.path is not None:
+        request_update(target)
+
+
+def repo_changed(mapper, connection, target):
+    # only built repos are listed, by ref, distro and distro version
+    for key in ('path', 'ref', 'distro', 'distro_version', 'project_id'):
+        history = get_history(target, key)
+        if history.has_changes():
+            request_update(target)
+            if key == 'project_id' and history.deleted and history.deleted[0]:
+                request_update(target, project_id=history.deleted[0])
+
+
+def repo_removed(mapper, connection, target):
+    request_update(target)
+
+
+def project_changed(mapper, connection, target):
+    if get_history(target, 'name').has_changes():
+        request_update(target, project_id=target.id)
+
+
+def project_removed(mapper, connection, target):
+    request_update(target, project_id=target.id)
+
+
+def update_pending(session):
+    project_ids = session.info.pop('chacra.snapshots', None)
+    if not project_ids or not enabled():
+        return
+    # the session that was just committed cannot go to the database again
+    # until the commit is over, so the listings are read with a new one
+    reader = orm.Session(bind=session.get_bind())
+    try:
+        update_snapshots(reader, project_ids)
+    finally:
+        reader.close()
+
+
+def discard_pending(session):
+    session.info.pop('chacra.snapshots', None)
+
+
+listen(models.Repo, 'after_insert', repo_added)
+listen(models.Repo, 'after_update', repo_changed)
+listen(models.Repo, 'after_delete', repo_removed)
+listen(models.Project, 'after_update', project_changed)
+listen(models.Project, 'after_delete', project_removed)
+listen(models.Session, 'after_commit', update_pending)
+listen(models.Session, 'after_rollback', discard_pending)
@@ -244,3 +244,36 @@ class TestRepoCRUDOperations(object):
             expect_errors=True,
         )
         assert result.status_int == 404
+
+
+class TestRepoApiControllerConditional(object):
+
+    def create_repo(self, session):
+        p = Project('foobar')
+        repo = Repo(p, "firefly", "ubuntu", "trusty")
+        repo.path = "some_path"
+        session.commit()
+
+    def test_unchanged_repo_is_not_modified(self, session):
+        self.create_repo(session)
+        etag = session.app.get('/repos/foobar/firefly/ubuntu/trusty/').headers['ETag']
+        result = session.app.get(
+            '/repos/foobar/firefly/ubuntu/trusty/', headers={'If-None-Match': etag})
+        assert result.status_int == 304
+
+    def test_flagged_repo_changes_the_etag(self, session):
+        self.create_repo(session)
+        etag = session.app.get('/repos/foobar/firefly/ubuntu/trusty/').headers['ETag']
+        repos = Repo.__table__
+        session.Session.execute(repos.update().values(needs_update=False))
+        session.commit()
+        result = session.app.get(
+            '/repos/foobar/firefly/ubuntu/trusty/', headers={'If-None-Match': etag})
+        assert result.status_int == 200
+        assert result.json['needs_update'] is False
+
+    def test_repo_listing_is_not_modified(self, session):
+        self.create_repo(session)
+        etag = session.app.get('/repos/foobar/').headers['ETag']
+        result = session.app.get('/repos/foobar/', headers={'If-None-Match': etag})
+        assert result.status_int == 304
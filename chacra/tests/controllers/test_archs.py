@@ -1,3 +1,4 @@
+import json
 import pecan
 import os
 from chacra.models import Project, Binary
@@ -177,3 +178,191 @@ class TestArchController(object):
             upload_files=[('file', 'ceph-9.0.0-0.el6.x86_64.rpm', 'hello tharrrr')]
         )
         assert result.status_int == 201
+
+
+class TestArchControllerFields(object):
+
+    def create_binaries(self, session):
+        p = Project('ceph')
+        Binary('ceph-1.0.0.rpm', p, ref='giant', distro='centos', distro_version='el6', arch='x86_64', size=10)
+        Binary('ceph-1.0.1.rpm', p, ref='giant', distro='centos', distro_version='el6', arch='x86_64', size=20)
+        session.commit()
+
+    def test_only_requested_fields(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?fields=size')
+        assert result.json == {
+            'ceph-1.0.0.rpm': {'size': 10},
+            'ceph-1.0.1.rpm': {'size': 20},
+        }
+
+    def test_names_only(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?fields=name')
+        assert sorted(result.json.keys()) == ['ceph-1.0.0.rpm', 'ceph-1.0.1.rpm']
+        assert result.json['ceph-1.0.0.rpm'] == {'name': 'ceph-1.0.0.rpm'}
+
+    def test_last_changed_is_computed(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?fields=last_changed,size')
+        binary = result.json['ceph-1.0.0.rpm']
+        assert sorted(binary.keys()) == ['last_changed', 'size']
+        assert binary['last_changed'].endswith('ago')
+
+    def test_invalid_field(self, session):
+        self.create_binaries(session)
+        result = session.app.get(
+            '/binaries/ceph/giant/centos/el6/x86_64/?fields=size,password',
+            expect_errors=True)
+        assert result.status_int == 400
+
+    def test_no_binaries_with_fields(self, session):
+        Project('ceph')
+        session.commit()
+        result = session.app.get(
+            '/binaries/ceph/giant/centos/el6/x86_64/?fields=size',
+            expect_errors=True)
+        assert result.status_int == 404
+
+    def test_paginated_fields(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?fields=size&limit=1')
+        assert result.json == {'ceph-1.0.0.rpm': {'size': 10}}
+        cursor = result.headers['X-Next-Cursor']
+        result = session.app.get(
+            '/binaries/ceph/giant/centos/el6/x86_64/?fields=size&limit=1&cursor=%s' % cursor)
+        assert result.json == {'ceph-1.0.1.rpm': {'size': 20}}
+        assert 'X-Next-Cursor' not in result.headers
+
+    def test_paginated_binaries(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?limit=1&count=true')
+        assert list(result.json.keys()) == ['ceph-1.0.0.rpm']
+        assert result.headers['X-Total-Count'] == '2'
+
+    def test_stream_binaries(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?stream=json')
+        assert sorted(result.json.keys()) == ['ceph-1.0.0.rpm', 'ceph-1.0.1.rpm']
+        assert result.json['ceph-1.0.1.rpm']['size'] == 20
+
+    def test_stream_missing_arch(self, session):
+        Project('ceph')
+        session.commit()
+        result = session.app.get(
+            '/binaries/ceph/giant/centos/el6/x86_64/?stream=json',
+            expect_errors=True,
+        )
+        assert result.status_int == 404
+
+    def test_stream_fields_as_ndjson(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/binaries/ceph/giant/centos/el6/x86_64/?stream=ndjson&fields=size')
+        lines = [json.loads(l) for l in result.body.splitlines()]
+        assert lines == [
+            {'ceph-1.0.0.rpm': {'size': 10}},
+            {'ceph-1.0.1.rpm': {'size': 20}},
+        ]
+
+
+class TestArchControllerLatest(object):
+
+    def create_binaries(self, session, *names):
+        p = Project('ceph')
+        for name in names:
+            Binary(name, p, ref='giant', distro='centos', distro_version='el7', arch='x86_64')
+        session.commit()
+
+    def test_newest_version_per_package(self, session):
+        self.create_binaries(
+            session,
+            'ceph-0.94.10-0.el7.x86_64.rpm',
+            'ceph-0.94.9-0.el7.x86_64.rpm',
+            'ceph-0.94.10~rc1-0.el7.x86_64.rpm',
+            'librados2-0.94.9-0.el7.x86_64.rpm',
+        )
+        result = session.app.get('/binaries/ceph/giant/centos/el7/x86_64/latest/')
+        assert sorted(result.json.keys()) == [
+            'ceph-0.94.10-0.el7.x86_64.rpm',
+            'librados2-0.94.9-0.el7.x86_64.rpm',
+        ]
+
+    def test_newest_n_versions_of_a_package(self, session):
+        self.create_binaries(
+            session,
+            'ceph-0.94.10-0.el7.x86_64.rpm',
+            'ceph-0.94.9-0.el7.x86_64.rpm',
+            'ceph-0.94.8-0.el7.x86_64.rpm',
+            'librados2-0.94.9-0.el7.x86_64.rpm',
+        )
+        result = session.app.get('/binaries/ceph/giant/centos/el7/x86_64/latest/?name=ceph&n=2')
+        assert sorted(result.json.keys()) == [
+            'ceph-0.94.10-0.el7.x86_64.rpm',
+            'ceph-0.94.9-0.el7.x86_64.rpm',
+        ]
+
+    def test_binaries_without_versions_are_skipped(self, session):
+        self.create_binaries(session, 'ceph-1.0.rpm')
+        result = session.app.get('/binaries/ceph/giant/centos/el7/x86_64/latest/')
+        assert result.json == {}
+
+    def test_invalid_n(self, session):
+        self.create_binaries(session, 'ceph-0.94.9-0.el7.x86_64.rpm')
+        result = session.app.get(
+            '/binaries/ceph/giant/centos/el7/x86_64/latest/?n=0',
+            expect_errors=True)
+        assert result.status_int == 400
+
+
+class TestArchControllerConditional(object):
+
+    url = '/binaries/ceph/giant/centos/el6/x86_64/'
+
+    def create_binary(self, session, name='ceph-1.0.0.rpm'):
+        p = Project.query.filter_by(name='ceph').first() or Project('ceph')
+        Binary(name, p, ref='giant', distro='centos', distro_version='el6', arch='x86_64')
+        session.commit()
+
+    def test_validators_are_sent(self, session):
+        self.create_binary(session)
+        result = session.app.get(self.url)
+        assert result.headers['ETag']
+        assert result.headers['Last-Modified']
+
+    def test_unchanged_listing_is_not_modified(self, session):
+        self.create_binary(session)
+        etag = session.app.get(self.url).headers['ETag']
+        result = session.app.get(self.url, headers={'If-None-Match': etag})
+        assert result.status_int == 304
+        assert result.body == ''
+        assert result.headers['ETag'] == etag
+
+    def test_new_binaries_change_the_etag(self, session):
+        self.create_binary(session)
+        etag = session.app.get(self.url).headers['ETag']
+        self.create_binary(session, 'ceph-1.0.1.rpm')
+        result = session.app.get(self.url, headers={'If-None-Match': etag})
+        assert result.status_int == 200
+        assert len(result.json) == 2
+
+    def test_removed_binaries_change_the_etag(self, session):
+        self.create_binary(session)
+        self.create_binary(session, 'ceph-1.0.1.rpm')
+        etag = session.app.get(self.url).headers['ETag']
+        Binary.filter_by(name='ceph-1.0.1.rpm').first().delete()
+        session.commit()
+        result = session.app.get(self.url, headers={'If-None-Match': etag})
+        assert result.status_int == 200
+        assert len(result.json) == 1
+
+    def test_if_modified_since(self, session):
+        self.create_binary(session)
+        last_modified = session.app.get(self.url).headers['Last-Modified']
+        result = session.app.get(self.url, headers={'If-Modified-Since': last_modified})
+        assert result.status_int == 304
+
+    def test_if_modified_since_in_the_past(self, session):
+        self.create_binary(session)
+        result = session.app.get(
+            self.url, headers={'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+        assert result.status_int == 200
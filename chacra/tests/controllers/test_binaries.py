@@ -273,3 +273,17 @@ class TestBinaryController(object):
         response = session.app.get('/binaries/ceph/giant/ceph/el6/x86_64/').json
         result = response['ceph-9.0.0-0.el6.x86_64.rpm']['checksum']
         assert result.startswith('a5725e467')
+
+    def test_checksum_from_json_is_not_trusted(self, session, tmpdir):
+        pecan.conf.binary_root = str(tmpdir)
+        session.app.post(
+            '/binaries/ceph/giant/ceph/el6/x86_64/',
+            upload_files=[('file', 'ceph-9.0.0-0.el6.x86_64.rpm', 'hello tharrrr')]
+        )
+        session.app.post_json(
+            '/binaries/ceph/giant/ceph/el6/x86_64/ceph-9.0.0-0.el6.x86_64.rpm/',
+            params={'force': True, 'checksum': 'abc123'}
+        )
+        response = session.app.get('/binaries/ceph/giant/ceph/el6/x86_64/').json
+        result = response['ceph-9.0.0-0.el6.x86_64.rpm']['checksum']
+        assert result.startswith('318b')
@@ -1,3 +1,5 @@
+import json
+import pytest
 from chacra.models import Project, Binary
 
 
@@ -57,3 +59,110 @@ class TestProjectController(object):
         session.commit()
         result = session.app.get('/binaries/foobar/')
         assert result.json == {'firefly': ['centos'], 'master': ['centos']}
+
+
+class TestProjectsControllerConditional(object):
+
+    def test_new_projects_change_the_etag(self, session):
+        Project('foobar')
+        session.commit()
+        etag = session.app.get('/binaries/').headers['ETag']
+        Project('ceph')
+        session.commit()
+        result = session.app.get('/binaries/', headers={'If-None-Match': etag})
+        assert result.status_int == 200
+        assert len(result.json) == 2
+
+    def test_unchanged_project_is_not_modified(self, session):
+        p = Project('foobar')
+        Binary('ceph-1.0.0.rpm', p, ref='giant', distro='centos', distro_version='el6', arch='x86_64')
+        session.commit()
+        etag = session.app.get('/binaries/foobar/').headers['ETag']
+        result = session.app.get('/binaries/foobar/', headers={'If-None-Match': etag})
+        assert result.status_int == 304
+
+
+class TestProjectControllerBulk(object):
+
+    @pytest.fixture(autouse=True)
+    def binaries_dir(self, tmpdir):
+        self.tmpdir = tmpdir
+
+    def binaries(self, *names):
+        binaries = []
+        for name in names:
+            path = self.tmpdir.join(name)
+            path.write(name)
+            binaries.append(dict(
+                name=name, ref='master', distro='centos',
+                distro_version='7', arch='x86_64', path=str(path),
+            ))
+        return binaries
+
+    def test_creates_binaries(self, session):
+        Project('ceph')
+        session.commit()
+        result = session.app.post_json(
+            '/binaries/ceph/bulk/',
+            params=self.binaries('ceph-1.0-0.el7.x86_64.rpm', 'ceph-2.0-0.el7.x86_64.rpm')
+        )
+        assert result.json == dict(created=2, updated=0, unchanged=0)
+        assert Binary.query.count() == 2
+
+    def test_accepts_ndjson(self, session):
+        Project('ceph')
+        session.commit()
+        body = '\n'.join(
+            json.dumps(b) for b in self.binaries('ceph-1.0-0.el7.x86_64.rpm')
+        )
+        result = session.app.post(
+            '/binaries/ceph/bulk/', params=body,
+            content_type='application/x-ndjson',
+        )
+        assert result.json['created'] == 1
+
+    def test_invalid_binaries(self, session):
+        Project('ceph')
+        session.commit()
+        result = session.app.post_json(
+            '/binaries/ceph/bulk/', params=[dict(name='ceph.rpm')],
+            expect_errors=True,
+        )
+        assert result.status_int == 400
+        assert Binary.query.count() == 0
+
+    def test_non_string_values(self, session):
+        Project('ceph')
+        session.commit()
+        binaries = self.binaries('ceph-1.0-0.el7.x86_64.rpm')
+        binaries[0]['distro_version'] = 7
+        result = session.app.post_json(
+            '/binaries/ceph/bulk/', params=binaries, expect_errors=True,
+        )
+        assert result.status_int == 400
+
+    def test_missing_files(self, session):
+        Project('ceph')
+        session.commit()
+        binaries = self.binaries('ceph-1.0-0.el7.x86_64.rpm')
+        binaries[0]['path'] = str(self.tmpdir.join('missing.rpm'))
+        result = session.app.post_json(
+            '/binaries/ceph/bulk/', params=binaries, expect_errors=True,
+        )
+        assert result.status_int == 400
+        assert Binary.query.count() == 0
+
+    def test_only_post_is_allowed(self, session):
+        Project('ceph')
+        session.commit()
+        result = session.app.put('/binaries/ceph/bulk/', expect_errors=True)
+        assert result.status_int == 405
+
+    def test_requires_authentication(self, session):
+        Project('ceph')
+        session.commit()
+        result = session.app.post_json(
+            '/binaries/ceph/bulk/', params=self.binaries('ceph-1.0-0.el7.x86_64.rpm'),
+            headers={'Authorization': 'Basic invalid'}, expect_errors=True,
+        )
+        assert result.status_int == 401
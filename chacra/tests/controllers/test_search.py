@@ -1,3 +1,4 @@
+import json
 import pecan
 import os
 from chacra.models import Project, Binary
@@ -37,3 +38,238 @@ class TestSearchController(object):
         session.commit()
         result = session.app.get('/search/?distro=centos')
         assert len(result.json) == 2
+
+
+class TestSearchPagination(object):
+
+    def create_binaries(self, session, count=5):
+        project = Project('ceph')
+        for i in range(count):
+            Binary('ceph-1.0.%d.rpm' % i, project, ref='giant', distro='centos', distro_version='el7', arch='x86_64')
+        session.commit()
+
+    def test_limit(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&limit=2')
+        assert [b['name'] for b in result.json] == ['ceph-1.0.0.rpm', 'ceph-1.0.1.rpm']
+        assert result.headers['X-Next-Cursor']
+
+    def test_follow_the_cursor(self, session):
+        self.create_binaries(session)
+        names = []
+        url = '/search/?distro=centos&limit=2'
+        while url:
+            result = session.app.get(url)
+            names.extend(b['name'] for b in result.json)
+            cursor = result.headers.get('X-Next-Cursor')
+            url = '/search/?distro=centos&limit=2&cursor=%s' % cursor if cursor else None
+        assert names == ['ceph-1.0.%d.rpm' % i for i in range(5)]
+
+    def test_follow_the_cursor_by_modified(self, session):
+        self.create_binaries(session)
+        binary = Binary.query.filter_by(name='ceph-1.0.0.rpm').one()
+        binary.built_by = 'alfredo'
+        session.commit()
+        names = []
+        url = '/search/?distro=centos&limit=3&order=modified'
+        while url:
+            result = session.app.get(url)
+            names.extend(b['name'] for b in result.json)
+            cursor = result.headers.get('X-Next-Cursor')
+            url = '/search/?distro=centos&limit=3&order=modified&cursor=%s' % cursor if cursor else None
+        assert names == ['ceph-1.0.%d.rpm' % i for i in range(1, 5)] + ['ceph-1.0.0.rpm']
+
+    def test_last_page_has_no_cursor(self, session):
+        self.create_binaries(session, count=2)
+        result = session.app.get('/search/?distro=centos&limit=2')
+        assert 'X-Next-Cursor' not in result.headers
+
+    def test_count_only_on_request(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&limit=2')
+        assert 'X-Total-Count' not in result.headers
+        result = session.app.get('/search/?distro=centos&limit=2&count=1')
+        assert result.headers['X-Total-Count'] == '5'
+
+    def test_limit_is_capped_by_the_page_size(self, session):
+        self.create_binaries(session)
+        pecan.conf.page_size = 3
+        try:
+            result = session.app.get('/search/?distro=centos&limit=100')
+        finally:
+            pecan.conf.page_size = 1000
+        assert len(result.json) == 3
+
+    def test_invalid_limit(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&limit=none', expect_errors=True)
+        assert result.status_int == 400
+
+    def test_invalid_cursor(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&cursor=garbage', expect_errors=True)
+        assert result.status_int == 400
+
+    def test_cursor_for_another_order(self, session):
+        self.create_binaries(session)
+        cursor = session.app.get('/search/?distro=centos&limit=2').headers['X-Next-Cursor']
+        result = session.app.get(
+            '/search/?distro=centos&order=modified&cursor=%s' % cursor,
+            expect_errors=True)
+        assert result.status_int == 400
+
+
+class TestSearchStreaming(object):
+
+    def create_binaries(self, session, count=3):
+        project = Project('ceph')
+        for i in range(count):
+            Binary('ceph-1.0.%d.rpm' % i, project, ref='giant', distro='centos', distro_version='el7', arch='x86_64')
+        session.commit()
+
+    def test_stream_json(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&stream=json')
+        assert result.content_type == 'application/json'
+        assert [b['name'] for b in result.json] == ['ceph-1.0.%d.rpm' % i for i in range(3)]
+
+    def test_stream_ndjson(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&stream=ndjson')
+        assert result.content_type == 'application/x-ndjson'
+        lines = result.body.splitlines()
+        assert [json.loads(l)['name'] for l in lines] == ['ceph-1.0.%d.rpm' % i for i in range(3)]
+
+    def test_stream_is_not_paginated(self, session):
+        self.create_binaries(session)
+        pecan.conf.page_size = 2
+        try:
+            result = session.app.get('/search/?distro=centos&stream=json')
+        finally:
+            pecan.conf.page_size = 1000
+        assert len(result.json) == 3
+
+    def test_stream_no_results(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=solaris&stream=json')
+        assert result.json == []
+
+    def test_invalid_stream_format(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro=centos&stream=xml', expect_errors=True)
+        assert result.status_int == 400
+
+
+class TestSearchOperators(object):
+
+    def create_binaries(self, session):
+        ceph = Project('ceph')
+        Binary('ceph-1.0.0.rpm', ceph, ref='giant', distro='centos', distro_version='el7', arch='x86_64', size=10)
+        Binary('ceph-1.0.0.deb', ceph, ref='giant', distro='ubuntu', distro_version='trusty', arch='x86_64', size=20)
+        Binary('ceph-deploy-1.0.deb', ceph, ref='giant', distro='debian', distro_version='wheezy', arch='all', size=30)
+        Binary('radosgw-agent-1.0.deb', Project('radosgw-agent'), ref='master', distro='ubuntu', distro_version='trusty', arch='all', size=40)
+        session.commit()
+
+    def names(self, result):
+        return sorted(b['name'] for b in result.json)
+
+    def test_size_gt(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?size-gt=20')
+        assert self.names(result) == ['ceph-deploy-1.0.deb', 'radosgw-agent-1.0.deb']
+
+    def test_size_range(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?size-gte=20&size-lt=40')
+        assert self.names(result) == ['ceph-1.0.0.deb', 'ceph-deploy-1.0.deb']
+
+    def test_distro_in(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?distro-in=centos,debian')
+        assert self.names(result) == ['ceph-1.0.0.rpm', 'ceph-deploy-1.0.deb']
+
+    def test_name_startswith(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?name-startswith=ceph-deploy')
+        assert self.names(result) == ['ceph-deploy-1.0.deb']
+
+    def test_name_startswith_escapes_wildcards(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?name-startswith=ceph%25')
+        assert result.json == []
+
+    def test_name_like(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?name-like=%25.deb')
+        assert self.names(result) == [
+            'ceph-1.0.0.deb', 'ceph-deploy-1.0.deb', 'radosgw-agent-1.0.deb'
+        ]
+
+    def test_created_since(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?created-gte=2000-01-01&distro=ubuntu')
+        assert len(result.json) == 2
+        result = session.app.get('/search/?created-gte=3000-01-01T00:00:00&distro=ubuntu')
+        assert result.json == []
+
+    def test_project(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?project=radosgw-agent')
+        assert self.names(result) == ['radosgw-agent-1.0.deb']
+
+    def test_latest_first(self, session):
+        self.create_binaries(session)
+        binary = Binary.query.filter_by(name='ceph-1.0.0.rpm').one()
+        binary.built_by = 'alfredo'
+        session.commit()
+        result = session.app.get('/search/?project=ceph&order=-modified&limit=1')
+        assert result.json[0]['name'] == 'ceph-1.0.0.rpm'
+
+    def test_descending_pages(self, session):
+        self.create_binaries(session)
+        names = []
+        url = '/search/?size-gt=0&order=-size&limit=3'
+        while url:
+            result = session.app.get(url)
+            names.extend(b['name'] for b in result.json)
+            cursor = result.headers.get('X-Next-Cursor')
+            url = '/search/?size-gt=0&order=-size&limit=3&cursor=%s' % cursor if cursor else None
+        assert names == [
+            'radosgw-agent-1.0.deb', 'ceph-deploy-1.0.deb',
+            'ceph-1.0.0.deb', 'ceph-1.0.0.rpm'
+        ]
+
+    def test_invalid_operator(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?size-between=1', expect_errors=True)
+        assert result.status_int == 405
+
+    def test_invalid_value(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?size-gt=big', expect_errors=True)
+        assert result.status_int == 400
+
+    def test_text_operators_need_text(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?size-like=1%25', expect_errors=True)
+        assert result.status_int == 400
+
+    def test_invalid_date(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?created-gt=yesterday', expect_errors=True)
+        assert result.status_int == 400
+
+    def test_name_contains(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?name-contains=deploy')
+        assert self.names(result) == ['ceph-deploy-1.0.deb']
+
+    def test_name_contains_escapes_wildcards(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?name-contains=%25')
+        assert result.json == []
+
+    def test_similar_only_for_names(self, session):
+        self.create_binaries(session)
+        result = session.app.get('/search/?ref-similar=gaint', expect_errors=True)
+        assert result.status_int == 400
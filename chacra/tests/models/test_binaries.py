@@ -1,4 +1,9 @@
+import pytest
+import os
+import hashlib
+from sqlalchemy.exc import IntegrityError
 from chacra.models import Binary, Project, Repo
+from chacra import versions
 
 
 class TestBinaryModification(object):
@@ -144,3 +149,272 @@ class TestBinaryModification(object):
             arch='amd64',
             )
         assert repo.type == 'deb'
+
+
+class TestBinaryChecksum(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def write_binary(self, tmpdir, contents='binary contents'):
+        path = str(tmpdir.join('ceph-1.0.rpm'))
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_checksum_is_computed_from_path(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == hashlib.sha512('binary contents').hexdigest()
+
+    def test_given_checksum_is_not_recomputed(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            checksums={'sha512': 'abc123', 'sha256': 'abc', 'md5': 'ab'},
+            )
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == 'abc123'
+
+    def test_given_checksums_are_not_recomputed_on_update(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        binary = Binary.get(1)
+        binary.set_checksums({'sha512': 'abc123', 'sha256': 'abc', 'md5': 'ab'})
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == 'abc123'
+
+    def test_checksum_set_directly_is_recomputed(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        binary = Binary.get(1)
+        binary.update_from_json({'checksum': 'abc123'})
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == hashlib.sha512('binary contents').hexdigest()
+        assert binary.sha256 == hashlib.sha256('binary contents').hexdigest()
+
+    def test_checksum_is_not_an_allowed_key(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            checksum='abc123',
+            )
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == hashlib.sha512('binary contents').hexdigest()
+
+    def test_checksum_is_not_recomputed_on_metadata_update(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        # whole seconds survive a round trip through os.utime
+        os.utime(path, (1000000000, 1000000000))
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        # sneak different contents in without changing size or mtime, so that
+        # a recomputed checksum would be noticed
+        self.write_binary(tmpdir, contents='sneaky contents')
+        os.utime(path, (1000000000, 1000000000))
+        binary = Binary.get(1)
+        binary.built_by = 'alfredo'
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == hashlib.sha512('binary contents').hexdigest()
+
+    def test_checksum_is_recomputed_when_file_changes(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        self.write_binary(tmpdir, contents='new binary contents')
+        binary = Binary.get(1)
+        binary.built_by = 'alfredo'
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == hashlib.sha512('new binary contents').hexdigest()
+
+    def test_checksum_follows_path_changes(self, session, tmpdir):
+        paths = []
+        for name in ('a', 'b', 'c'):
+            path = str(tmpdir.join('ceph-1.0-%s.rpm' % name))
+            with open(path, 'w') as f:
+                f.write('contents %s' % name)
+            paths.append(path)
+        binary = Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=paths[0],
+            )
+        session.commit()
+        # the same instance, so nothing from earlier flushes is reloaded
+        for name, path in zip(('b', 'c'), paths[1:]):
+            binary.path = path
+            session.commit()
+            assert binary.checksum == hashlib.sha512('contents %s' % name).hexdigest()
+            assert binary.md5 == hashlib.md5('contents %s' % name).hexdigest()
+
+    def test_fingerprint_is_stored(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.fingerprint.startswith('15-')
+
+    def test_all_checksums_are_computed(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            )
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.sha256 == hashlib.sha256('binary contents').hexdigest()
+        assert binary.md5 == hashlib.md5('binary contents').hexdigest()
+
+    def test_given_checksums_are_used(self, session, tmpdir):
+        path = self.write_binary(tmpdir)
+        Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            path=path,
+            checksums={'sha512': 'abc', 'sha256': 'def', 'md5': 'ghi'},
+            )
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.checksum == 'abc'
+        assert binary.sha256 == 'def'
+        assert binary.md5 == 'ghi'
+
+
+class TestBinaryUniqueness(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def create_binary(self, arch='x86_64'):
+        return Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            ref='firefly',
+            distro='centos',
+            distro_version='7',
+            arch=arch,
+            )
+
+    def test_same_name_in_another_arch(self, session):
+        self.create_binary()
+        self.create_binary(arch='noarch')
+        session.commit()
+        assert Binary.query.count() == 2
+
+    def test_same_name_in_the_same_arch_is_rejected(self, session):
+        self.create_binary()
+        session.commit()
+        with pytest.raises(IntegrityError):
+            self.create_binary()
+            session.commit()
+        session.rollback()
+
+
+class TestBinaryPackageVersion(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def create_binary(self, name):
+        return Binary(
+            name,
+            self.p,
+            ref='firefly',
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            )
+
+    def test_package_version_is_set_on_insert(self, session):
+        self.create_binary('ceph-common-0.94.5-0.el7.x86_64.rpm')
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.package_name == 'ceph-common'
+        assert binary.version_key == versions.rpm_version_key('0.94.5', '0.el7')
+
+    def test_package_version_follows_renames(self, session):
+        self.create_binary('ceph-0.94.5-0.el7.x86_64.rpm')
+        session.commit()
+        binary = Binary.get(1)
+        binary.name = 'ceph-0.94.6-0.el7.x86_64.rpm'
+        session.commit()
+        assert Binary.get(1).version_key == versions.rpm_version_key('0.94.6', '0.el7')
+
+    def test_unknown_names_have_no_version(self, session):
+        self.create_binary('ceph-1.0.rpm')
+        session.commit()
+        binary = Binary.get(1)
+        assert binary.package_name is None
+        assert binary.version_key is None
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from chacra import models
+from chacra.models import Binary, name_index
+
+
+class TestSQLiteNameIndex(object):
+
+    def setup(self):
+        self.engine = create_engine('sqlite://')
+        models.Base.metadata.create_all(self.engine)
+        self.session = Session(bind=self.engine)
+        binaries = Binary.__table__
+        for i, name in enumerate(['ceph-1.0.deb', 'radosgw-agent-1.0.deb', 'ceph-deploy-1.0.deb']):
+            self.engine.execute(binaries.insert().values(
+                id=i + 1, name=name, distro='ubuntu', distro_version='trusty', arch='all'
+            ))
+
+    def teardown(self):
+        self.session.close()
+        models.Base.metadata.drop_all(self.engine)
+
+    def search(self, condition):
+        return sorted(
+            name for (name,) in self.session.query(Binary.name).filter(condition)
+        )
+
+    def test_index_is_created(self):
+        assert name_index.is_available(self.session.connection()) is True
+
+    def test_contains_uses_the_index(self):
+        condition = name_index.contains(self.session, 'gw-ag')
+        assert 'binaries_name_fts' in str(condition)
+        assert self.search(condition) == ['radosgw-agent-1.0.deb']
+
+    def test_contains_after_renaming(self):
+        binaries = Binary.__table__
+        self.engine.execute(
+            binaries.update().where(binaries.c.id == 1).values(name='librados-1.0.deb')
+        )
+        assert self.search(name_index.contains(self.session, 'rados')) == [
+            'librados-1.0.deb', 'radosgw-agent-1.0.deb'
+        ]
+        assert self.search(name_index.contains(self.session, 'ceph-1')) == []
+
+    def test_contains_after_deleting(self):
+        binaries = Binary.__table__
+        self.engine.execute(binaries.delete().where(binaries.c.id == 3))
+        assert self.search(name_index.contains(self.session, 'deploy')) == []
+
+    def test_short_values_do_not_use_the_index(self):
+        condition = name_index.contains(self.session, 'gw')
+        assert 'binaries_name_fts' not in str(condition)
+        assert self.search(condition) == ['radosgw-agent-1.0.deb']
+
+    def test_similar_is_not_supported(self):
+        with pytest.raises(ValueError):
+            name_index.similar(self.session, 'radosgw')
+
+
+class TestSimilarityCondition(object):
+
+    def test_binds_with_psycopg2(self, session):
+        connection = session.Session.connection()
+        condition = name_index.similarity_condition(connection.dialect, 'rados')
+        compiled = condition.compile(dialect=connection.dialect)
+        # psycopg2 fails to bind parameters next to an unescaped '%'
+        cursor = connection.connection.cursor()
+        sql = cursor.mogrify(str(compiled), compiled.params)
+        assert sql == "binaries.name % 'rados'"
+
+    def test_not_escaped_for_other_paramstyles(self):
+        engine = create_engine('sqlite://')
+        condition = name_index.similarity_condition(engine.dialect, 'rados')
+        assert str(condition.compile(dialect=engine.dialect)) == 'binaries.name % ?'
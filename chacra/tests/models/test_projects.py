@@ -0,0 +1,62 @@
+from chacra.models import Binary, Project
+
+
+class TestProjectDistinctValues(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def create_binaries(self):
+        for name, ref, distro, version, arch in [
+                ('ceph-1.0.deb', 'firefly', 'ubuntu', 'trusty', 'x86_64'),
+                ('ceph-1.1.deb', 'firefly', 'ubuntu', 'trusty', 'x86_64'),
+                ('ceph-1.0.rpm', 'firefly', 'centos', '7', 'x86_64'),
+                ('ceph-2.0.rpm', 'hammer', 'centos', '7', 'noarch')]:
+            Binary(
+                name,
+                self.p,
+                ref=ref,
+                distro=distro,
+                distro_version=version,
+                arch=arch,
+            )
+
+    def test_archs(self, session):
+        self.create_binaries()
+        session.commit()
+        assert sorted(Project.get(1).archs) == ['noarch', 'x86_64']
+
+    def test_distro_versions(self, session):
+        self.create_binaries()
+        session.commit()
+        assert sorted(Project.get(1).distro_versions) == ['7', 'trusty']
+
+    def test_distros(self, session):
+        self.create_binaries()
+        session.commit()
+        assert sorted(Project.get(1).distros) == ['centos', 'ubuntu']
+
+    def test_refs(self, session):
+        self.create_binaries()
+        session.commit()
+        assert sorted(Project.get(1).refs) == ['firefly', 'hammer']
+
+    def test_values_from_other_projects_are_ignored(self, session):
+        self.create_binaries()
+        Binary(
+            'radosgw-1.0.deb',
+            Project('radosgw'),
+            ref='giant',
+            distro='debian',
+            distro_version='wheezy',
+            arch='i386',
+        )
+        session.commit()
+        assert sorted(Project.get(1).refs) == ['firefly', 'hammer']
+
+    def test_json_groups_distros_by_ref(self, session):
+        self.create_binaries()
+        session.commit()
+        result = Project.get(1).__json__()
+        assert sorted(result['firefly']) == ['centos', 'ubuntu']
+        assert result['hammer'] == ['centos']
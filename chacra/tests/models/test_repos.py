@@ -1,4 +1,6 @@
+import datetime
 from chacra.models import Project, Repo
+from chacra.models.repos import acquire_build_lease, release_build_lease
 
 
 class TestRepoModification(object):
@@ -29,3 +31,74 @@ class TestRepoModification(object):
         session.commit()
 
         assert initial_timestamp < repo.modified.time()
+
+
+class TestBuildLease(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def create_repo(self, session, needs_update=True):
+        repo = Repo(
+            self.p,
+            ref='firefly',
+            distro='centos',
+            distro_version='7',
+            )
+        repo.needs_update = needs_update
+        session.commit()
+        return 1
+
+    def test_acquire_clears_needs_update(self, session):
+        repo_id = self.create_repo(session)
+        assert acquire_build_lease(repo_id) is True
+        repo = Repo.get(repo_id)
+        assert repo.needs_update is False
+        assert repo.building_since is not None
+
+    def test_acquire_needs_a_flagged_repo(self, session):
+        repo_id = self.create_repo(session, needs_update=False)
+        assert acquire_build_lease(repo_id) is False
+
+    def test_acquire_missing_repo(self, session):
+        assert acquire_build_lease(100) is False
+
+    def test_only_one_build_at_a_time(self, session):
+        repo_id = self.create_repo(session)
+        assert acquire_build_lease(repo_id) is True
+        # flagged again while building
+        repo = Repo.get(repo_id)
+        repo.needs_update = True
+        session.commit()
+        assert acquire_build_lease(repo_id) is False
+
+    def test_expired_lease_can_be_taken_over(self, session):
+        repo_id = self.create_repo(session)
+        assert acquire_build_lease(repo_id) is True
+        repo = Repo.get(repo_id)
+        repo.building_since = datetime.datetime.utcnow() - datetime.timedelta(hours=2)
+        session.commit()
+        assert acquire_build_lease(repo_id, timeout=3600) is True
+
+    def test_release_without_changes(self, session):
+        repo_id = self.create_repo(session)
+        acquire_build_lease(repo_id)
+        assert release_build_lease(repo_id) is False
+        repo = Repo.get(repo_id)
+        assert repo.building_since is None
+        assert repo.needs_update is False
+
+    def test_release_after_changes_needs_a_follow_up(self, session):
+        repo_id = self.create_repo(session)
+        acquire_build_lease(repo_id)
+        repo = Repo.get(repo_id)
+        repo.needs_update = True
+        session.commit()
+        assert release_build_lease(repo_id) is True
+        assert acquire_build_lease(repo_id) is True
+
+    def test_failed_build_flags_the_repo(self, session):
+        repo_id = self.create_repo(session)
+        acquire_build_lease(repo_id)
+        assert release_build_lease(repo_id, failed=True) is False
+        assert Repo.get(repo_id).needs_update is True
@@ -0,0 +1,74 @@
+from chacra.models import Binary, BinarySummary, Project
+
+
+class TestBinarySummaries(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def create_binary(self, name='ceph-1.0.deb', arch='x86_64', size=10):
+        return Binary(
+            name,
+            self.p,
+            ref='firefly',
+            distro='ubuntu',
+            distro_version='trusty',
+            arch=arch,
+            size=size,
+        )
+
+    def test_new_binary_creates_a_summary(self, session):
+        self.create_binary()
+        session.commit()
+        summary = BinarySummary.query.one()
+        assert summary.project.name == 'ceph'
+        assert summary.ref == 'firefly'
+        assert summary.distro == 'ubuntu'
+        assert summary.distro_version == 'trusty'
+        assert summary.arch == 'x86_64'
+        assert summary.binary_count == 1
+        assert summary.total_size == 10
+        assert summary.last_modified is not None
+
+    def test_binaries_in_the_same_arch_share_a_summary(self, session):
+        self.create_binary('ceph-1.0.deb')
+        self.create_binary('ceph-1.1.deb', size=5)
+        session.commit()
+        summary = BinarySummary.query.one()
+        assert summary.binary_count == 2
+        assert summary.total_size == 15
+
+    def test_every_arch_gets_a_summary(self, session):
+        self.create_binary('ceph-1.0.deb')
+        self.create_binary('ceph-1.0.deb', arch='i386')
+        session.commit()
+        assert BinarySummary.query.count() == 2
+
+    def test_size_changes_are_summarized(self, session):
+        self.create_binary()
+        session.commit()
+        binary = Binary.get(1)
+        binary.size = 100
+        session.commit()
+        assert BinarySummary.query.one().total_size == 100
+
+    def test_moving_a_binary_moves_its_summary(self, session):
+        self.create_binary()
+        session.commit()
+        binary = Binary.get(1)
+        binary.arch = 'i386'
+        session.commit()
+        summary = BinarySummary.query.one()
+        assert summary.arch == 'i386'
+        assert summary.binary_count == 1
+
+    def test_removing_the_last_binary_removes_the_summary(self, session):
+        self.create_binary('ceph-1.0.deb')
+        self.create_binary('ceph-1.1.deb')
+        session.commit()
+        Binary.get(1).delete()
+        session.commit()
+        assert BinarySummary.query.one().binary_count == 1
+        Binary.get(2).delete()
+        session.commit()
+        assert BinarySummary.query.count() == 0
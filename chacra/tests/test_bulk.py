@@ -0,0 +1,171 @@
+import pytest
+from chacra import bulk
+from chacra.models import Project, Binary, BinarySummary, Repo
+
+
+def descriptor(name='ceph-1.0-0.el7.x86_64.rpm', **kw):
+    values = dict(
+        name=name, ref='master', distro='centos',
+        distro_version='7', arch='x86_64', path='/binaries/%s' % name,
+    )
+    values.update(kw)
+    return values
+
+
+def on_disk(tmpdir, name='ceph-1.0-0.el7.x86_64.rpm', contents='data', **kw):
+    path = tmpdir.join(name)
+    path.write(contents)
+    return descriptor(name, path=str(path), **kw)
+
+
+def fake_hash_files(paths):
+    fake_hash_files.calls.append(list(paths))
+    return dict(
+        (path, dict(sha512='sha512', sha256='sha256', md5='md5'))
+        for path in paths
+    )
+
+
+@pytest.fixture
+def hashed(request):
+    fake_hash_files.calls = []
+    return fake_hash_files
+
+
+class TestValidate(object):
+
+    def test_requires_a_list(self):
+        with pytest.raises(ValueError):
+            bulk.validate({'name': 'ceph'})
+
+    def test_requires_objects(self):
+        with pytest.raises(ValueError):
+            bulk.validate(['ceph'])
+
+    def test_path_is_required(self):
+        values = descriptor()
+        del values['path']
+        with pytest.raises(ValueError) as exc:
+            bulk.validate([values])
+        assert 'path' in str(exc.value)
+
+    def test_missing_keys(self):
+        with pytest.raises(ValueError) as exc:
+            bulk.validate([dict(name='ceph.rpm')])
+        assert 'ref' in str(exc.value)
+
+    def test_invalid_keys(self):
+        with pytest.raises(ValueError) as exc:
+            bulk.validate([descriptor(project_id=1)])
+        assert 'project_id' in str(exc.value)
+
+    @pytest.mark.parametrize('key, value', [
+        ('distro_version', 7),
+        ('name', ['ceph.rpm']),
+        ('path', None),
+        ('built_by', {'name': 'jenkins'}),
+    ])
+    def test_values_must_be_strings(self, key, value):
+        with pytest.raises(ValueError) as exc:
+            bulk.validate([descriptor(**{key: value})])
+        assert key in str(exc.value)
+
+    @pytest.mark.parametrize('size', ['big', -1, True, None, 1.5, '-1'])
+    def test_invalid_sizes(self, size):
+        with pytest.raises(ValueError):
+            bulk.validate([descriptor(size=size)])
+
+    def test_sizes_are_integers(self):
+        result = bulk.validate([descriptor(size='10')])
+        assert list(result.values())[0]['size'] == 10
+
+    def test_duplicates_keep_the_last_one(self):
+        result = bulk.validate([descriptor(size=1), descriptor(size=2)])
+        assert len(result) == 1
+        assert list(result.values())[0]['size'] == 2
+
+
+class TestRegisterBinaries(object):
+
+    def test_nothing_to_do(self, session):
+        p = Project('ceph')
+        session.commit()
+        assert bulk.register_binaries(p, []) == dict(created=0, updated=0, unchanged=0)
+
+    def test_creates_binaries(self, session, tmpdir, hashed):
+        path = tmpdir.join('ceph-1.0-0.el7.x86_64.rpm')
+        path.write('data')
+        p = Project('ceph')
+        session.commit()
+        result = bulk.register_binaries(p, [descriptor(path=str(path))], hash_files=hashed)
+        session.commit()
+        assert result == dict(created=1, updated=0, unchanged=0)
+        binary = Binary.get(1)
+        assert binary.project.name == 'ceph'
+        assert binary.size == 4
+        assert binary.checksum == 'sha512'
+        assert binary.fingerprint is not None
+        assert binary.package_name == 'ceph'
+        assert binary.repo.ref == 'master'
+        assert binary.repo.type == 'rpm'
+        assert hashed.calls == [[str(path)]]
+
+    def test_flags_the_repo(self, session, tmpdir, hashed):
+        p = Project('ceph')
+        session.commit()
+        bulk.register_binaries(p, [on_disk(tmpdir)], hash_files=hashed)
+        session.commit()
+        assert Repo.query.one().needs_update is True
+
+    def test_updates_summaries(self, session, tmpdir, hashed):
+        p = Project('ceph')
+        session.commit()
+        bulk.register_binaries(p, [
+            on_disk(tmpdir, size=10),
+            on_disk(tmpdir, 'ceph-2.0-0.el7.x86_64.rpm', size=5),
+        ], hash_files=hashed)
+        session.commit()
+        summary = BinarySummary.query.one()
+        assert summary.binary_count == 2
+        assert summary.total_size == 15
+
+    def test_unchanged_files_are_not_hashed_again(self, session, tmpdir, hashed):
+        path = tmpdir.join('ceph-1.0-0.el7.x86_64.rpm')
+        path.write('data')
+        p = Project('ceph')
+        session.commit()
+        bulk.register_binaries(p, [descriptor(path=str(path))], hash_files=hashed)
+        session.commit()
+        result = bulk.register_binaries(p, [descriptor(path=str(path))], hash_files=hashed)
+        session.commit()
+        assert result == dict(created=0, updated=0, unchanged=1)
+        assert len(hashed.calls) == 1
+
+    def test_updates_changed_binaries(self, session, tmpdir, hashed):
+        p = Project('ceph')
+        session.commit()
+        bulk.register_binaries(p, [on_disk(tmpdir, size=1)], hash_files=hashed)
+        session.commit()
+        result = bulk.register_binaries(p, [on_disk(tmpdir, size=2)], hash_files=hashed)
+        session.commit()
+        assert result == dict(created=0, updated=1, unchanged=0)
+        assert Binary.query.one().size == 2
+        assert BinarySummary.query.one().total_size == 2
+
+    def test_checksums_are_not_taken_from_clients(self, session):
+        p = Project('ceph')
+        session.commit()
+        with pytest.raises(ValueError):
+            bulk.register_binaries(p, [descriptor(checksum='abc123')])
+
+    def test_missing_files_are_rejected(self, session, tmpdir, hashed):
+        p = Project('ceph')
+        session.commit()
+        with pytest.raises(ValueError) as exc:
+            bulk.register_binaries(p, [
+                on_disk(tmpdir),
+                descriptor('ceph-2.0-0.el7.x86_64.rpm', path=str(tmpdir.join('missing.rpm'))),
+            ], hash_files=hashed)
+        assert 'missing.rpm' in str(exc.value)
+        session.commit()
+        assert Binary.query.count() == 0
@@ -0,0 +1,273 @@
+import pytest
+import pecan
+from chacra import cache
+from chacra.models import Binary, Project, Repo
+from chacra.models.repos import acquire_build_lease, release_build_lease
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmpdir):
+    def make_backend(**kw):
+        if request.param == 'sqlite':
+            return cache.SQLiteBackend(str(tmpdir.join('cache.db')), **kw)
+        return cache.MemoryBackend(**kw)
+    return make_backend
+
+
+class TestBackends(object):
+
+    def test_miss(self, backend):
+        assert backend().get('/binaries/') is None
+
+    def test_hit(self, backend):
+        cache_backend = backend()
+        cache_backend.set('/binaries/', ['{}', [['ETag', '"1"']]], 2)
+        assert cache_backend.get('/binaries/') == ['{}', [['ETag', '"1"']]]
+
+    def test_expired_entries_are_misses(self, backend):
+        cache_backend = backend(ttl=-1)
+        cache_backend.set('/binaries/', '{}', 2)
+        assert cache_backend.get('/binaries/') is None
+
+    def test_evicted_by_count(self, backend):
+        cache_backend = backend(max_entries=2)
+        cache_backend.set('/a/', '1', 1)
+        cache_backend.set('/b/', '2', 1)
+        cache_backend.set('/c/', '3', 1)
+        assert cache_backend.get('/a/') is None
+        assert cache_backend.get('/c/') == '3'
+        assert cache_backend.stats()['evictions'] == 1
+
+    def test_evicted_by_size(self, backend):
+        cache_backend = backend(max_bytes=10)
+        cache_backend.set('/a/', '12345', 5)
+        cache_backend.set('/b/', '123456', 6)
+        assert cache_backend.get('/a/') is None
+        assert cache_backend.stats()['bytes'] == 6
+
+    def test_too_large_is_not_cached(self, backend):
+        cache_backend = backend(max_bytes=1)
+        cache_backend.set('/a/', '12', 2)
+        assert cache_backend.stats()['entries'] == 0
+
+    def test_versions_start_at_zero(self, backend):
+        assert backend().versions([1, 'all']) == [0, 0]
+
+    def test_bump_versions(self, backend):
+        cache_backend = backend()
+        cache_backend.bump([1, 'all'])
+        cache_backend.bump([1])
+        assert cache_backend.versions([1, 2, 'all']) == [2, 0, 1]
+
+
+class TestMemoryBackend(object):
+
+    def test_least_recently_used_is_evicted(self):
+        cache_backend = cache.MemoryBackend(max_entries=2)
+        cache_backend.set('/a/', '1', 1)
+        cache_backend.set('/b/', '2', 1)
+        cache_backend.get('/a/')
+        cache_backend.set('/c/', '3', 1)
+        assert cache_backend.get('/b/') is None
+        assert cache_backend.get('/a/') == '1'
+
+
+class TestSQLiteBackend(object):
+
+    def test_shared_between_instances(self, tmpdir):
+        path = str(tmpdir.join('cache.db'))
+        cache.SQLiteBackend(path).set('/a/', '1', 1)
+        assert cache.SQLiteBackend(path).get('/a/') == '1'
+
+    def test_versions_are_shared(self, tmpdir):
+        path = str(tmpdir.join('cache.db'))
+        cache.SQLiteBackend(path).bump([1])
+        assert cache.SQLiteBackend(path).versions([1]) == [1]
+
+
+class BrokenBackend(cache.MemoryBackend):
+
+    def get(self, key):
+        raise IOError('disk is full')
+
+
+class TestResponseCache(object):
+
+    def test_hits_and_misses(self, backend):
+        response_cache = cache.ResponseCache(backend())
+        key = response_cache.key('/binaries/ceph/', 1)
+        assert response_cache.get(key) is None
+        response_cache.set(key, '{}', [('ETag', '"1"')])
+        assert response_cache.get(key) == ('{}', [('ETag', '"1"')])
+        assert (response_cache.hits, response_cache.misses) == (1, 1)
+
+    def test_invalidate_a_project(self, backend):
+        response_cache = cache.ResponseCache(backend())
+        keys = [
+            response_cache.key('/binaries/'),
+            response_cache.key('/binaries/ceph/', 1),
+            response_cache.key('/binaries/radosgw/', 2),
+        ]
+        response_cache.invalidate([1])
+        # listings of every project change too
+        assert response_cache.key('/binaries/') != keys[0]
+        assert response_cache.key('/binaries/ceph/', 1) != keys[1]
+        assert response_cache.key('/binaries/radosgw/', 2) == keys[2]
+
+    def test_shared_invalidation(self, tmpdir):
+        path = str(tmpdir.join('cache.db'))
+        worker_a = cache.ResponseCache(cache.SQLiteBackend(path))
+        worker_b = cache.ResponseCache(cache.SQLiteBackend(path))
+        key = worker_a.key('/binaries/ceph/', 1)
+        worker_a.set(key, '{}')
+        assert worker_b.get(worker_b.key('/binaries/ceph/', 1)) is not None
+        worker_a.invalidate([1])
+        assert worker_b.get(worker_b.key('/binaries/ceph/', 1)) is None
+
+    def test_backend_errors_are_misses(self):
+        response_cache = cache.ResponseCache(BrokenBackend())
+        assert response_cache.get(response_cache.key('/binaries/')) is None
+        assert response_cache.errors == 1
+
+    def test_load_backend_from_a_path(self):
+        assert cache.load_backend('chacra.cache.MemoryBackend') is cache.MemoryBackend
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def enable_cache(request, tmpdir):
+    pecan.conf.cache_ttl = 60
+    pecan.conf.cache_backend = request.param
+    pecan.conf.cache_file = str(tmpdir.join('cache.db'))
+    cache._cache = None
+
+    def teardown():
+        pecan.conf.cache_ttl = None
+        pecan.conf.cache_backend = None
+        pecan.conf.cache_file = None
+        cache._cache = None
+
+    request.addfinalizer(teardown)
+    return cache.get_cache()
+
+
+class TestCachedControllers(object):
+
+    def create_binary(self, name='ceph-1.0.0.rpm', project='ceph'):
+        p = Project.query.filter_by(name=project).first() or Project(project)
+        Binary(name, p, ref='giant', distro='centos', distro_version='el6', arch='x86_64')
+
+    def test_disabled(self, session):
+        cache._cache = None
+        self.create_binary()
+        session.commit()
+        session.app.get('/binaries/ceph/')
+        assert cache.get_cache() is None
+
+    def test_second_request_is_a_hit(self, session, enable_cache):
+        self.create_binary()
+        session.commit()
+        first = session.app.get('/binaries/ceph/giant/')
+        second = session.app.get('/binaries/ceph/giant/')
+        assert first.json == second.json == {'centos': ['el6']}
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert enable_cache.hits == 1
+
+    def test_cached_etag_is_not_modified(self, session, enable_cache):
+        self.create_binary()
+        session.commit()
+        etag = session.app.get('/binaries/ceph/').headers['ETag']
+        result = session.app.get('/binaries/ceph/', headers={'If-None-Match': etag})
+        assert result.status_int == 304
+        assert enable_cache.hits == 1
+
+    def test_new_binaries_invalidate(self, session, enable_cache):
+        self.create_binary()
+        session.commit()
+        session.app.get('/binaries/ceph/giant/centos/')
+        Binary('ceph-1.0.0.deb', Project.get(1), ref='giant', distro='centos', distro_version='el7', arch='x86_64')
+        session.commit()
+        result = session.app.get('/binaries/ceph/giant/centos/')
+        assert sorted(result.json.keys()) == ['el6', 'el7']
+
+    def test_other_projects_stay_cached(self, session, enable_cache):
+        self.create_binary()
+        self.create_binary(project='radosgw')
+        session.commit()
+        session.app.get('/binaries/ceph/')
+        session.app.get('/binaries/radosgw/')
+        self.create_binary('ceph-1.0.1.rpm')
+        session.commit()
+        session.app.get('/binaries/radosgw/')
+        assert enable_cache.hits == 1
+
+    def test_new_projects_invalidate_the_listing(self, session, enable_cache):
+        Project('ceph')
+        session.commit()
+        session.app.get('/binaries/')
+        Project('radosgw')
+        session.commit()
+        result = session.app.get('/binaries/')
+        assert sorted(result.json.keys()) == ['ceph', 'radosgw']
+
+    def test_rollbacks_do_not_invalidate(self, session, enable_cache):
+        self.create_binary()
+        session.commit()
+        session.app.get('/binaries/ceph/')
+        self.create_binary('ceph-1.0.1.rpm')
+        session.flush()
+        session.rollback()
+        session.app.get('/binaries/ceph/')
+        assert enable_cache.hits == 1
+
+    def test_repo_changes_invalidate(self, session, enable_cache):
+        repo = Repo(Project('ceph'), 'giant', 'centos', 'el6')
+        repo.path = 'some_path'
+        session.commit()
+        session.app.get('/repos/ceph/giant/centos/el6/')
+        repo = Repo.get(1)
+        repo.size = 10
+        session.commit()
+        result = session.app.get('/repos/ceph/giant/centos/el6/')
+        assert result.json['size'] == 10
+
+    def test_build_leases_invalidate(self, session, enable_cache):
+        repo = Repo(Project('ceph'), 'giant', 'centos', 'el6')
+        repo.path = 'some_path'
+        repo.needs_update = True
+        session.commit()
+        assert session.app.get('/repos/ceph/giant/centos/el6/').json['needs_update'] is True
+        assert acquire_build_lease(1) is True
+        assert session.app.get('/repos/ceph/giant/centos/el6/').json['needs_update'] is False
+        release_build_lease(1, failed=True)
+        assert session.app.get('/repos/ceph/giant/centos/el6/').json['needs_update'] is True
+
+    def test_flagging_repos_invalidates(self, session, enable_cache):
+        p = Project('ceph')
+        repo = Repo(p, 'giant', 'centos', 'el6')
+        repo.path = 'some_path'
+        repo.type = 'rpm'
+        session.commit()
+        session.Session.execute(Repo.__table__.update().values(needs_update=False))
+        session.commit()
+        assert session.app.get('/repos/ceph/giant/centos/el6/').json['needs_update'] is False
+        # a binary in another project, added to the same repo
+        Binary('ceph-1.0.0.rpm', Project('other'), repo=Repo.get(1), ref='giant',
+               distro='centos', distro_version='el6', arch='x86_64')
+        session.commit()
+        assert session.app.get('/repos/ceph/giant/centos/el6/').json['needs_update'] is True
+
+    def test_errors_are_not_cached(self, session, enable_cache):
+        Project('ceph')
+        session.commit()
+        session.app.get('/binaries/ceph/giant/', expect_errors=True)
+        assert enable_cache.stats()['entries'] == 0
+
+    def test_stats(self, session, enable_cache):
+        Project('ceph')
+        session.commit()
+        session.app.get('/binaries/')
+        session.app.get('/binaries/')
+        stats = session.app.get('/stats/').json['cache']
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['entries'] == 1
@@ -0,0 +1,69 @@
+import hashlib
+from chacra import checksums
+
+
+class TestChecksums(object):
+
+    def test_computes_all_algorithms(self):
+        result = checksums.Checksums()
+        result.update('binary contents')
+        digests = result.hexdigests()
+        assert sorted(digests.keys()) == ['md5', 'sha256', 'sha512']
+
+    def test_selected_algorithms_only(self):
+        result = checksums.Checksums(algorithms=['sha256'])
+        result.update('binary contents')
+        assert result.hexdigests().keys() == ['sha256']
+
+    def test_updates_in_a_pool(self):
+        result = checksums.Checksums(pool=checksums.get_pool())
+        result.update('binary ')
+        result.update('contents')
+        digests = result.hexdigests()
+        assert digests['sha512'] == hashlib.sha512('binary contents').hexdigest()
+        assert digests['md5'] == hashlib.md5('binary contents').hexdigest()
+
+    def test_many_chunks_in_a_pool(self):
+        result = checksums.Checksums(pool=checksums.get_pool())
+        chunks = ['chunk %d ' % i for i in range(200)]
+        for chunk in chunks:
+            result.update(chunk)
+        digests = result.hexdigests()
+        assert digests['sha256'] == hashlib.sha256(''.join(chunks)).hexdigest()
+
+
+class TestFileChecksums(object):
+
+    def test_reads_in_chunks(self, tmpdir):
+        path = str(tmpdir.join('ceph-1.0.rpm'))
+        with open(path, 'w') as f:
+            f.write('binary contents')
+        digests = checksums.file_checksums(path, chunk_size=3)
+        assert digests['sha256'] == hashlib.sha256('binary contents').hexdigest()
+
+    def test_without_a_pool(self, tmpdir):
+        path = str(tmpdir.join('ceph-1.0.rpm'))
+        with open(path, 'w') as f:
+            f.write('binary contents')
+        digests = checksums.file_checksums(path, pool=False)
+        assert digests['sha512'] == hashlib.sha512('binary contents').hexdigest()
+
+
+class TestChecksumFiles(object):
+
+    def test_no_paths(self):
+        assert checksums.checksum_files([]) == {}
+
+    def test_many_files(self, tmpdir):
+        paths = []
+        for i in range(5):
+            path = str(tmpdir.join('ceph-1.%s.rpm' % i))
+            with open(path, 'w') as f:
+                f.write('contents %s' % i)
+            paths.append(path)
+        result = checksums.checksum_files(paths, workers=2)
+        assert result[paths[3]]['md5'] == hashlib.md5('contents 3').hexdigest()
+
+    def test_missing_file_is_none(self, tmpdir):
+        path = str(tmpdir.join('ceph-1.0.rpm'))
+        assert checksums.checksum_files([path]) == {path: None}
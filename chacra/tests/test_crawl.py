@@ -0,0 +1,148 @@
+import json
+import pytest
+from chacra.commands import crawl
+from chacra.models import Project, Binary
+
+
+def rule(**kw):
+    values = dict(
+        project='ceph', ref='master', distro='centos', version='7', arch='x86_64'
+    )
+    values.update(kw)
+    return crawl.Rule(**values)
+
+
+def fake_hash_files(paths):
+    return dict(
+        (path, dict(sha512='sha512', sha256='sha256', md5='md5'))
+        for path in paths
+    )
+
+
+@pytest.fixture
+def tree(tmpdir):
+    for path in [
+        'rpm-hammer/el7/x86_64/ceph-0.94-0.el7.x86_64.rpm',
+        'rpm-hammer/el7/noarch/ceph-deploy-1.5-0.noarch.rpm',
+        'rpm-giant/el7/x86_64/ceph-0.87-0.el7.x86_64.rpm',
+        'debian-hammer/pool/main/c/ceph/ceph_0.94-1trusty_amd64.deb',
+    ]:
+        tmpdir.join(path).write('data', ensure=True)
+    return tmpdir
+
+
+class TestRule(object):
+
+    def test_no_filters(self):
+        assert rule().matches('/repos', '/repos/a/ceph.rpm')
+
+    def test_root(self):
+        r = rule(root='rpm-hammer/el7')
+        assert r.matches('/repos', '/repos/rpm-hammer/el7/x86_64/ceph.rpm')
+        assert not r.matches('/repos', '/repos/rpm-hammer/el70/ceph.rpm')
+
+    def test_absolute_root(self):
+        r = rule(root='/repos/rpm-hammer')
+        assert r.matches('/other', '/repos/rpm-hammer/ceph.rpm')
+
+    def test_has_looks_at_the_relative_path(self):
+        r = rule(has='repos')
+        assert not r.matches('/repos', '/repos/el7/ceph.rpm')
+        assert rule(has='el7').matches('/repos', '/repos/el7/ceph.rpm')
+
+    def test_startswith_and_endswith(self):
+        r = rule(startswith='ceph', endswith='.rpm')
+        assert r.matches('/repos', '/repos/ceph-0.94.rpm')
+        assert not r.matches('/repos', '/repos/ceph-0.94.deb')
+        assert not r.matches('/repos', '/repos/ceph/radosgw-0.94.rpm')
+
+    def test_descriptor(self):
+        assert rule().descriptor('/repos/ceph.rpm') == dict(
+            name='ceph.rpm', ref='master', distro='centos',
+            distro_version='7', arch='x86_64', path='/repos/ceph.rpm',
+        )
+
+
+class TestLoadRules(object):
+
+    def write(self, tmpdir, rules):
+        path = tmpdir.join('rules.json')
+        path.write(json.dumps(rules))
+        return str(path)
+
+    def test_loads_rules(self, tmpdir):
+        path = self.write(tmpdir, [dict(
+            project='ceph', ref='master', distro='centos', version='7',
+            arch='x86_64', endswith='.rpm',
+        )])
+        rules = crawl.load_rules(path)
+        assert len(rules) == 1
+        assert rules[0].endswith == '.rpm'
+
+    def test_missing_keys(self, tmpdir):
+        path = self.write(tmpdir, [dict(project='ceph')])
+        with pytest.raises(ValueError):
+            crawl.load_rules(path)
+
+    def test_invalid_keys(self, tmpdir):
+        path = self.write(tmpdir, [dict(
+            project='ceph', ref='master', distro='centos', version='7',
+            arch='x86_64', matches='.rpm',
+        )])
+        with pytest.raises(ValueError):
+            crawl.load_rules(path)
+
+
+class TestWalk(object):
+
+    def test_finds_every_file(self, tree):
+        found = list(crawl.walk(str(tree)))
+        assert len(found) == 4
+        assert str(tree.join('rpm-giant/el7/x86_64/ceph-0.87-0.el7.x86_64.rpm')) in found
+
+    def test_nested_roots_are_crawled_once(self, tree):
+        roots = crawl.crawl_roots([str(tree), str(tree.join('rpm-hammer'))])
+        assert roots == [str(tree)]
+
+    def test_rules_match_under_nested_roots(self, tree):
+        # 'el7' is relative to the nested path, which is not walked again
+        found = crawl.find_binaries(
+            [str(tree), str(tree.join('rpm-hammer'))], [rule(root='el7')]
+        )
+        assert sorted(d['name'] for d in found['ceph']) == [
+            'ceph-0.94-0.el7.x86_64.rpm', 'ceph-deploy-1.5-0.noarch.rpm'
+        ]
+
+    def test_files_are_found_once_per_rule(self, tree):
+        found = crawl.find_binaries(
+            [str(tree), str(tree.join('rpm-hammer'))], [rule()]
+        )
+        assert len(found['ceph']) == 4
+
+
+class TestCrawl(object):
+
+    def test_registers_matching_binaries(self, session, tree):
+        rules = [
+            rule(root='rpm-hammer/el7', has='x86_64', endswith='.rpm'),
+            rule(project='ceph-deploy', distro='ubuntu', version='trusty',
+                 arch='all', has='c/ceph', endswith='.deb'),
+        ]
+        result = crawl.crawl([str(tree)], rules, hash_files=fake_hash_files)
+        assert result == dict(created=2, updated=0, unchanged=0)
+        assert sorted(b.name for b in Binary.query.all()) == [
+            'ceph-0.94-0.el7.x86_64.rpm', 'ceph_0.94-1trusty_amd64.deb'
+        ]
+        assert Project.query.filter_by(name='ceph-deploy').count() == 1
+
+    def test_commits_in_batches(self, session, tree):
+        result = crawl.crawl(
+            [str(tree)], [rule()], hash_files=fake_hash_files, batch_size=1
+        )
+        assert result['created'] == 4
+        assert Binary.query.count() == 4
+
+    def test_crawling_again_changes_nothing(self, session, tree):
+        crawl.crawl([str(tree)], [rule()], hash_files=fake_hash_files)
+        result = crawl.crawl([str(tree)], [rule()], hash_files=fake_hash_files)
+        assert result == dict(created=0, updated=0, unchanged=4)
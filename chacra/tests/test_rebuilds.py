@@ -0,0 +1,172 @@
+import pytest
+import pecan
+from chacra import rebuilds
+from chacra.models import Binary, Project, Repo
+
+
+class FakeApp(object):
+
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def send_task(self, name, args=None, **kw):
+        if self.fail:
+            raise IOError('broker is down')
+        self.sent.append((name, args, kw))
+
+
+@pytest.fixture
+def fake_app(monkeypatch, request):
+    app = FakeApp()
+    monkeypatch.setattr(rebuilds, '_app', app)
+    monkeypatch.setattr(rebuilds, '_published', {})
+    monkeypatch.setattr(rebuilds, '_failures', {})
+    pecan.conf.broker_url = 'memory://'
+    pecan.conf.quiet_time = 30
+
+    def teardown():
+        pecan.conf.broker_url = None
+        pecan.conf.quiet_time = 0
+        pecan.conf.retry_delay = 60
+
+    request.addfinalizer(teardown)
+    return app
+
+
+class TestPublish(object):
+
+    def test_disabled_without_a_broker(self):
+        pecan.conf.broker_url = None
+        assert rebuilds.publish(1, 'rpm') is False
+
+    def test_sends_the_task_for_the_repo_type(self, fake_app):
+        assert rebuilds.publish(1, 'deb') is True
+        name, args, kw = fake_app.sent[0]
+        assert name == 'async.create_deb_repo'
+        assert args == (1,)
+        assert kw['countdown'] == 30
+
+    def test_unknown_types_are_not_sent(self, fake_app):
+        assert rebuilds.publish(1, 'tar') is False
+        assert fake_app.sent == []
+
+    def test_requests_within_the_quiet_time_are_dropped(self, fake_app):
+        rebuilds.publish(1, 'rpm')
+        rebuilds.publish(1, 'rpm')
+        rebuilds.publish(2, 'rpm')
+        assert [s[1] for s in fake_app.sent] == [(1,), (2,)]
+
+    def test_requests_after_the_quiet_time_are_sent(self, fake_app):
+        pecan.conf.quiet_time = 0
+        rebuilds.publish(1, 'rpm')
+        rebuilds.publish(1, 'rpm')
+        assert len(fake_app.sent) == 2
+
+    def test_broker_failures_are_not_fatal(self, fake_app):
+        fake_app.fail = True
+        assert rebuilds.publish(1, 'rpm') is False
+        fake_app.fail = False
+        # the failed request must not count towards the quiet time
+        assert rebuilds.publish(1, 'rpm') is True
+
+
+class TestRetry(object):
+
+    def countdowns(self, fake_app):
+        return [kw['countdown'] for name, args, kw in fake_app.sent]
+
+    def test_backs_off_after_every_failure(self, fake_app):
+        pecan.conf.retry_delay = 10
+        for _ in range(3):
+            assert rebuilds.retry(1, 'rpm') is True
+        assert self.countdowns(fake_app) == [10, 20, 40]
+
+    def test_backoff_is_capped(self, fake_app, monkeypatch):
+        pecan.conf.retry_delay = 10
+        monkeypatch.setattr(rebuilds, 'max_retry_delay', 15)
+        rebuilds.retry(1, 'rpm')
+        rebuilds.retry(1, 'rpm')
+        assert self.countdowns(fake_app) == [10, 15]
+
+    def test_success_resets_the_backoff(self, fake_app):
+        pecan.conf.retry_delay = 10
+        rebuilds.retry(1, 'rpm')
+        rebuilds.succeeded(1)
+        rebuilds.retry(1, 'rpm')
+        assert self.countdowns(fake_app) == [10, 10]
+
+    def test_disabled(self, fake_app):
+        pecan.conf.retry_delay = None
+        assert rebuilds.retry(1, 'rpm') is False
+        assert fake_app.sent == []
+
+
+class TestRequestedRebuilds(object):
+
+    def setup(self):
+        self.p = Project('ceph')
+
+    def create_binary(self, **kw):
+        return Binary(
+            'ceph-1.0.rpm',
+            self.p,
+            distro='centos',
+            distro_version='7',
+            arch='x86_64',
+            **kw
+        )
+
+    def test_new_binary_publishes_on_commit(self, session, fake_app):
+        self.create_binary()
+        session.flush()
+        assert fake_app.sent == []
+        session.commit()
+        assert fake_app.sent[0][:2] == ('async.create_rpm_repo', (1,))
+
+    def test_rollback_discards_requests(self, session, fake_app):
+        self.create_binary()
+        session.flush()
+        session.rollback()
+        session.commit()
+        assert fake_app.sent == []
+
+    def test_binary_updates_flag_a_clean_repo(self, session, fake_app):
+        binary = self.create_binary()
+        session.commit()
+        repo = Repo.get(1)
+        repo.needs_update = False
+        session.commit()
+        fake_app.sent = []
+        rebuilds._published.clear()
+
+        binary = Binary.get(1)
+        binary.built_by = 'someone'
+        session.commit()
+        assert Repo.get(1).needs_update is True
+        assert len(fake_app.sent) == 1
+
+    def test_flagging_a_repo_publishes_it(self, session, fake_app):
+        self.create_binary()
+        session.commit()
+        repo = Repo.get(1)
+        repo.needs_update = False
+        session.commit()
+        rebuilds._published.clear()
+        fake_app.sent = []
+
+        repo = Repo.get(1)
+        repo.needs_update = True
+        session.commit()
+        assert len(fake_app.sent) == 1
+
+    def test_repo_updates_do_not_publish(self, session, fake_app):
+        self.create_binary()
+        session.commit()
+        rebuilds._published.clear()
+        fake_app.sent = []
+
+        repo = Repo.get(1)
+        repo.needs_update = False
+        session.commit()
+        assert fake_app.sent == []
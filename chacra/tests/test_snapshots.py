@@ -0,0 +1,182 @@
+import os
+import json
+import pytest
+import pecan
+from chacra import snapshots
+from chacra.models import Binary, Project, Repo
+
+
+@pytest.fixture
+def repos_root(request, tmpdir):
+    original = getattr(pecan.conf, 'repos_root', None)
+    pecan.conf.repos_root = str(tmpdir)
+
+    def teardown():
+        pecan.conf.repos_root = original
+
+    request.addfinalizer(teardown)
+    return tmpdir
+
+
+def built_repo(project, ref, distro, distro_version):
+    repo = Repo(project, ref, distro, distro_version)
+    repo.path = '/opt/repos/%s/%s/%s/%s' % (project.name, ref, distro, distro_version)
+    return repo
+
+
+def read_snapshot(*parts):
+    with open(snapshots.snapshot_path(*parts)) as f:
+        return json.load(f)
+
+
+class TestWriteProjectSnapshots(object):
+
+    def create_repos(self, session):
+        p = Project('ceph')
+        built_repo(p, 'firefly', 'ubuntu', 'trusty')
+        built_repo(p, 'firefly', 'centos', '7')
+        built_repo(p, 'hammer', 'ubuntu', 'xenial')
+        # not built yet
+        Repo(p, 'jewel', 'ubuntu', 'xenial')
+        session.commit()
+        return p
+
+    def test_every_listing_is_written(self, session, repos_root):
+        p = self.create_repos(session)
+        snapshots.write_project_snapshots(p)
+        written = sorted(
+            os.path.relpath(os.path.join(d, f), str(repos_root))
+            for d, _, files in os.walk(str(repos_root)) for f in files
+            if f == 'index.json'
+        )
+        assert written == [
+            '.json/repos/ceph/firefly/centos/index.json',
+            '.json/repos/ceph/firefly/index.json',
+            '.json/repos/ceph/firefly/ubuntu/index.json',
+            '.json/repos/ceph/hammer/centos/index.json',
+            '.json/repos/ceph/hammer/index.json',
+            '.json/repos/ceph/hammer/ubuntu/index.json',
+            '.json/repos/ceph/index.json',
+            '.json/repos/index.json',
+        ]
+
+    @pytest.mark.parametrize('url, parts', [
+        ('/repos/', ()),
+        ('/repos/ceph/', ('ceph',)),
+        ('/repos/ceph/firefly/', ('ceph', 'firefly')),
+        ('/repos/ceph/firefly/ubuntu/', ('ceph', 'firefly', 'ubuntu')),
+        ('/repos/ceph/hammer/centos/', ('ceph', 'hammer', 'centos')),
+    ])
+    def test_snapshots_match_the_application(self, session, repos_root, url, parts):
+        p = self.create_repos(session)
+        snapshots.write_project_snapshots(p)
+        snapshot = read_snapshot(*parts)
+        result = session.app.get(url).json
+        if isinstance(result, dict):
+            result = dict((k, sorted(v)) for k, v in result.items())
+            snapshot = dict((k, sorted(v)) for k, v in snapshot.items())
+        else:
+            result, snapshot = sorted(result), sorted(snapshot)
+        assert snapshot == result
+
+    def test_snapshots_are_replaced(self, session, repos_root):
+        p = self.create_repos(session)
+        snapshots.write_project_snapshots(p)
+        built_repo(p, 'hammer', 'ubuntu', 'trusty')
+        session.commit()
+        snapshots.write_project_snapshots(p)
+        assert sorted(read_snapshot('ceph', 'hammer', 'ubuntu')) == [
+            'trusty', 'trusty', 'xenial'
+        ]
+        # no temporary files are left behind
+        project_dir = os.path.dirname(snapshots.snapshot_path('ceph'))
+        assert sorted(os.listdir(project_dir)) == ['firefly', 'hammer', 'index.json']
+
+    def test_stale_refs_and_distros_are_removed(self, session, repos_root):
+        p = self.create_repos(session)
+        snapshots.write_project_snapshots(p)
+        for repo in p.repos.filter_by(ref='hammer').all():
+            repo.delete()
+        Repo.query.filter_by(distro='centos').one().delete()
+        session.commit()
+        snapshots.write_project_snapshots(p)
+        assert sorted(os.listdir(snapshots.snapshot_dir('ceph'))) == ['firefly', 'index.json']
+        assert sorted(os.listdir(snapshots.snapshot_dir('ceph', 'firefly'))) == [
+            'index.json', 'ubuntu'
+        ]
+
+    def test_failures_are_not_fatal(self, session, repos_root, monkeypatch):
+
+        def fail(*a):
+            raise OSError('disk is full')
+
+        monkeypatch.setattr(snapshots.util, 'write_atomically', fail)
+        self.create_repos(session)
+        assert Repo.query.count() == 4
+        assert not os.path.exists(snapshots.snapshot_path())
+
+
+class TestSnapshotsOnCommit(object):
+
+    def test_written_when_repos_are_built(self, session, repos_root):
+        p = Project('ceph')
+        repo = Repo(p, 'firefly', 'ubuntu', 'trusty')
+        session.commit()
+        assert not os.path.exists(snapshots.snapshot_path())
+        repo.path = '/opt/repos/ceph/firefly/ubuntu/trusty'
+        session.commit()
+        assert read_snapshot() == {'ceph': ['firefly']}
+        assert read_snapshot('ceph', 'firefly', 'ubuntu') == ['trusty']
+
+    def test_not_written_for_unrelated_changes(self, session, repos_root):
+        p = Project('ceph')
+        repo = built_repo(p, 'firefly', 'ubuntu', 'trusty')
+        session.commit()
+        os.remove(snapshots.snapshot_path())
+        repo.needs_update = True
+        session.commit()
+        assert not os.path.exists(snapshots.snapshot_path())
+
+    def test_removed_repos_are_removed(self, session, repos_root):
+        p = Project('ceph')
+        built_repo(p, 'firefly', 'ubuntu', 'trusty')
+        built_repo(p, 'hammer', 'ubuntu', 'trusty')
+        session.commit()
+        assert os.path.exists(snapshots.snapshot_path('ceph', 'hammer'))
+        Repo.query.filter_by(ref='hammer').one().delete()
+        session.commit()
+        assert not os.path.exists(snapshots.snapshot_dir('ceph', 'hammer'))
+        assert read_snapshot() == {'ceph': ['firefly']}
+        assert list(read_snapshot('ceph')) == ['firefly']
+
+    def test_removed_projects_are_removed(self, session, repos_root):
+        p = Project('ceph')
+        built_repo(p, 'firefly', 'ubuntu', 'trusty')
+        session.commit()
+        for repo in p.repos.all():
+            repo.delete()
+        p.delete()
+        session.commit()
+        assert not os.path.exists(snapshots.snapshot_dir('ceph'))
+        assert read_snapshot() == {}
+
+    def test_removing_the_last_binary(self, session, repos_root):
+        binary_path = repos_root.join('ceph_1.0_all.deb')
+        binary_path.write('data')
+        p = Project('ceph')
+        repo = built_repo(p, 'firefly', 'ubuntu', 'trusty')
+        Binary('ceph_1.0_all.deb', p, repo=repo, ref='firefly', distro='ubuntu',
+               distro_version='trusty', arch='all', path=str(binary_path))
+        session.commit()
+        assert os.path.exists(snapshots.snapshot_path('ceph'))
+        result = session.app.delete('/binaries/ceph/firefly/ubuntu/trusty/all/ceph_1.0_all.deb/')
+        assert result.status_int == 204
+        assert not os.path.exists(snapshots.snapshot_dir('ceph'))
+        assert read_snapshot() == {}
+
+    def test_nothing_written_on_rollback(self, session, repos_root):
+        p = Project('ceph')
+        built_repo(p, 'firefly', 'ubuntu', 'trusty')
+        session.flush()
+        session.rollback()
+        assert not os.path.exists(snapshots.snapshot_path())
@@ -1,6 +1,9 @@
 import os
+import hashlib
+import time
 import random
 import string
+from StringIO import StringIO
 import pytest
 import pecan
 from chacra import util
@@ -75,6 +78,11 @@ class TestRepoPaths(object):
             'el7'
         )
 
+    def teardown(self):
+        # these objects are never committed, do not leave them pending for
+        # the next test that uses the database
+        models.clear()
+
     def test_relative(self):
         pecan.conf.repos_root = '/tmp/repos'
         result = util.repo_paths(self.repo)
@@ -90,6 +98,11 @@ class TestRepoPaths(object):
         result = util.repo_paths(self.repo)['absolute']
         assert result == '/tmp/repos/ceph-deploy/master/centos/el7'
 
+    def test_cache(self):
+        pecan.conf.repos_root = '/tmp/repos'
+        result = util.repo_paths(self.repo)['cache']
+        assert result == '/tmp/repos/.cache/ceph-deploy/master/centos/el7'
+
 
 class TestMakeDirs(object):
 
@@ -102,6 +115,185 @@ class TestMakeDirs(object):
         assert util.makedirs(path).endswith('/createme')
 
 
+class TestSaveFile(object):
+
+    def test_writes_contents(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+        util.save_file(StringIO('binary contents'), destination)
+        assert open(destination).read() == 'binary contents'
+
+    def test_writes_in_chunks(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+        util.save_file(StringIO('binary contents'), destination, chunk_size=2)
+        assert open(destination).read() == 'binary contents'
+
+    def test_returns_size(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+        size, checksums = util.save_file(StringIO('binary contents'), destination)
+        assert size == 15
+
+    def test_returns_checksum(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+        size, checksums = util.save_file(
+            StringIO('binary contents'), destination, chunk_size=2)
+        assert checksums['sha512'] == hashlib.sha512('binary contents').hexdigest()
+        assert checksums['sha256'] == hashlib.sha256('binary contents').hexdigest()
+        assert checksums['md5'] == hashlib.md5('binary contents').hexdigest()
+
+    def test_overwrites_existing_file(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+        with open(destination, 'w') as f:
+            f.write('old contents')
+        util.save_file(StringIO('new'), destination)
+        assert open(destination).read() == 'new'
+
+    def test_leaves_no_temporary_files(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+        util.save_file(StringIO('binary contents'), destination)
+        assert os.listdir(str(tmpdir)) == ['ceph-1.0.rpm']
+
+    def test_removes_temporary_file_on_failure(self, tmpdir):
+        destination = os.path.join(str(tmpdir), 'ceph-1.0.rpm')
+
+        class BrokenFile(object):
+            def read(self, size):
+                raise IOError('connection reset')
+
+        with pytest.raises(IOError):
+            util.save_file(BrokenFile(), destination)
+        assert os.listdir(str(tmpdir)) == []
+
+
+class TestWriteAtomically(object):
+
+    def test_creates_directories(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'repos', 'index.json')
+        util.write_atomically(path, '{}')
+        assert open(path).read() == '{}'
+
+    def test_replaces_existing_file(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'index.json')
+        util.write_atomically(path, '{}')
+        util.write_atomically(path, '[]')
+        assert open(path).read() == '[]'
+        assert os.listdir(str(tmpdir)) == ['index.json']
+
+    def test_readable_by_everyone(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'index.json')
+        util.write_atomically(path, '{}')
+        assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+class TestLinkRPMs(object):
+
+    def make_binary(self, tmpdir, name):
+        path = str(tmpdir.join(name))
+        with open(path, 'w') as f:
+            f.write('binary contents')
+        return path
+
+    def test_links_are_created(self, tmpdir):
+        source = self.make_binary(tmpdir, 'ceph-1.0.x86_64.rpm')
+        repo_dir = tmpdir.mkdir('x86_64')
+        assert util.link_rpms(str(repo_dir), {'ceph-1.0.x86_64.rpm': source}) is True
+        assert os.readlink(str(repo_dir.join('ceph-1.0.x86_64.rpm'))) == source
+
+    def test_nothing_changes(self, tmpdir):
+        source = self.make_binary(tmpdir, 'ceph-1.0.x86_64.rpm')
+        repo_dir = str(tmpdir.mkdir('x86_64'))
+        util.link_rpms(repo_dir, {'ceph-1.0.x86_64.rpm': source})
+        assert util.link_rpms(repo_dir, {'ceph-1.0.x86_64.rpm': source}) is False
+
+    def test_stale_links_are_removed(self, tmpdir):
+        source = self.make_binary(tmpdir, 'ceph-1.0.x86_64.rpm')
+        repo_dir = str(tmpdir.mkdir('x86_64'))
+        util.link_rpms(repo_dir, {'ceph-1.0.x86_64.rpm': source})
+        assert util.link_rpms(repo_dir, {}) is True
+        assert os.listdir(repo_dir) == []
+
+    def test_regular_files_are_kept(self, tmpdir):
+        repo_dir = tmpdir.mkdir('x86_64')
+        repo_dir.join('ceph-1.0.x86_64.rpm').write('binary contents')
+        assert util.link_rpms(str(repo_dir), {}) is False
+        assert os.listdir(str(repo_dir)) == ['ceph-1.0.x86_64.rpm']
+
+    def test_links_to_other_sources_are_fixed(self, tmpdir):
+        old_source = self.make_binary(tmpdir, 'old.rpm')
+        source = self.make_binary(tmpdir, 'ceph-1.0.x86_64.rpm')
+        repo_dir = tmpdir.mkdir('x86_64')
+        util.link_rpms(str(repo_dir), {'ceph-1.0.x86_64.rpm': old_source})
+        assert util.link_rpms(str(repo_dir), {'ceph-1.0.x86_64.rpm': source}) is True
+        assert os.readlink(str(repo_dir.join('ceph-1.0.x86_64.rpm'))) == source
+
+
+class TestRepodataIsStale(object):
+
+    def setup(self):
+        self.sources = {}
+
+    def make_repo(self, tmpdir, mtime):
+        source = str(tmpdir.join('ceph-1.0.x86_64.rpm'))
+        with open(source, 'w') as f:
+            f.write('binary contents')
+        repo_dir = tmpdir.mkdir('x86_64')
+        self.sources = {'ceph-1.0.x86_64.rpm': source}
+        util.link_rpms(str(repo_dir), self.sources)
+        repomd = repo_dir.mkdir('repodata').join('repomd.xml')
+        repomd.write('<repomd/>')
+        os.utime(str(repomd), (mtime, mtime))
+        return str(repo_dir)
+
+    def test_no_repodata(self, tmpdir):
+        assert util.repodata_is_stale(str(tmpdir), {}) is True
+
+    def test_repodata_is_newer(self, tmpdir):
+        repo_dir = self.make_repo(tmpdir, time.time() + 100)
+        assert util.repodata_is_stale(repo_dir, self.sources) is False
+
+    def test_binary_is_newer(self, tmpdir):
+        repo_dir = self.make_repo(tmpdir, time.time() - 100)
+        assert util.repodata_is_stale(repo_dir, self.sources) is True
+
+
+class TestCreaterepoCommand(object):
+
+    def test_updates_metadata(self):
+        command = util.createrepo_command('/repos/x86_64')
+        assert command == ['createrepo', '--update', '/repos/x86_64']
+
+    def test_uses_cache_dir(self):
+        command = util.createrepo_command('/repos/x86_64', '/cache/x86_64')
+        assert command[-3:] == ['--cachedir', '/cache/x86_64', '/repos/x86_64']
+
+
+class TestRunCommands(object):
+
+    def test_no_commands(self):
+        assert util.run_commands([]) == []
+
+    def test_reports_exit_status(self):
+        results = util.run_commands([['true'], ['false']], workers=2)
+        assert [status for _, status, _ in results] == [0, 1]
+
+    def test_keeps_order(self):
+        commands = [['sleep', '0.2'], ['true']]
+        results = util.run_commands(commands, workers=2)
+        assert [command for command, _, _ in results] == commands
+
+    def test_reports_duration(self):
+        results = util.run_commands([['sleep', '0.1']])
+        assert results[0][2] >= 0.1
+
+    def test_runs_concurrently(self):
+        start = time.time()
+        util.run_commands([['sleep', '0.5']] * 3, workers=3)
+        assert time.time() - start < 1.4
+
+    def test_command_not_found(self):
+        results = util.run_commands([['/does/not/exist']])
+        assert results[0][1] == -1
+
+
 class TestGetExtraRepos(object):
 
     def test_no_repo_config(self):
@@ -262,3 +454,235 @@ class TestRepreproCommand(object):
             )
         command = util.reprepro_command('/path', binary)
         assert command[-3] == 'include'
+
+
+class TestRepreproCommands(object):
+
+    def make_binary(self, name, distro_version='trusty', path=None):
+        return models.Binary(
+            name,
+            None,
+            ref='firefly',
+            distro='ubuntu',
+            distro_version=distro_version,
+            arch='all',
+            path=path or '/binaries/%s' % name,
+            # the paths do not exist, avoid computing checksums for them
+            checksums={'sha512': 'a', 'sha256': 'b', 'md5': 'c'},
+            )
+
+    def test_debs_are_included_in_one_command(self, session):
+        binaries = [
+            self.make_binary('ceph-1.1.deb'),
+            self.make_binary('ceph-common-1.1.deb'),
+        ]
+        commands = util.reprepro_commands('/path', binaries)
+        assert len(commands) == 1
+        command, included = commands[0]
+        assert command[-4:] == [
+            'includedeb', 'trusty',
+            '/binaries/ceph-1.1.deb', '/binaries/ceph-common-1.1.deb'
+        ]
+        assert included == binaries
+
+    def test_debs_are_grouped_by_distro_version(self, session):
+        binaries = [
+            self.make_binary('ceph-1.1.deb'),
+            self.make_binary('ceph-1.1.deb', distro_version='precise'),
+            self.make_binary('ceph-common-1.1.deb'),
+        ]
+        commands = util.reprepro_commands('/path', binaries)
+        versions = [c[c.index('includedeb') + 1] for c, _ in commands]
+        assert versions == ['precise', 'trusty']
+
+    def test_batches_are_limited(self, session):
+        binaries = [self.make_binary('ceph-1.%s.deb' % i) for i in range(5)]
+        commands = util.reprepro_commands('/path', binaries, batch_size=2)
+        assert [len(included) for _, included in commands] == [2, 2, 1]
+
+    def test_dsc_files_get_a_command_each(self, session):
+        binaries = [
+            self.make_binary('ceph-1.1.dsc'),
+            self.make_binary('ceph-1.2.dsc'),
+        ]
+        commands = util.reprepro_commands('/path', binaries)
+        assert len(commands) == 2
+        assert commands[0][0][-3] == 'includedsc'
+
+    def test_unknown_files_are_skipped(self, session):
+        binaries = [self.make_binary('ceph-1.1.tar.gz')]
+        assert util.reprepro_commands('/path', binaries) == []
+
+    def test_binaries_without_path_are_skipped(self, session):
+        binary = self.make_binary('ceph-1.1.deb')
+        binary.path = None
+        assert util.reprepro_commands('/path', [binary]) == []
+
+
+class TestDebPackageName(object):
+
+    def test_deb(self):
+        assert util.deb_package_name('ceph-common_0.94-1trusty_amd64.deb') == 'ceph-common'
+
+    def test_dsc(self):
+        assert util.deb_package_name('ceph_0.94-1trusty.dsc') == 'ceph'
+
+    def test_unknown_convention(self):
+        assert util.deb_package_name('ceph-1.1.deb') is None
+
+
+class TestRepreproRemoveCommands(object):
+
+    def test_packages_are_removed_in_one_command(self):
+        removals = [
+            ('trusty', 'deb', 'ceph'),
+            ('trusty', 'deb', 'ceph-common'),
+        ]
+        commands = util.reprepro_remove_commands('/path', removals)
+        assert len(commands) == 1
+        command, done = commands[0]
+        assert command[-6:] == ['-T', 'deb', 'remove', 'trusty', 'ceph', 'ceph-common']
+        assert done == removals
+
+    def test_sources_only_remove_the_source(self):
+        # removesrc would take out every binary built from the source too
+        removals = [
+            ('trusty', 'dsc', 'ceph'),
+            ('precise', 'dsc', 'ceph'),
+        ]
+        commands = util.reprepro_remove_commands('/path', removals)
+        assert [c[-5:] for c, _ in commands] == [
+            ['-T', 'dsc', 'remove', 'precise', 'ceph'],
+            ['-T', 'dsc', 'remove', 'trusty', 'ceph'],
+        ]
+        assert all('removesrc' not in c for c, _ in commands)
+
+    def test_binaries_and_sources_are_removed_separately(self):
+        removals = [('trusty', 'deb', 'ceph'), ('trusty', 'dsc', 'ceph')]
+        commands = util.reprepro_remove_commands('/path', removals)
+        assert [done for _, done in commands] == [
+            [('trusty', 'deb', 'ceph')], [('trusty', 'dsc', 'ceph')]
+        ]
+
+
+class TestRemainingIncluded(object):
+
+    def make_binary(self, name, checksum):
+        return models.Binary(
+            name, None, ref='firefly', distro='ubuntu', distro_version='trusty',
+            arch='amd64', path='/binaries/%s' % name,
+            checksums={'sha512': checksum, 'sha256': 'b', 'md5': 'c'},
+        )
+
+    def test_only_unchanged_binaries_remain(self, session):
+        ceph = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        common = self.make_binary('ceph-common_1.0_amd64.deb', 'b')
+        included = dict((util.included_key(b), util.included_record(b)) for b in [ceph, common])
+        remaining = util.remaining_included(included, [ceph, common], [ceph])
+        assert list(remaining) == ['trusty/ceph-common_1.0_amd64.deb']
+
+    def test_failed_removals_are_kept(self, session):
+        ceph = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        common = self.make_binary('ceph-common_1.0_amd64.deb', 'b')
+        included = dict((util.included_key(b), util.included_record(b)) for b in [ceph, common])
+        # both were removed from the binaries, but only one removal worked
+        remaining = util.remaining_included(
+            included, [], [], failed_removals=[('trusty', 'deb', 'ceph')]
+        )
+        assert list(remaining) == ['trusty/ceph_1.0_amd64.deb']
+
+
+class TestIncludedRecord(object):
+
+    def test_missing_record(self, tmpdir):
+        assert util.load_included(str(tmpdir.join('included.json'))) == {}
+
+    def test_broken_record(self, tmpdir):
+        path = tmpdir.join('included.json')
+        path.write('{not json')
+        assert util.load_included(str(path)) == {}
+
+    def test_saves_and_loads(self, tmpdir):
+        path = str(tmpdir.join('cache', 'included.json'))
+        included = {'trusty/ceph_1.0_amd64.deb': {'checksum': 'a'}}
+        util.save_included(path, included)
+        assert util.load_included(path) == included
+
+
+class TestDiffIncluded(object):
+
+    def make_binary(self, name, checksum, distro_version='trusty'):
+        return models.Binary(
+            name,
+            None,
+            ref='firefly',
+            distro='ubuntu',
+            distro_version=distro_version,
+            arch='amd64',
+            path='/binaries/%s' % name,
+            checksums={'sha512': checksum, 'sha256': 'b', 'md5': 'c'},
+            )
+
+    def included(self, *binaries):
+        return dict(
+            (util.included_key(b), util.included_record(b)) for b in binaries
+        )
+
+    def test_nothing_was_included(self, session):
+        binary = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        removals, to_include = util.diff_included({}, [binary])
+        assert removals == []
+        assert to_include == [binary]
+
+    def test_nothing_changed(self, session):
+        binary = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        included = self.included(binary)
+        assert util.diff_included(included, [binary]) == ([], [])
+
+    def test_new_binary(self, session):
+        binary = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        new_binary = self.make_binary('ceph-common_1.0_amd64.deb', 'b')
+        included = self.included(binary)
+        removals, to_include = util.diff_included(included, [binary, new_binary])
+        assert removals == []
+        assert to_include == [new_binary]
+
+    def test_removed_binary(self, session):
+        binary = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        included = self.included(binary)
+        removals, to_include = util.diff_included(included, [])
+        assert removals == [('trusty', 'deb', 'ceph')]
+        assert to_include == []
+
+    def test_changed_binary_is_removed_and_included(self, session):
+        binary = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        included = self.included(binary)
+        binary.checksum = 'changed'
+        removals, to_include = util.diff_included(included, [binary])
+        assert removals == [('trusty', 'deb', 'ceph')]
+        assert to_include == [binary]
+
+    def test_other_archs_of_removed_package_are_included(self, session):
+        amd64 = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        i386 = self.make_binary('ceph_1.0_i386.deb', 'b')
+        included = self.included(amd64, i386)
+        removals, to_include = util.diff_included(included, [i386])
+        assert removals == [('trusty', 'deb', 'ceph')]
+        assert to_include == [i386]
+
+    def test_changed_source_keeps_the_binaries_built_from_it(self, session):
+        dsc = self.make_binary('ceph_1.0.dsc', 'a')
+        ceph = self.make_binary('ceph_1.0_amd64.deb', 'b')
+        common = self.make_binary('ceph-common_1.0_amd64.deb', 'c')
+        included = self.included(dsc, ceph, common)
+        dsc.checksum = 'changed'
+        removals, to_include = util.diff_included(included, [dsc, ceph, common])
+        assert removals == [('trusty', 'dsc', 'ceph')]
+        assert to_include == [dsc]
+
+    def test_binaries_without_checksum_are_always_included(self, session):
+        binary = self.make_binary('ceph_1.0_amd64.deb', 'a')
+        included = self.included(binary)
+        binary.checksum = None
+        removals, to_include = util.diff_included(included, [binary])
+        assert to_include == [binary]
@@ -0,0 +1,92 @@
+import pytest
+from chacra import versions
+
+
+def sort_debian(*values):
+    return sorted(values, key=versions.debian_version_key)
+
+
+def sort_rpm(*values):
+    return sorted(values, key=lambda v: versions.rpm_version_key(*v.split('-')))
+
+
+class TestDebianVersionKey(object):
+
+    @pytest.mark.parametrize('older, newer', [
+        ('1.0', '1.1'),
+        ('1.9', '1.10'),
+        ('1.0~rc1', '1.0'),
+        ('1.0~rc1', '1.0~rc2'),
+        ('1.0~~', '1.0~'),
+        ('1.0', '1.0a'),
+        ('1.0', '1.0.1'),
+        ('1.0a', '1.0+'),
+        ('1.0-1', '1.0-2'),
+        ('1.0-9', '1.0-10'),
+        ('1.0-1trusty', '1.0.1-0'),
+        ('0.94.5-1trusty', '0.94.10-1trusty'),
+        ('9:1.0', '10:0.1'),
+        ('2.0', '1:1.0'),
+        ('1.01', '1.2'),
+    ])
+    def test_ordering(self, older, newer):
+        assert versions.debian_version_key(older) < versions.debian_version_key(newer)
+
+    def test_leading_zeros_are_ignored(self):
+        assert versions.debian_version_key('1.01') == versions.debian_version_key('1.1')
+
+    def test_sorts_many(self):
+        assert sort_debian('1.10', '1.0~rc1', '1.2', '1.0') == [
+            '1.0~rc1', '1.0', '1.2', '1.10'
+        ]
+
+
+class TestRpmVersionKey(object):
+
+    @pytest.mark.parametrize('older, newer', [
+        ('1.0-1', '1.1-1'),
+        ('1.9-1', '1.10-1'),
+        ('1.0~rc1-1', '1.0-1'),
+        ('1.0-1', '1.0-1.el7'),
+        ('1.0-1.el7', '1.0-2.el7'),
+        ('1.0a-1', '1.0.1-1'),
+        ('1.0-1', '1.0.1-1'),
+        ('9.0.0-0.el6', '9.0.2-0.el6'),
+    ])
+    def test_ordering(self, older, newer):
+        assert versions.rpm_version_key(*older.split('-')) < versions.rpm_version_key(*newer.split('-'))
+
+    def test_separators_do_not_matter(self):
+        assert versions.rpm_version_key('1.0', '1') == versions.rpm_version_key('1_0', '1')
+
+    def test_sorts_many(self):
+        assert sort_rpm('1.10-1', '1.0~rc1-1', '1.2-1', '1.0-1') == [
+            '1.0~rc1-1', '1.0-1', '1.2-1', '1.10-1'
+        ]
+
+
+class TestPackageVersion(object):
+
+    def test_deb(self):
+        name, key = versions.package_version('ceph_0.94.5-1trusty_amd64.deb')
+        assert name == 'ceph'
+        assert key == versions.debian_version_key('0.94.5-1trusty')
+
+    def test_dsc(self):
+        name, key = versions.package_version('ceph_0.94.5-1trusty.dsc')
+        assert name == 'ceph'
+        assert key == versions.debian_version_key('0.94.5-1trusty')
+
+    def test_rpm(self):
+        name, key = versions.package_version('ceph-deploy-1.5.28-0.noarch.rpm')
+        assert name == 'ceph-deploy'
+        assert key == versions.rpm_version_key('1.5.28', '0')
+
+    @pytest.mark.parametrize('filename', [
+        'ceph-1.0.rpm',
+        'ceph.deb',
+        'ceph_1.0.orig.tar.gz',
+        'README',
+    ])
+    def test_unknown_names(self, filename):
+        assert versions.package_version(filename) == (None, None)
@@ -1,8 +1,14 @@
 import os
+import json
+import time
 import errno
 import logging
+import tempfile
+import subprocess
+from multiprocessing.pool import ThreadPool
 from pecan import conf
 from chacra import models
+from chacra import checksums
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +58,12 @@ def repo_paths(repo):
 
     paths['absolute'] = os.path.join(paths['root'], paths['relative'])
 
+    # e.g. /opt/repos/.cache/ceph-deploy/master/ubuntu/trusty
+    # kept outside of the repository so that it survives a 'recreate'
+    paths['cache'] = os.path.join(
+        conf.repos_root, '.cache', repo.project.name, paths['relative']
+    )
+
     return paths
 
 
@@ -154,21 +166,194 @@ def makedirs(path):
             raise
 
 
-def reprepro_command(repository_path, binary):
+def save_file(file_obj, destination, chunk_size=checksums.CHUNK_SIZE):
     """
-    Depending on the filetype we are dealin the reprepro command will need to
-    change to accommodate for its inclusion in a DEB repository. This is
-    specifically meant to handle both .dsc and .changes files which need to be
-    treaded differently.
+    Copy the contents of ``file_obj`` into ``destination`` without ever
+    holding the whole binary in memory. Data is read in ``chunk_size`` pieces
+    and written to a temporary file in the same directory as ``destination``,
+    which is fsync'd and then renamed into place. The rename is atomic, so
+    a reader (or a concurrent upload) never sees a partially written binary.
+
+    All the checksums are computed while the chunks go by, so that callers
+    do not need to read the file again from disk.
+
+    Returns a tuple with the number of bytes written and a dictionary of
+    checksums, keyed by algorithm.
     """
-    include_flags = {
-        'deb': 'includedeb',
-        'dsc': 'includedsc',
-        'changes': 'include',
-    }
-    # It is OK to fail so that the KeyError can be catched and properly ignored
-    # when adding such an unknown file to the repo
-    include_flag = include_flags[binary.extension]
+    dir_path = os.path.dirname(destination)
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.%s.' % os.path.basename(destination),
+        dir=dir_path,
+    )
+    size = 0
+    file_checksums = checksums.Checksums(pool=checksums.get_pool())
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+                f.write(chunk)
+                file_checksums.update(chunk)
+                size += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates files that only the owner can read, but binaries
+        # need to be readable by the web server as well
+        os.chmod(temp_path, 0o644)
+        os.rename(temp_path, destination)
+    except Exception:
+        logger.exception('could not save file to %s', destination)
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return size, file_checksums.hexdigests()
+
+
+def write_atomically(path, contents):
+    """
+    Replace the file at ``path`` with ``contents`` so that readers either see
+    the old file or the new one, never a partially written one. The file is
+    written next to ``path`` with a unique name and renamed into place, so
+    concurrent writers do not step on each other either.
+    """
+    makedirs(os.path.dirname(path))
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.%s.' % os.path.basename(path),
+        dir=os.path.dirname(path),
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contents)
+        # readable by the web server too
+        os.chmod(temp_path, 0o644)
+        os.rename(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def link_rpms(directory, sources):
+    """
+    Make ``directory`` contain exactly one symlink per RPM in ``sources``,
+    a mapping of file names to the path of the binary they should point to.
+    Links that point somewhere else are fixed, and links for binaries that
+    are no longer part of the repository are removed (regular files are
+    never touched).
+
+    Returns True if anything in the directory changed, so that callers know
+    the repository metadata needs to be updated.
+    """
+    changed = False
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in sources or not os.path.islink(path):
+            continue
+        if not name.endswith('.rpm'):
+            continue
+        logger.info('removing stale link: %s', path)
+        os.remove(path)
+        changed = True
+
+    for name, source in sources.items():
+        destination = os.path.join(directory, name)
+        if os.path.islink(destination):
+            if os.readlink(destination) == source:
+                continue
+            os.remove(destination)
+        elif os.path.exists(destination):
+            # not a link, do not overwrite it
+            continue
+        try:
+            os.symlink(source, destination)
+            changed = True
+        except OSError:
+            logger.exception('could not symlink')
+    return changed
+
+
+def repodata_is_stale(directory, sources):
+    """
+    Determine if the metadata of an RPM repository is older than any of the
+    binaries (e.g. one was overwritten using the same name), or missing.
+    ``sources`` is the same mapping used for ``link_rpms``.
+    """
+    repomd = os.path.join(directory, 'repodata', 'repomd.xml')
+    try:
+        generated = os.stat(repomd).st_mtime
+    except OSError:
+        return True
+    for name, source in sources.items():
+        try:
+            # both the link (added after the last run) and the binary it
+            # points to (overwritten after the last run) are checked
+            link = os.lstat(os.path.join(directory, name))
+            if max(link.st_mtime, os.stat(source).st_mtime) > generated:
+                return True
+        except OSError:
+            # a missing binary will get reported by createrepo
+            return True
+    return False
+
+
+def createrepo_command(directory, cache_dir=None):
+    """
+    Update the metadata of the RPM repository in ``directory``. With
+    ``--update`` createrepo reuses the existing metadata for packages that
+    did not change, so only new or modified RPMs get their headers read, and
+    ``--cachedir`` keeps their checksums around between runs.
+    """
+    command = ['createrepo', '--update']
+    if cache_dir:
+        command.extend(['--cachedir', cache_dir])
+    command.append(directory)
+    return command
+
+
+def run_commands(commands, workers=1):
+    """
+    Run every command in ``commands`` as a subprocess, at most ``workers`` of
+    them at the same time. All commands are allowed to finish even if some
+    fail.
+
+    Returns a list with a ``(command, exit_status, duration)`` tuple for each
+    command, in the same order they were given.
+    """
+    def run(command):
+        logger.info('running command: %s', ' '.join(command))
+        start = time.time()
+        try:
+            exit_status = subprocess.call(command)
+        except OSError:
+            logger.exception('could not run command: %s', ' '.join(command))
+            exit_status = -1
+        duration = time.time() - start
+        logger.info(
+            'command exited with status %s after %.2f seconds: %s',
+            exit_status, duration, ' '.join(command)
+        )
+        return command, exit_status, duration
+
+    if not commands:
+        return []
+    pool = ThreadPool(max(1, min(workers, len(commands))))
+    try:
+        return pool.map(run, commands)
+    finally:
+        pool.close()
+        pool.join()
+
+
+reprepro_include_flags = {
+    'deb': 'includedeb',
+    'dsc': 'includedsc',
+    'changes': 'include',
+}
+
+
+def _reprepro_base(repository_path):
     return [
         'reprepro',
         '--confdir', '/etc',
@@ -177,6 +362,211 @@ def reprepro_command(repository_path, binary):
         '--ignore=wrongdistribution',
         '--ignore=wrongversion',
         '--ignore=undefinedtarget',
+    ]
+
+
+def reprepro_command(repository_path, binary):
+    """
+    Depending on the filetype we are dealin the reprepro command will need to
+    change to accommodate for its inclusion in a DEB repository. This is
+    specifically meant to handle both .dsc and .changes files which need to be
+    treaded differently.
+    """
+    # It is OK to fail so that the KeyError can be catched and properly ignored
+    # when adding such an unknown file to the repo
+    include_flag = reprepro_include_flags[binary.extension]
+    return _reprepro_base(repository_path) + [
         include_flag, binary.distro_version,
         binary.path
     ]
+
+
+def reprepro_commands(repository_path, binaries, batch_size=500):
+    """
+    Every reprepro process opens and locks the repository database, so
+    including binaries one at a time is very slow. ``includedeb`` accepts any
+    number of .deb files, so those are grouped by distro version into as few
+    commands as possible (at most ``batch_size`` files each, to stay well
+    within argument length limits). ``includedsc`` and ``include`` only take
+    a single file, so .dsc and .changes files still get a command each.
+
+    Binaries with unknown extensions, or without a path, are skipped.
+
+    Returns a list of ``(command, binaries)`` tuples, where ``binaries`` are
+    the ones included by that command.
+    """
+    groups = {}
+    singles = []
+    for binary in binaries:
+        include_flag = reprepro_include_flags.get(binary.extension)
+        if include_flag is None or not binary.path:
+            continue
+        if include_flag == 'includedeb':
+            groups.setdefault(binary.distro_version, []).append(binary)
+        else:
+            singles.append(binary)
+
+    commands = []
+    for distro_version in sorted(groups):
+        group = groups[distro_version]
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            command = _reprepro_base(repository_path) + [
+                'includedeb', distro_version
+            ] + [b.path for b in batch]
+            commands.append((command, batch))
+
+    for binary in singles:
+        commands.append((reprepro_command(repository_path, binary), [binary]))
+    return commands
+
+
+def reprepro_remove_commands(repository_path, removals):
+    """
+    Produce the commands to take packages out of a DEB repository.
+    ``removals`` is a list of ``(distro_version, extension, package)``
+    tuples, packages of the same type and distro version are removed with
+    a single ``remove`` call.
+
+    Every command is limited to the package type being removed (``-T``):
+    otherwise removing a source would also take out every binary built
+    from it (that is what ``removesrc`` does), and removing a binary would
+    take out a source with the same name.
+
+    Returns a list of ``(command, removals)`` tuples, where ``removals`` are
+    the ones done by that command.
+    """
+    groups = {}
+    for removal in removals:
+        distro_version, extension, package = removal
+        if extension in ('deb', 'dsc'):
+            groups.setdefault((distro_version, extension), set()).add(removal)
+
+    commands = []
+    for distro_version, extension in sorted(groups):
+        group = sorted(groups[(distro_version, extension)])
+        command = _reprepro_base(repository_path) + [
+            '-T', extension, 'remove', distro_version
+        ] + [package for _, _, package in group]
+        commands.append((command, group))
+    return commands
+
+
+def deb_package_name(filename):
+    """
+    DEB files are named ``{package}_{version}_{arch}.deb`` and source
+    descriptions ``{package}_{version}.dsc``, reprepro needs the package part
+    to remove them. Returns None for names that do not follow the convention.
+    """
+    parts = filename.split('_')
+    if len(parts) < 2 or not parts[0]:
+        return None
+    return parts[0]
+
+
+def included_key(binary):
+    return '%s/%s' % (binary.distro_version, binary.name)
+
+
+def load_included(path):
+    """
+    Read the record of what binaries were included in a DEB repository the
+    last time it was built. A missing or broken record means nothing can be
+    assumed to be in the repository.
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_included(path, included):
+    """
+    Atomically write the record of included binaries to ``path``
+    """
+    makedirs(os.path.dirname(path))
+    temp_path = '%s.tmp' % path
+    with open(temp_path, 'w') as f:
+        json.dump(included, f)
+    os.rename(temp_path, path)
+
+
+def diff_included(included, binaries):
+    """
+    Compare what was ``included`` in a DEB repository the last time it was
+    built (as returned by ``load_included``) with the ``binaries`` that
+    should be in it now, using checksums to detect changes.
+
+    Returns a tuple with a list of ``(distro_version, extension, package)``
+    removals and a list of binaries that need to be included. Binaries that
+    changed are removed and included again, since reprepro refuses to include
+    a file that differs from the one it already has. Because removing
+    a package takes every architecture out, unchanged binaries of the same
+    type that share a package name with a removed one are included again as
+    well.
+    """
+    current = {}
+    for binary in binaries:
+        current.setdefault(included_key(binary), binary)
+
+    removals = set()
+    for key, record in included.items():
+        binary = current.get(key)
+        if binary is not None and binary.checksum and binary.checksum == record['checksum']:
+            continue
+        if record.get('package') is None:
+            # there is no way to tell reprepro what to remove
+            continue
+        removals.add(included_removal(key, record))
+
+    removed_packages = set(removals)
+    to_include = []
+    for key, binary in current.items():
+        record = included.get(key)
+        unchanged = (
+            record is not None and
+            binary.checksum and
+            binary.checksum == record['checksum']
+        )
+        package = (binary.distro_version, binary.extension, deb_package_name(binary.name))
+        if unchanged and package not in removed_packages:
+            continue
+        to_include.append(binary)
+    return sorted(removals), to_include
+
+
+def remaining_included(included, binaries, to_include, failed_removals=()):
+    """
+    What is left of the ``included`` record once the removals found by
+    ``diff_included`` are done, before ``to_include`` goes in: only the
+    ``binaries`` that did not change. Records for ``failed_removals`` are
+    kept, since those packages are still in the repository, so that the next
+    build tries to remove them again.
+    """
+    current_keys = set(included_key(b) for b in binaries)
+    unchanged_keys = current_keys - set(included_key(b) for b in to_include)
+    failed_removals = set(failed_removals)
+    remaining = {}
+    for key, record in included.items():
+        if key in unchanged_keys:
+            remaining[key] = record
+        elif record.get('package') and included_removal(key, record) in failed_removals:
+            remaining[key] = record
+    return remaining
+
+
+def included_removal(key, record):
+    """
+    The ``(distro_version, extension, package)`` removal that takes the
+    binary included at ``key`` out of the repository
+    """
+    return (key.split('/')[0], record['extension'], record['package'])
+
+
+def included_record(binary):
+    return dict(
+        checksum=binary.checksum,
+        extension=binary.extension,
+        package=deb_package_name(binary.name),
+    )
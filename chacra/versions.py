@@ -0,0 +1,123 @@
+"""
+Package names and versions from binary file names, turned into keys that
+sort like the versions they come from when compared as plain strings, so
+that the database can order binaries by version.
+
+Debian versions follow the ``dpkg --compare-versions`` rules and RPM versions
+the ``rpmvercmp`` ones. Epochs are not part of file names, so they are not
+taken into account.
+"""
+import re
+
+
+def _debian_non_digits(part):
+    # dpkg sorts '~' before anything (even the end of the part), then
+    # letters, then everything else. Every character takes three digits,
+    # and '001' marks the end of the part
+    codes = []
+    for char in part:
+        if char == '~':
+            codes.append(0)
+        elif char.isalpha():
+            codes.append(ord(char) + 2)
+        else:
+            codes.append(ord(char) + 258)
+    codes.append(1)
+    return ''.join('%03d' % code for code in codes)
+
+
+def _digits(part):
+    # numbers sort by their length first, so that '10' comes after '9'
+    number = str(int(part or 0))
+    return '%02d%s' % (len(number), number)
+
+
+def _debian_part_key(version):
+    key = []
+    for non_digits, digits in re.findall(r'([^0-9]*)([0-9]*)', version):
+        if not non_digits and not digits:
+            continue
+        key.append(_debian_non_digits(non_digits))
+        key.append(_digits(digits))
+    # the end of the version sorts after '~' but before anything else
+    key.append(_debian_non_digits(''))
+    return ''.join(key)
+
+
+def debian_version_key(version):
+    """
+    A string key for a Debian ``[epoch:]upstream[-revision]`` version
+    """
+    epoch, _, version = version.rpartition(':')
+    if '-' in version:
+        upstream, _, revision = version.rpartition('-')
+    else:
+        upstream, revision = version, ''
+    return _digits(epoch) + _debian_part_key(upstream) + _debian_part_key(revision)
+
+
+def _rpm_part_key(version):
+    # segments are runs of letters or digits, anything else separates them.
+    # '~' sorts before everything, including the end of the version, and
+    # numbers sort after letters
+    key = []
+    for segment in re.findall(r'~|[a-zA-Z]+|[0-9]+', version):
+        if segment == '~':
+            key.append('0')
+        elif segment.isdigit():
+            key.append('3' + _digits(segment))
+        else:
+            key.append('2' + segment + '.')
+    key.append('1')
+    return ''.join(key)
+
+
+def rpm_version_key(version, release=''):
+    """
+    A string key for an RPM version and release
+    """
+    return _rpm_part_key(version) + _rpm_part_key(release)
+
+
+def parse_debian(filename):
+    """
+    Split ``name_version[_arch].(deb|dsc|changes)`` into the package name and
+    its version, or return None if it does not follow that convention
+    """
+    parts = filename.rsplit('.', 1)[0].split('_')
+    if len(parts) not in (2, 3) or not all(parts[:2]):
+        return None
+    return parts[0], parts[1]
+
+
+def parse_rpm(filename):
+    """
+    Split ``name-version-release.arch.rpm`` into the package name, version
+    and release, or return None if it does not follow that convention
+    """
+    parts = filename.rsplit('.', 2)
+    if len(parts) != 3:
+        return None
+    parts = parts[0].rsplit('-', 2)
+    if len(parts) != 3 or not all(parts):
+        return None
+    return tuple(parts)
+
+
+def package_version(filename):
+    """
+    Return the package name and a sortable version key for a binary file
+    name, or ``(None, None)`` if they cannot be told from it
+    """
+    extension = filename.rsplit('.', 1)[-1]
+    if extension in ('deb', 'dsc', 'changes'):
+        parsed = parse_debian(filename)
+        if parsed:
+            name, version = parsed
+            return name, debian_version_key(version)
+    elif extension == 'rpm':
+        parsed = parse_rpm(filename)
+        if parsed:
+            name, version, release = parsed
+            return name, rpm_version_key(version, release)
+    return None, None
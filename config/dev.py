@@ -71,15 +71,56 @@ repos_root = '%(confdir)s/repos'
 # instead of Pecan.
 delegate_downloads = False
 
+# Listings like /search/ return at most this many items per request, clients
+# can page through the rest following the X-Next-Cursor response header
+page_size = 1000
+
+# Discovery listings (/binaries/ and /repos/) are cached for this many
+# seconds, unless something changes before that. Set it to None to disable
+# caching. The cache holds at most cache_max_entries responses, and
+# cache_max_bytes bytes, dropping the least recently used (or oldest) ones
+cache_ttl = 60
+cache_max_entries = 1000
+cache_max_bytes = 64 * 1024 * 1024
+
+# Where cached responses are kept: 'memory' gives every worker a cache of its
+# own, 'sqlite' shares a single cache (in cache_file) between all the workers
+# of the host so that they all see changes at the same time
+cache_backend = 'memory'
+cache_file = '%(confdir)s/cache.db'
+
 # Basic HTTP Auth credentials
 api_user = 'admin'
 api_key = 'secret'
 
 # Celery options
+# Where rebuild requests are published to as soon as a repo needs to be
+# created or updated
+broker_url = 'amqp://guest@localhost//'
+
 # How often (in seconds) the database should be queried for repos that need to
-# be rebuilt
-polling_cycle = 15
+# be rebuilt. Rebuilds are already published when repos change (and failed
+# builds are retried), so this is only a safety net for requests that could not
+# be published. It is also the only way to rebuild repos whose build lease was
+# left behind by a worker that went away. Set it to None to disable polling
+# altogether
+polling_cycle = 600
 
 # Once a "create repo" task is called, how many seconds (if any) to wait before actually
-# creating the repository
+# creating the repository. Further rebuild requests for the same repository
+# within this window are dropped
 quiet_time = 30
+
+# Only one worker at a time can build a given repository. If a build has been
+# running for longer than this (in seconds) the worker is assumed to be gone
+# and another one can take over
+build_lease_timeout = 3600
+
+# How many seconds to wait before retrying a failed build. The wait doubles
+# after every consecutive failure of the same repository, up to an hour. Set it
+# to None to only retry failed builds when polling
+retry_delay = 60
+
+# How many createrepo processes (one per arch directory) can run at the same
+# time when building an RPM repository
+createrepo_workers = 3
@@ -18,6 +18,7 @@ setup(
         "sqlalchemy",
         "psycopg2",
         "pecan-notario",
+        'scandir; python_version < "3"',
     ],
     test_suite='chacra',
     zip_safe=False,
@@ -37,6 +38,7 @@ setup(
     entry_points="""
         [pecan.command]
         populate=chacra.commands.populate:PopulateCommand
+        crawl=chacra.commands.crawl:CrawlCommand
         """
 
 )